@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from movie_store import gather_csr
+from sketches import group_argmax
+
+#------------CHART AGGREGATES-----------------------------------------------------
+# Genre/provider counts and per-provider top films computed straight from the store's
+# integer codes (bincount / per-group maximum), with no explode or Python extend loops. The app
+# caches the results and the chart figures per data version and time window.
+
+
+# Count how many of the given rows carry each code, as a [label, count] table sorted
+# like value_counts (highest first, codes with no films left out)
+def code_counts(offsets, codes, names, rows, label):
+    row_codes, _ = gather_csr(offsets, codes, np.asarray(rows, dtype=np.int64))
+    counts = np.bincount(row_codes, minlength=len(names))
+    present = np.flatnonzero(counts)
+    order = present[np.argsort(-counts[present], kind='stable')]
+    return pd.DataFrame({label: names[order], 'count': counts[order]})
+
+
+def genre_counts(store, rows):
+    return code_counts(store.genre_offsets, store.genre_codes, store.genre_names, rows, 'genre')
+
+
+def provider_counts(store, rows):
+    return code_counts(store.provider_offsets, store.provider_codes, store.provider_names, rows, 'provider')
+
+
+# Most voted film per provider among the given rows, as a [provider, row] table
+def top_film_per_provider(store, rows):
+    rows = np.asarray(rows, dtype=np.int64)
+    row_codes, lengths = gather_csr(store.provider_offsets, store.provider_codes, rows)
+    film_rows = np.repeat(rows, lengths)
+    # Ties keep the earliest row like idxmax
+    codes, top_rows = group_argmax(row_codes, store.vote_count[film_rows], film_rows, len(store.provider_names))
+    return pd.DataFrame({'provider': store.provider_names[codes], 'row': top_rows})
@@ -0,0 +1,364 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+
+import shared_store
+from movie_store import gather_csr
+from query_engine import INDEX_BUILDERS, SORT_KEYS, TOP_FILMS, TREND_WINDOWS, QueryEngine
+
+#------------HEADLESS JSON API---------------------------------------------------
+# Usage: python api.py --csv movies.csv | --shared [root] | --dsn <postgres dsn> [--port 8000]
+# Serves the same queries as the Streamlit pages (query_engine.py) as JSON over an async
+# HTTP server, for other clients and for load that should not go through a browser
+# session. Every answer depends only on the data version, the day and the request, so
+# responses are kept in an LRU keyed by those and carry an ETag derived from the same key:
+# a repeated query is a dictionary lookup, and a client that sends If-None-Match gets a
+# 304 without the query running at all. A cache miss is computed on a worker thread, so
+# one slow query never holds up the event loop. The data source is watched in the
+# background; a new version gets its engine and indexes built before it replaces the
+# old one, and its responses then get new keys, so nothing stale is ever served.
+
+logger = logging.getLogger(__name__)
+
+# Responses kept per process (least recently used go first)
+RESPONSE_CACHE_ENTRIES = 4096
+
+# Largest page of /films
+MAX_PAGE_SIZE = 100
+
+# Seconds between checks of the data source for a new version
+WATCH_INTERVAL = 5
+
+# Clients may keep responses but must revalidate them with the ETag
+CACHE_CONTROL = 'public, no-cache'
+
+
+# Raised for a malformed request, answered with 400
+class BadRequest(ValueError):
+    pass
+
+
+#------------Data source------------------------------------------------------
+
+# Current query engine of a data source. `current_version()` is cheap and tells when the
+# data changed, `load(version)` builds the engine of that version; a background thread
+# swaps the new engine in once its indexes are built.
+class EngineSource:
+
+    def __init__(self, current_version, load, interval=WATCH_INTERVAL):
+        self.current_version = current_version
+        self.load = load
+        self.interval = interval
+        self.engine = self._warm(load(current_version()))
+
+    # Build every index up front, so no request of a new version pays for it
+    def _warm(self, engine):
+        for name in INDEX_BUILDERS:
+            engine.index(name)
+        return engine
+
+    def start(self):
+        threading.Thread(target=self._watch, name='api-watch', daemon=True).start()
+        return self
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                version = self.current_version()
+                if version is not None and version != self.engine.version:
+                    self.engine = self._warm(self.load(version))
+                    logger.info("Serving data version %s", version)
+            except Exception as e:
+                logger.warning("Data version check failed: %s", e)
+
+
+# Engine over the movies.csv export (parsed columns saved next to it)
+def csv_source(path):
+    from snapshot import load_csv_store
+    store = load_csv_store(path, f"{os.path.splitext(path)[0]}_snapshot")
+    return EngineSource(lambda: store.version, lambda version: QueryEngine(store))
+
+
+# Engine over the data the loader process publishes (shared_store.py); indexes are
+# memory-mapped from the published version
+def shared_source(root):
+    if shared_store.current_version(root) is None:
+        raise SystemExit(f"No movies have been published to {root} yet (run shared_store.py).")
+
+    def load(version):
+        def build(name, store):
+            index = shared_store.load_index(root, version, name)
+            return INDEX_BUILDERS[name](store) if index is None else index
+        return QueryEngine(shared_store.attach(root, version), build=build)
+
+    return EngineSource(lambda: shared_store.current_version(root), load)
+
+
+# Engine over the movies table, kept up to date by the same background sync as the app
+def database_source(dsn, interval=900, ttl=86400):
+    import psycopg2
+    from db import Database
+    from delta_sync import FULL_QUERY, DeltaSync
+    from movie_store import MovieStore
+    database = Database(lambda: psycopg2.connect(dsn))
+    sync = DeltaSync(database, MovieStore.from_frame(database.read_frame(FULL_QUERY)), interval=interval, ttl=ttl)
+    sync.start()
+    return EngineSource(lambda: sync.store.version, lambda version: QueryEngine(sync.store))
+
+
+#------------Request parameters and JSON records------------------------------
+
+def _list(params, name):
+    values = params.getlist(name)
+    return values or None
+
+
+def _int(params, name, default=None, low=None, high=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return value
+
+
+def _float(params, name, default=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+
+
+# (low, high) of a range filter given as <name>_min / <name>_max, None when neither is set
+def _range(params, name, parse, low, high):
+    first, last = parse(params, f"{name}_min"), parse(params, f"{name}_max")
+    if first is None and last is None:
+        return None
+    return (low if first is None else first), (high if last is None else last)
+
+
+# Films of the rows as JSON-ready dicts, in row order
+def film_records(store, rows):
+    rows = np.asarray(rows, dtype=np.int64)
+    genres, genre_counts = gather_csr(store.genre_offsets, store.genre_codes, rows)
+    providers, provider_counts = gather_csr(store.provider_offsets, store.provider_codes, rows)
+    genres = np.split(store.genre_names[genres], np.cumsum(genre_counts)[:-1]) if len(rows) else []
+    providers = np.split(store.provider_names[providers], np.cumsum(provider_counts)[:-1]) if len(rows) else []
+    dates = np.datetime_as_string(np.asarray(store.release_date)[rows], unit='D')
+    return [{
+        'id': int(store.id[row]),
+        'movie_id': int(store.movie_id[row]),
+        'title': store.title[row] if pd.notna(store.title[row]) else None,
+        'vote_average': round(float(store.vote_average[row]), 3),
+        'vote_count': int(store.vote_count[row]),
+        'release_date': None if date == 'NaT' else date,
+        'genres': genres[k].tolist(),
+        'providers': providers[k].tolist(),
+        'poster_image': store.poster_image[row] or None,
+        'overview': store.overview[row] if pd.notna(store.overview[row]) else None,
+    } for k, (row, date) in enumerate(zip(rows.tolist(), dates))]
+
+
+# A DataFrame as a list of JSON-ready dicts (dates as ISO days)
+def table_records(table):
+    table = table.copy()
+    for column in table.columns:
+        if pd.api.types.is_datetime64_any_dtype(table[column]):
+            table[column] = table[column].dt.strftime('%Y-%m-%d')
+    return json.loads(table.to_json(orient='records'))
+
+
+#------------Endpoints--------------------------------------------------------
+# Each endpoint takes the engine, the query parameters and the path parameters, and
+# returns a JSON-ready value. `today` is fixed per request so it can be part of the key.
+
+def get_version(engine, params, path, today):
+    return {'version': engine.version, 'films': int(engine.store.size)}
+
+
+# Stream & Chill filters: provider, genre (repeatable), year_min/year_max,
+# rating_min/rating_max, q (title search), sort, page, page_size
+def get_films(engine, params, path, today):
+    search = params.get('q') or None
+    sort = params.get('sort', 'best_match' if search else 'vote_count')
+    if sort not in SORT_KEYS + ['best_match']:
+        raise BadRequest(f"sort must be one of {', '.join(SORT_KEYS + ['best_match'])}")
+    page = _int(params, 'page', 1, low=1)
+    page_size = _int(params, 'page_size', 20, low=1, high=MAX_PAGE_SIZE)
+    rows, search_rows = engine.filter_rows(
+        providers=_list(params, 'provider'), genres=_list(params, 'genre'),
+        years=_range(params, 'year', _int, 0, 9999), ratings=_range(params, 'rating', _float, 0.0, 10.0),
+        search=search)
+    page_rows = engine.page_rows(rows, None if sort == 'best_match' else sort, page, page_size, search_rows=search_rows)
+    return {'count': len(rows), 'page': page, 'page_size': page_size,
+            'films': film_records(engine.store, page_rows)}
+
+
+def get_trending(engine, params, path, today):
+    window = path['window']
+    if window not in TREND_WINDOWS:
+        raise BadRequest(f"window must be one of {', '.join(TREND_WINDOWS)}")
+    k = _int(params, 'k', TOP_FILMS, low=1, high=MAX_PAGE_SIZE)
+    return {'window': window, 'films': film_records(engine.store, engine.trending_rows(window, k=k, today=today)),
+            'genres': table_records(engine.window_genre_counts(window, today=today))}
+
+
+# New arrivals of the providers (repeatable provider) in the last `days` days
+def get_arrivals(engine, params, path, today):
+    providers = _list(params, 'provider') or list(engine.store.provider_names)
+    days = _int(params, 'days', 7, low=1, high=3660)
+    limit = _int(params, 'limit', TOP_FILMS, low=1, high=MAX_PAGE_SIZE)
+    arrivals = engine.new_arrivals(providers, days=days, limit=limit, today=today)
+    films = film_records(engine.store, arrivals['row'])
+    for film, provider, day in zip(films, arrivals['provider'], arrivals['available_from']):
+        film.update(arrival_provider=provider, available_from=str(day)[:10])
+    return {'days': days, 'films': films}
+
+
+def get_similar(engine, params, path, today):
+    k = _int(params, 'k', TOP_FILMS, low=1, high=MAX_PAGE_SIZE)
+    found = engine.similar_rows(path['film_id'], k=k)
+    if found is None:
+        return None
+    row, rows = found
+    return {'film': film_records(engine.store, [row])[0], 'films': film_records(engine.store, rows)}
+
+
+# Films per provider, and how many of the providers' most voted films each one streams
+def get_provider_facts(engine, params, path, today):
+    providers = _list(params, 'provider') or list(engine.store.provider_names)
+    counts, top_film_counts = engine.provider_counts(providers)
+    return {'films': table_records(counts[counts['provider'].isin(providers)]),
+            'most_popular_films': table_records(top_film_counts)}
+
+
+def get_year_facts(engine, params, path, today):
+    if path['by'] == 'provider':
+        return table_records(engine.films_per_year_by_provider(_list(params, 'provider')))
+    if path['by'] == 'genre':
+        years = params.getlist('year')
+        return table_records(engine.films_per_year_by_genre(_list(params, 'genre'),
+                                                            [int(year) for year in years if year.isdigit()] or None))
+    raise BadRequest("facts are by provider or by genre")
+
+
+def get_most_popular(engine, params, path, today):
+    return film_records(engine.store, engine.most_popular_per_year())
+
+
+#------------Response cache and the app----------------------------------------
+
+# LRU of encoded responses: key -> (status, body)
+class ResponseCache:
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Async handler of an endpoint. The cache key (and the ETag) is the data version, the
+# day, the path and the sorted query string; repeated parameters keep their order.
+def endpoint(handler, source, cache):
+    async def handle(request):
+        engine = source.engine
+        today = pd.Timestamp('today').normalize()
+        key = (engine.version, today.value, request.url.path, tuple(sorted(request.query_params.multi_items())))
+        etag = f'"{engine.version}:{hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]}"'
+        headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL, 'X-Data-Version': engine.version}
+        # Only successful responses carry the ETag, so only they can come back as a 304
+        if etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+
+        entry = cache.get(key)
+        if entry is None:
+            try:
+                result = await run_in_threadpool(handler, engine, request.query_params, request.path_params, today)
+                entry = (200, result) if result is not None else (404, {'error': 'not found'})
+            except BadRequest as e:
+                entry = (400, {'error': str(e)})
+            entry = (entry[0], json.dumps(entry[1], separators=(',', ':')).encode('utf-8'))
+            if entry[0] != 400:
+                cache.put(key, entry)
+        if entry[0] != 200:
+            headers = {'X-Data-Version': engine.version}
+        return Response(entry[1], status_code=entry[0], media_type='application/json', headers=headers)
+    return handle
+
+
+def create_app(source, cache=None):
+    cache = cache or ResponseCache()
+    routes = [
+        ('/version', get_version),
+        ('/films', get_films),
+        ('/trending/{window}', get_trending),
+        ('/arrivals', get_arrivals),
+        ('/similar/{film_id:int}', get_similar),
+        ('/facts/providers', get_provider_facts),
+        ('/facts/years/{by}', get_year_facts),
+        ('/facts/most-popular', get_most_popular),
+    ]
+    app = Starlette(routes=[Route(path, endpoint(handler, source, cache)) for path, handler in routes])
+    app.state.cache = cache
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the movie queries as a JSON API")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help="movies.csv export to serve")
+    source.add_argument('--shared', nargs='?', const=shared_store.SHARED_DIR,
+                        help="directory the loader publishes to (shared_store.py)")
+    source.add_argument('--dsn', help="Postgres connection string of the movies database")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+
+    import uvicorn
+    if args.csv:
+        engines = csv_source(args.csv)
+    elif args.shared:
+        engines = shared_source(args.shared).start()
+    else:
+        engines = database_source(args.dsn).start()
+    uvicorn.run(create_app(engines), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
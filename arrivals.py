@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from canonical import PROVIDER_ALIASES, alias_codes
+from sketches import top_k
+from trends import to_day
+
+#------------PROVIDER ARRIVALS INDEX---------------------------------------------
+# `provider_release_dates[i]` is the day the film arrived on `providers[i]`. Every dated
+# (film, provider, available_from) pair is kept once per data version, grouped by
+# provider and sorted by day inside each group (most voted first within a day), so
+# "new on Netflix this week" is two binary searches into one slice and a timeline is a
+# count over the slices of the asked providers. Nothing is exploded per query.
+
+# Timeline buckets: day, week (starting Monday) or month
+TIMELINE_FREQS = ['D', 'W', 'M']
+
+
+class ArrivalIndex:
+
+    def __init__(self, store):
+        self.version = store.version
+        self.provider_names = store.provider_names
+        # Raw variants ("Netflix basic with Ads") look up their canonical provider's pairs
+        self.provider_codes = alias_codes(store.provider_names, PROVIDER_ALIASES)
+        self.vote_count = store.vote_count
+        date_offsets, date_codes, date_names = (store.release_dates_offsets, store.release_dates_codes,
+                                                store.release_dates_names)
+
+        # Dates only line up with providers in rows that have one date per provider
+        provider_lengths = np.diff(store.provider_offsets)
+        aligned = provider_lengths == np.diff(date_offsets)
+        rows = np.repeat(np.arange(store.size), provider_lengths)[np.repeat(aligned, provider_lengths)]
+        providers = store.provider_codes[np.repeat(aligned, provider_lengths)]
+        dates = date_names[date_codes[np.repeat(aligned, np.diff(date_offsets))]]
+        dated = ~np.isnat(dates)
+        rows, providers = rows[dated], providers[dated]
+        days = dates[dated].astype('datetime64[D]').astype(np.int64)
+
+        # Pairs sorted by provider, then day, then vote_count descending
+        order = np.lexsort((-store.vote_count[rows].astype(np.int64), days, providers))
+        self.rows, self.days = rows[order], days[order]
+        self.provider_starts = np.searchsorted(providers[order], np.arange(len(self.provider_names) + 1))
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Pair positions of a provider whose day lies in [start, end]
+    def _slice(self, provider, start, end):
+        code = self.provider_codes.get(provider)
+        if code is None:
+            return 0, 0
+        first, last = self.provider_starts[code], self.provider_starts[code + 1]
+        days = self.days[first:last]
+        return (first + np.searchsorted(days, to_day(start), side='left'),
+                first + np.searchsorted(days, to_day(end), side='right'))
+
+    # Films that arrived on any of the providers in [start, end], most voted first, as
+    # (rows, provider, arrival day) with the first provider each film arrived on
+    def arrivals(self, providers, start, end, limit=None):
+        slices = [(provider, *self._slice(provider, start, end)) for provider in providers]
+        rows = np.concatenate([self.rows[first:last] for _, first, last in slices] + [self.rows[:0]])
+        days = np.concatenate([self.days[first:last] for _, first, last in slices] + [self.days[:0]])
+        names = np.repeat(np.asarray([provider for provider, _, _ in slices], dtype=object),
+                          [last - first for _, first, last in slices])
+        # One entry per film, keeping its earliest arrival among the asked providers
+        order = np.lexsort((days, rows))
+        keep = order[np.r_[True, rows[order][1:] != rows[order][:-1]]] if len(order) else order
+        keep = keep[top_k(self.vote_count[rows[keep]], limit)]
+        return pd.DataFrame({'row': rows[keep], 'provider': names[keep],
+                             'available_from': days[keep].astype('datetime64[D]')})
+
+    # Arrivals per provider and period as a long [date, provider, count] table
+    def timeline(self, providers, start=None, end=None, freq='W'):
+        if freq not in TIMELINE_FREQS:
+            raise ValueError(f"Unknown timeline frequency {freq!r}")
+        start = '1900-01-01' if start is None else start
+        end = '2200-01-01' if end is None else end
+        tables = []
+        for provider in providers:
+            first, last = self._slice(provider, start, end)
+            days = self.days[first:last].astype('datetime64[D]')
+            if freq == 'W':
+                # Day 0 (1970-01-01) was a Thursday, so Monday is 3 days earlier
+                periods = days - (days.astype(np.int64) + 3) % 7
+            else:
+                periods = days.astype(f'datetime64[{freq}]').astype('datetime64[D]')
+            # Days are sorted, so the periods are too
+            dates, counts = np.unique(periods, return_counts=True)
+            tables.append(pd.DataFrame({'date': dates, 'provider': provider, 'count': counts}))
+        return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=['date', 'provider', 'count'])
@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.synthetic import GENRES, PROVIDERS, make_catalog
+
+#------------JSON API THROUGHPUT-------------------------------------------------
+# Usage: python benchmarks/bench_api.py [rows] [connections] [seconds]
+# Starts api.py (uvicorn) over a synthetic catalog in its own process and drives it with
+# a raw asyncio HTTP/1.1 client over keep-alive connections, so the client costs as
+# little as possible. Reports requests per second and p50/p99 latency of Stream & Chill
+# filter queries three ways: the same query again (response cache hit), the same query
+# with If-None-Match (304, nothing is sent back), and a new query every request (cache
+# miss: filter, sort and page run on a worker thread).
+
+ROWS = 100_000
+CONNECTIONS = 32
+SECONDS = 5
+PORT = 8931
+
+
+def serve(rows, port):
+    import uvicorn
+    import api
+    from movie_store import MovieStore
+    from query_engine import QueryEngine
+    store = MovieStore.from_frame(make_catalog(rows))
+    source = api.EngineSource(lambda: store.version, lambda version: QueryEngine(store))
+    uvicorn.run(api.create_app(source), host='127.0.0.1', port=port, log_level='warning', access_log=False)
+
+
+# One keep-alive connection sending the next request once the previous answer is read
+async def client(port, paths, headers, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    k = 0
+    while time.perf_counter() < deadline:
+        path = paths[k % len(paths)]
+        k += 1
+        start = time.perf_counter()
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n{headers}\r\n".encode('latin-1'))
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = 0
+        for line in head.split(b'\r\n'):
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        if length:
+            await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        statuses.add(int(head.split(b' ', 2)[1]))
+    writer.close()
+
+
+async def load(port, paths, headers, connections, seconds):
+    latencies, statuses = [], set()
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(port, paths[k::connections] or paths, headers, deadline, latencies, statuses)
+                           for k in range(connections)))
+    return len(latencies) / seconds, np.percentile(latencies, [50, 99]) * 1000, statuses
+
+
+# ETag of a path, from one plain request
+async def etag(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode('latin-1'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    writer.close()
+    return next(line.split(b':', 1)[1].strip().decode() for line in head.split(b'\r\n')
+                if line.lower().startswith(b'etag:'))
+
+
+async def wait_ready(port, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError('API server did not start')
+
+
+async def run(rows, connections, seconds):
+    query = '/films?' + urlencode({'provider': PROVIDERS[0], 'genre': GENRES[0], 'year_min': 2000})
+    # Distinct filter combinations, so no request of the miss run is served from the cache
+    misses = ['/films?' + urlencode({'provider': PROVIDERS[k % len(PROVIDERS)], 'genre': GENRES[k % len(GENRES)],
+                                     'year_min': 1950 + k % 70, 'rating_min': k % 9, 'page': 1 + k // 630})
+              for k in range(200_000)]
+    await wait_ready(PORT)
+    await load(PORT, [query, misses[0]], '', connections, 1)
+
+    print(f"{rows} rows, {connections} connections, {seconds} s per run")
+    print(f"{'requests':>22} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'status':>7}")
+    runs = [
+        ('cached', [query], ''),
+        ('If-None-Match (304)', [query], f"If-None-Match: {await etag(PORT, query)}\r\n"),
+        ('uncached', misses[1:], ''),
+    ]
+    for name, paths, headers in runs:
+        rate, (p50, p99), statuses = await load(PORT, paths, headers, connections, seconds)
+        print(f"{name:>22} {rate:>9.0f} {p50:>9.2f} {p99:>9.2f} {','.join(map(str, sorted(statuses))):>7}")
+
+
+def main(rows, connections, seconds):
+    server = multiprocessing.get_context('spawn').Process(target=serve, args=(rows, PORT), daemon=True)
+    server.start()
+    try:
+        asyncio.run(run(rows, connections, seconds))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS,
+         int(sys.argv[2]) if len(sys.argv) > 2 else CONNECTIONS,
+         int(sys.argv[3]) if len(sys.argv) > 3 else SECONDS)
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from arrivals import ArrivalIndex
+from benchmarks.bench_filter import timed_ms
+from benchmarks.synthetic import PROVIDERS, make_catalog
+from canonical import PROVIDER_ALIASES, canonical_names
+from movie_store import MovieStore
+
+#------------NEW ARRIVALS: EXPLODE vs ARRIVALS INDEX-----------------------------
+# Usage: python benchmarks/bench_arrivals.py [rows ...]
+# Answers random "new on <providers> in this week" questions by exploding the provider
+# and date lists of the whole frame (the way the facts page used to work) and with the
+# arrivals index, checks both find the same films, and reports latency. The providers
+# are the raw names of the catalog, so variants such as "Netflix basic with Ads" are
+# asked for too.
+
+SIZES = [100_000, 1_000_000]
+QUERIES = 20
+
+
+# Films that arrived on the providers in [start, end], found by exploding every pair.
+# The providers are asked by any of their names, so they are made canonical like the frame's.
+def explode_arrivals(df, providers, start, end):
+    providers = canonical_names(providers, PROVIDER_ALIASES)
+    pairs = df[['providers', 'provider_release_dates']]
+    pairs = pairs[pairs['providers'].map(len) == pairs['provider_release_dates'].map(len)].explode(
+        ['providers', 'provider_release_dates'])
+    arrived = pd.to_datetime(pairs['provider_release_dates'])
+    return np.unique(pairs.index[pairs['providers'].isin(providers) & arrived.between(start, end)])
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    today = pd.Timestamp('today').normalize()
+    print(f"{'rows':>10} {'pairs':>10} {'explode p50 (ms)':>17} {'index p50 (ms)':>15} {'timeline (ms)':>14} {'build (s)':>10}")
+    for n in sizes:
+        store = MovieStore.from_frame(make_catalog(n))
+        start = time.perf_counter()
+        index = ArrivalIndex(store)
+        build = time.perf_counter() - start
+
+        films = store.films()
+        explode_ms, index_ms = [], []
+        for _ in range(QUERIES):
+            providers = list(rng.choice(PROVIDERS, size=rng.integers(1, 4), replace=False))
+            end = today - pd.Timedelta(days=int(rng.integers(0, 365)))
+            window = (end - pd.Timedelta(days=6), end)
+            expected, elapsed = timed_ms(explode_arrivals, films, providers, *window)
+            explode_ms.append(elapsed)
+            arrivals, elapsed = timed_ms(index.arrivals, providers, *window)
+            index_ms.append(elapsed)
+            assert np.array_equal(np.sort(arrivals['row'].to_numpy()), expected), 'arrivals index disagrees with explode'
+        _, timeline = timed_ms(index.timeline, PROVIDERS)
+        print(f"{n:>10} {len(index):>10} {np.median(explode_ms):>17.1f} {np.median(index_ms):>15.2f} "
+              f"{timeline:>14.1f} {build:>10.2f}")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
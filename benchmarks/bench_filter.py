@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.synthetic import GENRES, PROVIDERS, make_catalog
+from canonical import GENRE_ALIASES, PROVIDER_ALIASES, canonical_lists, canonical_names
+from filter_index import FilterIndex
+from movie_store import MovieStore, decode_lists, encode_lists
+
+#------------STREAM & CHILL FILTER: APPLY LAMBDAS vs BITMAP INDEX----------------
+# Usage: python benchmarks/bench_filter.py [rows ...]
+# Runs the same random provider/genre/year/rating queries through the old
+# `apply`-based filter and the bitmap index, checks they agree, and reports latency.
+# The queries pick raw provider names ("Netflix basic with Ads"); the reference filter
+# runs on the raw catalog's lists mapped to canonical names and asks for the canonical
+# names of the query, which is what the index resolves variants to.
+
+SIZES = [10_000, 100_000, 1_000_000]
+QUERIES = 20
+
+
+# Frame of the store with the raw catalog's provider and genre lists made canonical
+def canonical_frame(catalog, store):
+    frame = store.frame.copy()
+    for column, aliases in [('providers', PROVIDER_ALIASES), ('genres', GENRE_ALIASES)]:
+        offsets, codes, names, _ = canonical_lists(*encode_lists(catalog[column]), aliases)
+        frame[column] = decode_lists(offsets, codes, names)
+    return frame
+
+
+# The filter the Streaming Options page used to run on every widget interaction
+def apply_filter(df, providers, genres, years, ratings):
+    providers = set(canonical_names(providers, PROVIDER_ALIASES))
+    genres = set(canonical_names(genres, GENRE_ALIASES))
+    return df[
+        df['providers'].apply(lambda x: any(provider in x for provider in providers)) &
+        df['genres'].apply(lambda x: any(genre in x for genre in genres)) &
+        df['year'].between(years[0], years[1]) &
+        df['vote_average'].between(ratings[0], ratings[1])
+    ]
+
+
+def random_queries(rng, count):
+    for _ in range(count):
+        providers = list(rng.choice(PROVIDERS, size=rng.integers(1, 8), replace=False))
+        genres = list(rng.choice(GENRES, size=rng.integers(1, len(GENRES) + 1), replace=False))
+        first_year = int(rng.integers(2010, 2025))
+        years = (first_year, int(rng.integers(first_year, 2027)))
+        low = int(rng.integers(0, 8))
+        yield providers, genres, years, (low, int(rng.integers(low, 11)))
+
+
+def timed_ms(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'apply p50 (ms)':>15} {'index p50 (ms)':>15} {'index max (ms)':>15} {'build (s)':>10}")
+    for n in sizes:
+        catalog = make_catalog(n)
+        store = MovieStore.from_frame(catalog)
+        frame = canonical_frame(catalog, store)
+        start = time.perf_counter()
+        index = FilterIndex(store)
+        build = time.perf_counter() - start
+
+        apply_ms, index_ms = [], []
+        for providers, genres, years, ratings in random_queries(np.random.default_rng(0), QUERIES):
+            expected, elapsed = timed_ms(apply_filter, frame, providers, genres, years, ratings)
+            apply_ms.append(elapsed)
+            rows, elapsed = timed_ms(index.query, providers, genres, years, ratings)
+            index_ms.append(elapsed)
+            assert np.array_equal(rows, expected.index.to_numpy()), 'bitmap index disagrees with apply filter'
+        print(f"{n:>10} {np.median(apply_ms):>15.1f} {np.median(index_ms):>15.2f} "
+              f"{max(index_ms):>15.2f} {build:>10.2f}")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,154 @@
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+#------------PAGE BENCHMARK SUITE------------------------------------------------
+# Usage: python benchmarks/bench_pages.py [rows ...] [--save results.json]
+#                                         [--baseline results.json] [--tolerance 0.25]
+# For every size a synthetic movies.csv export is generated (benchmarks/synthetic.py,
+# seeded so runs are comparable) and movies.py is driven headlessly (streamlit.testing)
+# in a fresh process: cold start, then each page is visited and rerun, and the Stream &
+# Chill filter is exercised with a search, a provider and a year change. The per-stage
+# p50/p95 come from the app's own stage metrics; peak memory is the process max RSS.
+# With --baseline the run is compared to saved results and the exit code is 1 when a
+# stage p50, a page rerun or the peak memory got slower/bigger than the tolerance allows,
+# so it can gate a deploy. 5M rows needs about 16 GB of RAM.
+
+SIZES = [10_000, 100_000, 1_000_000]
+RERUNS = 5
+PAGES = ["🍿 Trendy Picks", " 📺 Stream & Chill", "🌟 Movies Fun Facts"]
+
+# Relative slowdown allowed against the baseline, and the absolute slack under which
+# differences are treated as noise
+TOLERANCE = 0.25
+MIN_MS = 5
+MIN_MB = 20
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+# Widget changes on the Stream & Chill page, each one a rerun of the filter
+def filter_changes(app):
+    yield lambda: app.text_input[0].input("night").run()
+    yield lambda: app.text_input[0].input("").run()
+    yield lambda: app.multiselect[0].set_value(['Netflix', 'Disney Plus']).run()
+    yield lambda: app.slider[0].set_value((2020, app.slider[0].value[1])).run()
+
+
+def child(csv_path, snapshot_dir):
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    from metrics import stage_metrics
+
+    app = AppTest.from_file(os.path.join(ROOT, 'movies.py'), default_timeout=1800)
+    app.secrets.update(DATA_SOURCE='snapshot', SNAPSHOT_CSV=csv_path, SNAPSHOT_DIR=snapshot_dir)
+    app.run()
+    result = {'cold (s)': time.perf_counter() - start, 'cold peak (MB)': peak_mb(), 'pages': {}}
+    for page in PAGES:
+        first = timed(lambda: app.sidebar.radio[0].set_value(page).run())
+        reruns = [timed(app.run) for _ in range(RERUNS)]
+        if 'Stream' in page:
+            reruns += [timed(change) for change in filter_changes(app)]
+        assert not app.exception, app.exception
+        result['pages'][page.strip()] = {'first (s)': first, 'rerun (s)': statistics.median(reruns),
+                                         'peak (MB)': peak_mb()}
+    result['stages'] = {f"{row['page']}/{row['stage']}": {'p50 (ms)': row['p50 (ms)'], 'p95 (ms)': row['p95 (ms)']}
+                        for _, row in stage_metrics.summary().iterrows()}
+    result['peak (MB)'] = peak_mb()
+    print(json.dumps(result))
+
+
+# One size: generate the export, parse it once, then run the pages in a fresh process
+def run_size(n):
+    from benchmarks.synthetic import write_export
+    from snapshot import load_csv_store
+
+    directory = tempfile.mkdtemp()
+    try:
+        csv_path, snapshot_dir = os.path.join(directory, 'movies.csv'), os.path.join(directory, 'snapshot')
+        generate = timed(lambda: write_export(csv_path, n))
+        build = timed(lambda: load_csv_store(csv_path, snapshot_dir))
+        output = subprocess.run([sys.executable, __file__, '--child', csv_path, snapshot_dir],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result.update({'generate (s)': generate, 'build snapshot (s)': build})
+        return result
+    finally:
+        shutil.rmtree(directory)
+
+
+def report(n, result):
+    print(f"\n{n} rows: generate {result['generate (s)']:.1f}s, build snapshot {result['build snapshot (s)']:.1f}s, "
+          f"cold start {result['cold (s)']:.2f}s ({result['cold peak (MB)']:.0f} MB), peak RSS {result['peak (MB)']:.0f} MB")
+    print(f"  {'page':<22} {'first visit (s)':>16} {'warm rerun (s)':>15} {'peak (MB)':>10}")
+    for page, times in result['pages'].items():
+        print(f"  {page:<22} {times['first (s)']:>16.3f} {times['rerun (s)']:>15.3f} {times['peak (MB)']:>10.0f}")
+    print(f"  {'stage':<40} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for stage, times in result['stages'].items():
+        print(f"  {stage:<40} {times['p50 (ms)']:>9.1f} {times['p95 (ms)']:>9.1f}")
+
+
+# Measurements of a run that are worse than the baseline beyond the tolerance
+def regressions(results, baseline, tolerance):
+    found = []
+    for n, result in results.items():
+        if n not in baseline:
+            continue
+        checks = [('peak (MB)', result['peak (MB)'], baseline[n]['peak (MB)'], MIN_MB)]
+        checks += [(f"{page} rerun (s)", times['rerun (s)'], baseline[n]['pages'][page]['rerun (s)'], MIN_MS / 1000)
+                   for page, times in result['pages'].items() if page in baseline[n]['pages']]
+        checks += [(f"{stage} p50 (ms)", times['p50 (ms)'], baseline[n]['stages'][stage]['p50 (ms)'], MIN_MS)
+                   for stage, times in result['stages'].items() if stage in baseline[n]['stages']]
+        for name, value, previous, slack in checks:
+            if value > previous * (1 + tolerance) and value - previous > slack:
+                found.append(f"{n} rows {name}: {previous:.3f} -> {value:.3f}")
+    return found
+
+
+def main(args):
+    options = {}
+    for name in ['--save', '--baseline', '--tolerance']:
+        if name in args:
+            options[name] = args.pop(args.index(name) + 1)
+            args.remove(name)
+    save, baseline = options.get('--save'), options.get('--baseline')
+    tolerance = float(options.get('--tolerance', TOLERANCE))
+    sizes = [int(n) for n in args] or SIZES
+
+    os.chdir(ROOT)
+    results = {}
+    for n in sizes:
+        results[str(n)] = run_size(n)
+        report(n, results[str(n)])
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if baseline:
+        with open(baseline) as f:
+            found = regressions(results, json.load(f), tolerance)
+        print(f"\n{len(found)} regression(s) against {baseline}" + ''.join(f"\n  {line}" for line in found))
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:4])
+    else:
+        main(sys.argv[1:])
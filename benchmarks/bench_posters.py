@@ -0,0 +1,159 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from posters import PosterCache
+
+#------------POSTER THUMBNAILS vs FULL w500 POSTERS------------------------------
+# Usage: python benchmarks/bench_posters.py [posters]
+# A local HTTP server stands in for the TMDB image host and serves a noisy 500x750 JPEG
+# per poster. Reports the bytes a page of 20 cards makes the browser download with the
+# full posters against the 154px and 342px thumbnails, the time to fetch and resize a
+# poster, the time to look a cached one up, and checks the disk budget holds. Then the
+# eviction path is checked at the POSTER_CACHE_MB limits: the least recently used
+# thumbnails go first (a lookup counts as a use), a budget of exactly the posters' size
+# evicts nothing and one byte less evicts the oldest thumbnail, a budget below one
+# thumbnail keeps only the newest, a cache reopened with a smaller budget gets back under
+# it at its next write, and a budget of 0 never writes.
+
+POSTERS = 200
+PAGE_CARDS = 20
+
+
+# Bytes on disk and names of the thumbnails in a cache folder
+def disk_usage(directory):
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.jpg')]
+    return sum(entry.stat().st_size for entry in entries), {entry.name for entry in entries}
+
+
+# Posters fetched one after the other into a new cache of `max_bytes`, so the LRU order is known
+def filled_cache(directory, urls, max_bytes):
+    cache = PosterCache(directory=directory, max_bytes=max_bytes, workers=1)
+    for url in urls:
+        cache.fetch(url)
+    return cache
+
+
+def check_eviction(directory, urls, poster_bytes):
+    # POSTER_CACHE_MB=1, as movies.py turns it into bytes: the newest posters are kept
+    budget = 1 * 2 ** 20
+    assert sum(poster_bytes.values()) > 2 * budget, 'too few posters to fill a 1 MB cache'
+    cache = filled_cache(os.path.join(directory, 'mb'), urls, budget)
+    on_disk, names = disk_usage(cache.directory)
+    assert on_disk <= budget and on_disk == cache.size, f'1 MB cache holds {on_disk} bytes, counts {cache.size}'
+    assert names == set(cache._files), 'evicted thumbnails left on disk or counted'
+    kept = [cache.cached(url) for url in urls]
+    assert kept == sorted(kept) and kept[-1] and not kept[0], 'eviction did not keep the newest posters'
+
+    # A lookup makes a poster recently used, so later writes evict the ones after it first
+    ten = sum(poster_bytes[url] for url in urls[:10])
+    cache = filled_cache(os.path.join(directory, 'lru'), urls[:30], ten)
+    assert cache.cached(urls[20]) and not cache.cached(urls[19])
+    for url in urls[30:35]:
+        cache.fetch(url)
+    assert cache.cached(urls[20]) and not cache.cached(urls[21]), 'a poster looked up was evicted before older ones'
+
+    # Exactly the posters' size evicts nothing, one byte less evicts the oldest thumbnail
+    total = sum(poster_bytes[url] for url in urls[:20])
+    cache = filled_cache(os.path.join(directory, 'exact'), urls[:20], total)
+    assert all(cache.cached(url) for url in urls[:20]), 'a cache exactly the size of its posters evicted one'
+    cache = filled_cache(os.path.join(directory, 'one-less'), urls[:20], total - 1)
+    assert not cache.cached(urls[0]) and all(cache.cached(url) for url in urls[1:20])
+    assert len(disk_usage(cache.directory)[1]) == 2 * 20 - 1, 'one byte over evicted more than one thumbnail'
+
+    # Below one thumbnail only the newest one is kept (it is being served)
+    cache = filled_cache(os.path.join(directory, 'tiny'), urls[:3], 1)
+    assert disk_usage(cache.directory)[1] == {cache._name(urls[2], cache.widths[-1])}
+
+    # Reopened with a smaller budget: counted from disk, back under the budget at the next write
+    reopened = PosterCache(directory=os.path.join(directory, 'exact'), max_bytes=ten, workers=1)
+    assert reopened.size == total
+    reopened.fetch(urls[20])
+    on_disk, _ = disk_usage(reopened.directory)
+    assert on_disk <= ten and reopened.cached(urls[20]), 'reopened cache did not shrink to its new budget'
+
+    # POSTER_CACHE_MB=0 turns the cache off: nothing is queued or written
+    off = PosterCache(directory=os.path.join(directory, 'off'), max_bytes=0 * 2 ** 20)
+    off.prefetch(urls[:5])
+    sources = [off.image_sources(url) for url in urls[:5]]
+    assert not off._pending and not os.path.exists(off.directory), 'a disabled cache fetched posters'
+    assert all('/t/p/w154/' in src for src, _ in sources)
+    print(f"eviction at POSTER_CACHE_MB limits: {sum(kept)} of {len(urls)} posters kept in 1 MB, checks passed")
+
+
+# Image host stand-in: /t/p/w500/<n>.jpg is a random 500x750 poster
+class PosterHandler(BaseHTTPRequestHandler):
+    images = {}
+
+    def do_GET(self):
+        name = self.path.rsplit('/', 1)[-1]
+        if name not in self.images:
+            rng = np.random.default_rng(abs(hash(name)) % 2 ** 32)
+            pixels = rng.integers(0, 256, (750, 500, 3), dtype=np.uint8)
+            pixels[:, :] = (pixels // 4 + np.linspace(0, 190, 500, dtype=np.uint8)[None, :, None])
+            buffer = BytesIO()
+            Image.fromarray(pixels).save(buffer, 'JPEG', quality=85)
+            self.images[name] = buffer.getvalue()
+        body = self.images[name]
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(count):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PosterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/t/p/w500/{i}.jpg" for i in range(count)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PosterCache(directory=directory, max_bytes=2 ** 30)
+        start = time.perf_counter()
+        for url in urls:
+            cache.fetch(url)
+        fetch = (time.perf_counter() - start) / count * 1000
+
+        start = time.perf_counter()
+        for url in urls:
+            cache.image_sources(url)
+        lookup = (time.perf_counter() - start) / count * 1e6
+
+        page = urls[:PAGE_CARDS]
+        full = sum(len(PosterHandler.images[url.rsplit('/', 1)[-1]]) for url in page)
+        thumbnails = {width: sum(os.path.getsize(os.path.join(directory, cache._name(url, width))) for url in page)
+                      for width in cache.widths}
+        print(f"page of {PAGE_CARDS} cards: w500 {full / 1024:.0f} KB, "
+              + ', '.join(f"w{width} {size / 1024:.0f} KB" for width, size in thumbnails.items()))
+        print(f"fetch + resize {fetch:.1f} ms per poster, cached lookup {lookup:.1f} us")
+
+        # A budget of half the thumbnails keeps the most recently used half
+        budget = cache.size // 2
+        small = PosterCache(directory=os.path.join(directory, 'small'), max_bytes=budget)
+        small.prefetch(urls)
+        small.wait()
+        on_disk = sum(entry.stat().st_size for entry in os.scandir(small.directory))
+        print(f"budget {budget / 1024:.0f} KB: {on_disk / 1024:.0f} KB on disk, "
+              f"{sum(small.cached(url) for url in urls)} of {count} posters cached")
+        assert on_disk <= budget, 'poster cache over its budget'
+
+        poster_bytes = {url: sum(os.path.getsize(os.path.join(directory, cache._name(url, width)))
+                                 for width in cache.widths) for url in urls}
+        check_eviction(directory, urls, poster_bytes)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else POSTERS)
@@ -0,0 +1,119 @@
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from benchmarks.bench_filter import random_queries, timed_ms
+from benchmarks.synthetic import array_literal, make_catalog
+from db import Database
+from facts_cube import FactsCube
+from filter_index import FilterIndex
+from movie_store import MovieStore
+from pushdown import PushdownQueries
+from trends import TrendIndex
+
+#------------IN-MEMORY MODE vs QUERY PUSHDOWN------------------------------------
+# Usage: BENCH_DSN=postgresql://... python benchmarks/bench_pushdown.py [rows ...]
+# Loads a synthetic catalog into a scratch `bench_movies` table of the given database
+# (dropped and recreated for every size), then compares the cold start of the
+# in-memory mode (SELECT * + store + indexes) and the per-view latency of the
+# Stream & Chill page, the weekly trend and a facts chart in both modes. The first
+# result page of every filter query is checked to be the same in both modes.
+
+SIZES = [10_000, 100_000, 1_000_000]
+QUERIES = 20
+PAGE_SIZE = 20
+TABLE = 'bench_movies'
+
+SCHEMA = f"""
+DROP TABLE IF EXISTS {TABLE};
+CREATE TABLE {TABLE} (
+    id bigint PRIMARY KEY, movie_id bigint, title text, vote_average double precision,
+    vote_count integer, overview text, release_date date, genres text[], providers text[],
+    provider_release_dates date[], trending boolean, timestamp timestamp, poster_image text
+);
+"""
+
+INDEXES = f"""
+CREATE INDEX ON {TABLE} USING gin (providers);
+CREATE INDEX ON {TABLE} USING gin (genres);
+CREATE INDEX ON {TABLE} (release_date, vote_count DESC);
+ANALYZE {TABLE};
+"""
+
+
+def load_table(connection, catalog):
+    copy = catalog.copy()
+    for column in ['genres', 'providers', 'provider_release_dates']:
+        copy[column] = copy[column].map(array_literal)
+    buffer = io.StringIO()
+    copy.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(SCHEMA)
+        cursor.copy_expert(f"COPY {TABLE} FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(INDEXES)
+    connection.commit()
+
+
+def p50(function, runs):
+    return np.median([timed_ms(function, *args)[1] for args in runs])
+
+
+def main(dsn, sizes):
+    connection = psycopg2.connect(dsn)
+    database = Database(lambda: psycopg2.connect(dsn))
+    pushdown = PushdownQueries(database, table=TABLE)
+    today = pd.Timestamp('today').normalize()
+    week = (today - pd.Timedelta(days=today.weekday() + 7), today - pd.Timedelta(days=today.weekday() + 1))
+
+    print(f"{'rows':>10} {'memory load (s)':>16} {'view':>8} {'memory p50 (ms)':>16} {'pushdown p50 (ms)':>18}")
+    for n in sizes:
+        load_table(connection, make_catalog(n))
+
+        # Cold start of the in-memory mode: the whole table crosses the wire once
+        start = time.perf_counter()
+        store = MovieStore.from_frame(database.read_frame(f"SELECT * FROM {TABLE} ORDER BY id"))
+        index, trends, cube = FilterIndex(store), TrendIndex(store), FactsCube(store)
+        load = time.perf_counter() - start
+
+        queries = [dict(providers=providers, genres=genres, years=years, ratings=ratings)
+                   for providers, genres, years, ratings in random_queries(np.random.default_rng(0), QUERIES)]
+
+        def memory_page(filters):
+            rows = index.sort(index.query(**filters), 'vote_count')
+            return len(rows), store.films(rows[:PAGE_SIZE])
+
+        def pushdown_page(filters):
+            return pushdown.count_films(**filters), pushdown.films(limit=PAGE_SIZE, **filters)
+
+        for filters in queries:
+            (memory_total, memory_films), (pushdown_total, pushdown_films) = memory_page(filters), pushdown_page(filters)
+            assert memory_total == pushdown_total, 'pushdown count disagrees with the filter index'
+            assert memory_films['id'].tolist() == pushdown_films['id'].tolist(), 'pushdown page disagrees'
+
+        views = {
+            'filter': (memory_page, pushdown_page, [(filters,) for filters in queries]),
+            'week': (lambda: store.films(trends.top(*week, k=10)),
+                     lambda: pushdown.window_films(*week, limit=10), [()] * QUERIES),
+            'facts': (lambda: cube.films_per_year_by_genre(), lambda: pushdown.year_counts('genres'), [()] * QUERIES),
+        }
+        for i, (view, (memory_view, pushdown_view, runs)) in enumerate(views.items()):
+            print(f"{n if i == 0 else '':>10} {f'{load:.2f}' if i == 0 else '':>16} {view:>8} "
+                  f"{p50(memory_view, runs):>16.2f} {p50(pushdown_view, runs):>18.2f}")
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    connection.commit()
+
+
+if __name__ == '__main__':
+    if 'BENCH_DSN' not in os.environ:
+        sys.exit("Set BENCH_DSN to the Postgres database to benchmark against")
+    main(os.environ['BENCH_DSN'], [int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,107 @@
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+#------------MEMORY PER EXTRA SESSION--------------------------------------------
+# Usage: python benchmarks/bench_sessions.py [rows ...]
+# Opens SESSIONS headless sessions of movies.py (streamlit.testing) in one process, all
+# kept alive, each visiting every page, and reads the resident memory after each one.
+# The data is shared, so every session after the first should only add its own widget
+# state and rendered page; a session that got its own copy of the data would add about
+# the size of the frame. Exits with 1 when a session costs more than MAX_SESSION_SHARE
+# of the frame size. Each size runs twice: from the CSV export (DATA_SOURCE=snapshot), and
+# in database mode with the database refusing every connection and no saved copy, so the
+# lazily loaded store falls back to the export. There every run must show the fallback
+# warning exactly once, and the fallback data must be shared like any other.
+
+SIZES = [100_000, 1_000_000]
+SESSIONS = 6
+PAGES = ["🍿 Trendy Picks", " 📺 Stream & Chill", "🌟 Movies Fun Facts"]
+SOURCES = ['snapshot', 'database down']
+
+# Database mode against a port nothing listens on (connections are refused at once)
+DOWN_SECRETS = dict(DB_NAME='movies', DB_USERNAME='bench', DB_PASSWORD='', DB_HOST='127.0.0.1', DB_PORT='1',
+                    DB_CONNECT_TIMEOUT='1')
+
+# Largest memory growth per extra session, as a share of the shared frame
+MAX_SESSION_SHARE = 0.05
+
+
+# Resident memory of this process (not the peak)
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+# Warnings of a run that say the films come from the export instead of the database
+def fallback_warnings(app):
+    return [warning.value for warning in app.warning if 'movies.csv export instead' in warning.value]
+
+
+def child(csv_path, snapshot_dir, source):
+    from streamlit.testing.v1 import AppTest
+    from snapshot import load_csv_store
+
+    frame_mb = load_csv_store(csv_path, snapshot_dir).films().memory_usage(deep=True).sum() / 2 ** 20
+    if source == 'snapshot':
+        secrets = dict(DATA_SOURCE='snapshot')
+    else:
+        # No saved copy of an earlier read either, so the export is the only data left
+        secrets = dict(DOWN_SECRETS, SNAPSHOT_PATH=os.path.join(os.path.dirname(csv_path), 'missing.pkl'))
+    sessions, rss = [], []
+    for _ in range(SESSIONS):
+        app = AppTest.from_file(os.path.join(ROOT, 'movies.py'), default_timeout=1800)
+        app.secrets.update(SNAPSHOT_CSV=csv_path, SNAPSHOT_DIR=snapshot_dir, **secrets)
+        app.run()
+        for page in PAGES:
+            app.sidebar.radio[0].set_value(page).run()
+            assert not app.exception, app.exception
+            assert len(fallback_warnings(app)) == (source != 'snapshot'), \
+                f'{source}: fallback warnings {fallback_warnings(app)}'
+        sessions.append(app)
+        gc.collect()
+        rss.append(rss_mb())
+    print(json.dumps({'frame (MB)': frame_mb, 'rss (MB)': rss}))
+
+
+def main(sizes):
+    from benchmarks.synthetic import write_export
+    from snapshot import load_csv_store
+
+    os.chdir(ROOT)
+    print(f"{'rows':>10} {'source':>14} {'frame (MB)':>11} {'1 session (MB)':>15} {'per extra session (MB)':>23}")
+    failed = False
+    for n in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            csv_path, snapshot_dir = os.path.join(directory, 'movies.csv'), os.path.join(directory, 'snapshot')
+            write_export(csv_path, n)
+            load_csv_store(csv_path, snapshot_dir)
+            results = {}
+            for source in SOURCES:
+                output = subprocess.run([sys.executable, __file__, '--child', csv_path, snapshot_dir, source],
+                                        capture_output=True, text=True, check=True).stdout
+                results[source] = json.loads(output.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(directory)
+        for i, (source, result) in enumerate(results.items()):
+            rss = result['rss (MB)']
+            per_session = (rss[-1] - rss[0]) / (len(rss) - 1)
+            failed |= per_session > MAX_SESSION_SHARE * result['frame (MB)']
+            print(f"{n if i == 0 else '':>10} {source:>14} {result['frame (MB)']:>11.0f} {rss[0]:>15.0f} "
+                  f"{per_session:>23.1f}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:5])
+    else:
+        main([int(n) for n in sys.argv[1:]] or SIZES)
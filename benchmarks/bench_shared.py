@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import shared_store
+from benchmarks.synthetic import PROVIDERS, make_catalog
+from movie_store import MovieStore
+
+#------------SHARED DATASET vs A COPY PER WORKER---------------------------------
+# Usage: python benchmarks/bench_shared.py [rows] [workers]
+# Starts worker processes the way Streamlit workers would hold the data: each either
+# builds its own store and indexes, or attaches to the version published in /dev/shm.
+# Every worker runs a filter, a title search, a trend window and a "more like this"
+# query, then reports its proportional set size (PSS: shared pages are split between
+# the processes mapping them), so the sum is the real RAM of all workers. Also times a
+# worker moving to a newly published version.
+
+ROWS = 200_000
+WORKERS = 3
+ROOT = '/dev/shm/moviedash-bench'
+
+
+# Proportional set size of this process in MB
+def pss_mb():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+
+
+# Run the page queries, so the pages a worker really touches are mapped in
+def touch(store, indexes):
+    indexes['filter'].query(providers=PROVIDERS[:2], years=(2000, 2030))
+    indexes['search'].search('night', limit=20)
+    indexes['trend'].top('2020-01-01', '2030-01-01')
+    indexes['facts'].most_popular_per_year()
+    indexes['similar'].similar(0)
+    store.frame['title'].iloc[:20].tolist()
+
+
+def worker(mode, rows, ready, results):
+    catalog = make_catalog(rows) if mode == 'private' else None
+    start = time.perf_counter()
+    if mode == 'private':
+        store = MovieStore.from_frame(catalog)
+        indexes = {name: build(store) for name, build in shared_store.PUBLISHED_INDEXES.items()}
+    else:
+        version = shared_store.current_version(ROOT)
+        store = shared_store.attach(ROOT, version)
+        indexes = {name: shared_store.load_index(ROOT, version, name) for name in shared_store.PUBLISHED_INDEXES}
+    touch(store, indexes)
+    del catalog
+    elapsed = time.perf_counter() - start
+    ready.wait()
+    results.put((mode, pss_mb(), elapsed))
+    ready.wait()
+
+
+def run(mode, rows, workers):
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, rows, ready, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    # Every worker is loaded before any PSS is read, so shared pages are split between all
+    ready.wait()
+    measured = [results.get() for _ in processes]
+    ready.wait()
+    for process in processes:
+        process.join()
+    return sum(pss for _, pss, _ in measured), np.median([elapsed for _, _, elapsed in measured])
+
+
+def main(rows, workers):
+    shutil.rmtree(ROOT, ignore_errors=True)
+    os.makedirs(ROOT)
+    store = MovieStore.from_frame(make_catalog(rows))
+    start = time.perf_counter()
+    shared_store.publish(store, ROOT)
+    publish = time.perf_counter() - start
+
+    print(f"{rows} rows, {workers} workers, publish {publish:.1f} s")
+    print(f"{'mode':>10} {'total PSS (MB)':>15} {'per worker (MB)':>16} {'load (s)':>9}")
+    for mode in ['private', 'shared']:
+        total, load = run(mode, rows, workers)
+        print(f"{mode:>10} {total:>15.0f} {total / workers:>16.0f} {load:>9.2f}")
+
+    # A new version: published next to the old one, then a worker re-attaches
+    shared_store.publish(MovieStore.from_frame(make_catalog(rows, seed=1)), ROOT)
+    start = time.perf_counter()
+    version = shared_store.current_version(ROOT)
+    flipped = shared_store.attach(ROOT, version)
+    print(f"attach to new version {version}: {(time.perf_counter() - start) * 1000:.0f} ms")
+    assert flipped.version == version
+    shutil.rmtree(ROOT, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS, int(sys.argv[2]) if len(sys.argv) > 2 else WORKERS)
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.bench_filter import timed_ms
+from benchmarks.synthetic import make_catalog
+from movie_store import MovieStore
+from similar import SimilarityIndex
+
+#------------"MORE LIKE THIS" INDEX----------------------------------------------
+# Usage: python benchmarks/bench_similar.py [rows ...]
+# Builds the similarity index over a synthetic catalog and asks for the 10 films most
+# like random films: build time, memory held by the index and query latency.
+
+SIZES = [100_000, 1_000_000]
+QUERIES = 50
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'build (s)':>10} {'index (MB)':>11} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for n in sizes:
+        store = MovieStore.from_frame(make_catalog(n))
+        start = time.perf_counter()
+        index = SimilarityIndex(store)
+        build = time.perf_counter() - start
+        size = sum(value.nbytes for name, value in vars(index).items()
+                   if isinstance(value, np.ndarray) and name != 'movie_id')
+
+        latencies = [timed_ms(index.similar, row)[1] for row in rng.integers(0, store.size, QUERIES)]
+        print(f"{n:>10} {build:>10.1f} {size / 2 ** 20:>11.0f} "
+              f"{np.median(latencies):>9.1f} {np.percentile(latencies, 95):>9.1f}")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,83 @@
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from benchmarks.synthetic import write_export
+from snapshot import ARRAY_COLUMNS, csr_lists, load_csv_store, parse_pg_arrays, read_movies_csv
+
+#------------movies.csv SNAPSHOT: CSV PARSE vs SAVED .npy COLUMNS----------------
+# Usage: python benchmarks/bench_snapshot.py [rows ...]
+# Writes a synthetic catalog in the format of the Postgres CSV export, then times the
+# bulk array parse, the first cold start (parse + save) and a later cold start that
+# memory-maps the saved columns. The bulk array parser is first checked against the csv
+# module on hand-written edge cases, every array cell of the shipped movies.csv and
+# every array cell of each synthetic export.
+
+SIZES = [8_000, 100_000, 1_000_000]
+
+# Literals the parser must get right: quoted elements, embedded commas, escaped quotes
+# and backslashes, NULL, empty arrays and strings, missing cells and non-ASCII names
+EDGE_CASES = [
+    '{Netflix,"Netflix basic with Ads"}', '{"Crime, Drama",Action}', '{",",",,"}',
+    r'{"The \"Best\" Of",Comedy}', r'{"back\\slash","\\\""}', '{NULL,NULL}', '{NULL,Netflix,NULL}',
+    '{}', '{""}', '{"",NULL}', None, '{Amélie,"Łódź, Kraków"}', '{"{braces}"}',
+]
+
+
+# csv-module parse of one array literal, the reference the bulk parser is checked against
+def csv_parse(literal):
+    if pd.isna(literal) or literal == '{}':
+        return []
+    fields = next(csv.reader([literal[1:-1]], escapechar='\\', doublequote=False))
+    return [None if field == 'NULL' else field for field in fields]
+
+
+def check_parser(literals):
+    literals = list(literals)
+    parsed = csr_lists(*parse_pg_arrays(literals))
+    wrong = [(literal, got) for literal, got in zip(literals, parsed) if got != csv_parse(literal)]
+    assert not wrong, f'bulk array parser disagrees with the csv module: {wrong[:3]}'
+    # A quoted NULL is the string, which the csv module cannot tell apart
+    assert csr_lists(*parse_pg_arrays(['{"NULL",NULL}'])) == [['NULL', None]], 'quoted "NULL" parsed as NULL'
+
+
+# Raw array literals of every array column of an export
+def export_literals(path):
+    raw = pd.read_csv(path, dtype=object, usecols=ARRAY_COLUMNS)
+    return [literal for column in ARRAY_COLUMNS for literal in raw[column]]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    check_parser(EDGE_CASES)
+    shipped = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'movies.csv')
+    check_parser(export_literals(shipped))
+    print(f"{'rows':>10} {'read csv (s)':>13} {'first start (s)':>16} {'later start (s)':>16}")
+    for n in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            csv_path, snapshot_dir = os.path.join(directory, 'movies.csv'), os.path.join(directory, 'snapshot')
+            write_export(csv_path, n)
+            check_parser(export_literals(csv_path))
+            parse = timed(read_movies_csv, csv_path)
+            first = timed(load_csv_store, csv_path, snapshot_dir)
+            later = timed(load_csv_store, csv_path, snapshot_dir)
+            print(f"{n:>10} {parse:>13.3f} {first:>16.3f} {later:>16.3f}")
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
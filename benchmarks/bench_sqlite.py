@@ -0,0 +1,145 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_filter import random_queries, timed_ms
+from benchmarks.synthetic import ARRAY_COLUMNS, make_catalog
+from db import Database
+from filter_index import FilterIndex
+from movie_store import MovieStore
+from pushdown import SORT_SQL, PushdownQueries
+
+#------------QUERY LAYER AND PUSHDOWN AGAINST SQLITE-----------------------------
+# Usage: python benchmarks/bench_sqlite.py [rows ...]
+# SQLite stands in for Postgres, so no server is needed. The catalog goes into a scratch
+# SQLite file (list columns as JSON) read through db.Database. Every Stream & Chill
+# filter is run through PushdownQueries from several threads sharing the pool, and its
+# count and first result page are checked against the bitmap index over the store built
+# from the same table. Then the database is taken down: the full read must fall back to
+# the last-good snapshot with the same rows, and be fresh again once it is back.
+# Pushdown's SQL is used as is except for the Postgres-only parts: array overlap (`&&`)
+# becomes a json_each lookup and the %(name)s parameters become :name ones.
+
+SIZES = [10_000, 100_000]
+QUERIES = 40
+THREADS = 8
+PAGE_SIZE = 20
+TABLE = 'movies'
+
+# `column && %(name)s::text[]` (Postgres array overlap) and any %(name)s parameter
+OVERLAP = re.compile(r"(\w+) && %\((\w+)\)s::text\[\]")
+PARAMETER = re.compile(r"%\((\w+)\)s")
+
+
+# Query and parameters in SQLite's dialect: lists are passed as JSON, dates and times as
+# the text to_sql writes them as ('2024-08-16' and '2024-08-16 05:13:13.960000')
+def sqlite_query(sql, params):
+    sql = OVERLAP.sub(r"EXISTS (SELECT 1 FROM json_each(\1) WHERE value IN (SELECT value FROM json_each(:\2)))", sql)
+    sql = PARAMETER.sub(r":\1", sql)
+    params = {name: json.dumps(value) if isinstance(value, list) else str(value) if isinstance(value, date)
+              else value for name, value in (params or {}).items()}
+    return sql, params
+
+
+# List columns of a read back from their JSON text
+def decode_json(df):
+    for column in set(ARRAY_COLUMNS) & set(df.columns):
+        df[column] = [None if value is None else json.loads(value) for value in df[column]]
+    return df
+
+
+# PushdownQueries over SQLite. Its filters, variants and ORDER BYs are run unchanged.
+class SQLitePushdown(PushdownQueries):
+
+    def _read(self, sql, params=None):
+        return decode_json(self.database.read_frame(*sqlite_query(sql.format(table=self.table), params)))
+
+    def raw_names(self, column):
+        names = self._read(f"SELECT DISTINCT value AS name FROM {{table}}, json_each({{table}}.{column}) ORDER BY name")
+        return names['name'].dropna().tolist()
+
+
+def write_table(path, catalog):
+    copy = catalog.copy()
+    for column in ARRAY_COLUMNS:
+        copy[column] = [json.dumps(value, default=str) for value in copy[column]]
+    copy['release_date'] = [None if pd.isna(day) else day.isoformat() for day in copy['release_date']]
+    with sqlite3.connect(path) as connection:
+        copy.to_sql(TABLE, connection, index=False, if_exists='replace')
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'queries':>8} {'threads':>8} {'pushdown p50 (ms)':>18} {'index p50 (ms)':>15} "
+          f"{'fallback (ms)':>14}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, 'movies.db')
+            write_table(path, make_catalog(n))
+
+            # The pool hands a connection to whichever thread borrows it next, which
+            # sqlite3 refuses unless check_same_thread is off
+            down = threading.Event()
+
+            def connect():
+                if down.is_set():
+                    raise sqlite3.OperationalError('database is down')
+                return sqlite3.connect(path, check_same_thread=False)
+
+            database = Database(connect, snapshot_path=os.path.join(scratch, 'movies_snapshot.pkl'))
+            pushdown = SQLitePushdown(database, table=TABLE)
+            df, fresh = database.read_with_fallback(f"SELECT * FROM {TABLE} ORDER BY id")
+            assert fresh, 'the first full read came from the snapshot'
+            store = MovieStore.from_frame(decode_json(df.copy()))
+            index = FilterIndex(store)
+
+            queries = [(dict(providers=providers, genres=genres, years=years, ratings=ratings), sort)
+                       for (providers, genres, years, ratings), sort
+                       in zip(random_queries(np.random.default_rng(0), QUERIES), list(SORT_SQL) * QUERIES)]
+
+            def pushdown_page(filters, sort):
+                return pushdown.count_films(**filters), pushdown.films(sort=sort, limit=PAGE_SIZE, **filters)
+
+            def memory_page(filters, sort):
+                rows = index.sort(index.query(**filters), sort)
+                return len(rows), store.films(rows[:PAGE_SIZE])
+
+            def check(query):
+                (pushdown_total, pushdown_films), pushdown_ms = timed_ms(pushdown_page, *query)
+                (memory_total, memory_films), memory_ms = timed_ms(memory_page, *query)
+                assert pushdown_total == memory_total, f'pushdown count disagrees with the filter index: {query}'
+                assert pushdown_films['id'].tolist() == memory_films['id'].tolist(), f'pushdown page disagrees: {query}'
+                return pushdown_ms, memory_ms
+
+            with ThreadPoolExecutor(THREADS) as pool:
+                timings = np.array(list(pool.map(check, queries)))
+
+            # Outage: idle connections are dropped and new ones refused
+            down.set()
+            database.pool.close_all()
+            start = time.perf_counter()
+            fallback, fresh = database.read_with_fallback(f"SELECT * FROM {TABLE} ORDER BY id")
+            fallback_ms = (time.perf_counter() - start) * 1000
+            assert not fresh and fallback.equals(df), 'the outage did not fall back to the last-good snapshot'
+            down.clear()
+            assert database.read_with_fallback(f"SELECT * FROM {TABLE} ORDER BY id")[1], \
+                'reads did not recover once the database was back'
+            database.pool.close_all()
+
+        print(f"{n:>10} {QUERIES:>8} {THREADS:>8} {np.median(timings[:, 0]):>18.2f} "
+              f"{np.median(timings[:, 1]):>15.2f} {fallback_ms:>14.1f}")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
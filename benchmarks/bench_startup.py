@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+#------------APP STARTUP AND RERUN TIME------------------------------------------
+# Usage: python benchmarks/bench_startup.py [rows ...]
+# Runs movies.py headlessly (streamlit.testing) from a synthetic movies.csv export, so
+# no database is needed. Every size runs in a fresh process that reports the cold start
+# (interpreter up to the first rendered page), the first visit of each page and the
+# median warm rerun of each page.
+
+SIZES = [8_000, 100_000]
+RERUNS = 5
+PAGES = ["🍿 Trendy Picks", " 📺 Stream & Chill", "🌟 Movies Fun Facts"]
+
+
+def child(csv_path, snapshot_dir):
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, 'movies.py'), default_timeout=600)
+    app.secrets.update(DATA_SOURCE='snapshot', SNAPSHOT_CSV=csv_path, SNAPSHOT_DIR=snapshot_dir)
+    app.run()
+    result = {'cold': time.perf_counter() - start, 'pages': {}}
+    for page in PAGES:
+        start = time.perf_counter()
+        app.sidebar.radio[0].set_value(page).run()
+        first = time.perf_counter() - start
+        reruns = []
+        for _ in range(RERUNS):
+            start = time.perf_counter()
+            app.run()
+            reruns.append(time.perf_counter() - start)
+        assert not app.exception, app.exception
+        result['pages'][page.strip()] = {'first': first, 'rerun': statistics.median(reruns)}
+    print(json.dumps(result))
+
+
+def main(sizes):
+    from benchmarks.synthetic import write_export
+    from snapshot import load_csv_store
+
+    os.chdir(ROOT)
+    print(f"{'rows':>10} {'cold start (s)':>15} {'page':>24} {'first visit (s)':>16} {'warm rerun (s)':>15}")
+    for n in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            csv_path, snapshot_dir = os.path.join(directory, 'movies.csv'), os.path.join(directory, 'snapshot')
+            write_export(csv_path, n)
+            # The CSV is parsed once up front, as a previous process would have done
+            load_csv_store(csv_path, snapshot_dir)
+            output = subprocess.run([sys.executable, __file__, '--child', csv_path, snapshot_dir],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            for i, (page, times) in enumerate(result['pages'].items()):
+                print(f"{n if i == 0 else '':>10} {format(result['cold'], '.2f') if i == 0 else '':>15} {page:>24} "
+                      f"{times['first']:>16.3f} {times['rerun']:>15.3f}")
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:4])
+    else:
+        main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,144 @@
+import gc
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from benchmarks.synthetic import make_catalog
+from movie_store import MovieStore
+
+#------------COLUMNAR STORE vs DATAFRAME RELOAD----------------------------------
+# Usage: python benchmarks/bench_store.py [rows ...]
+# Every (path, size) pair runs in its own processes: a timed one (the fastest of RUNS
+# first renders), and a traced one that measures the memory still held by the data once
+# the raw query result is dropped (the Python heap plus the Arrow buffers of the text
+# columns, which tracemalloc does not see). The old path's first render includes the
+# pickle `@st.cache_data` writes into its cache on a miss, and that pickle stays held
+# next to the frame. A warm rerun pays for the copy it hands every caller plus the
+# in-place normalisations; with the store a rerun only runs the page queries.
+# Checked: the store is no slower to first render and holds no more memory.
+
+SIZES = [8_000, 100_000, 1_000_000]
+
+# First renders timed per (path, size); the fastest is reported
+RUNS = 3
+
+
+# The work the first Trendy Picks render did with the old `load_data()` frame
+def first_render_dataframe(raw):
+    df = raw
+    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
+    df['year'] = df['release_date'].dt.year
+    today = pd.to_datetime('today').normalize()
+    df['release_date'] = pd.to_datetime(df['release_date']).dt.normalize()
+    df[df['release_date'] == today]
+    df[(df['release_date'] >= today - pd.Timedelta(days=14)) & (df['release_date'] <= today)]
+    df['genres'] = df['genres'].apply(lambda x: x if isinstance(x, list) else [])
+    df['genres'].explode().dropna().unique()
+    return df
+
+
+# The same render on top of the store: dates and lists are already parsed
+def first_render_store(raw):
+    store = MovieStore.from_frame(raw)
+    df = store.frame
+    today = pd.to_datetime('today').normalize()
+    df[df['release_date'] == today]
+    df[(df['release_date'] >= today - pd.Timedelta(days=14)) & (df['release_date'] <= today)]
+    list(store.genre_names)
+    return store
+
+
+# Trendy Picks queries that run again on every rerun
+def rerun_queries(df):
+    today = pd.to_datetime('today').normalize()
+    df[df['release_date'] == today]
+    df[(df['release_date'] >= today - pd.Timedelta(days=14)) & (df['release_date'] <= today)]
+
+
+def rerun_dataframe(cached):
+    df = pickle.loads(cached)
+    df['release_date'] = pd.to_datetime(df['release_date']).dt.normalize()
+    df['genres'] = df['genres'].apply(lambda x: x if isinstance(x, list) else [])
+    rerun_queries(df)
+
+
+def rerun_store(store):
+    rerun_queries(store.frame)
+
+
+def run_child(path, n, traced):
+    if traced:
+        tracemalloc.start()
+    raw = make_catalog(n)
+    elapsed = float('inf')
+    for _ in range(1 if traced else RUNS):
+        data = cached = None
+        catalog = raw.copy()
+        gc.collect()
+        start = time.perf_counter()
+        if path == 'dataframe':
+            data = first_render_dataframe(catalog)
+            cached = pickle.dumps(data)
+        else:
+            data = first_render_store(catalog)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    del raw, catalog
+    gc.collect()
+    result = {'first_render_s': round(elapsed, 3)}
+    if not traced:
+        start = time.perf_counter()
+        if path == 'dataframe':
+            rerun_dataframe(cached)
+        else:
+            rerun_store(data)
+        result['rerun_s'] = round(time.perf_counter() - start, 3)
+    if traced:
+        current, peak = tracemalloc.get_traced_memory()
+        if pyarrow is not None:
+            current += pyarrow.total_allocated_bytes()
+            peak += pyarrow.default_memory_pool().max_memory()
+        result.update(retained_mb=round(current / 2**20, 1), peak_mb=round(peak / 2**20, 1))
+    print(json.dumps(result))
+    return data
+
+
+def _child(path, n, traced):
+    args = [sys.executable, __file__, '--child', path, str(n)] + (['--traced'] if traced else [])
+    out = subprocess.run(args, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'path':>10} {'first render (s)':>17} {'warm rerun (s)':>15} "
+          f"{'retained (MB)':>14} {'peak (MB)':>10}")
+    for n in sizes:
+        results = {}
+        for path in ('dataframe', 'store'):
+            timed = _child(path, n, traced=False)
+            memory = _child(path, n, traced=True)
+            results[path] = {**memory, **timed}
+            print(f"{n:>10} {path:>10} {timed['first_render_s']:>17} {timed['rerun_s']:>15} "
+                  f"{memory['retained_mb']:>14} {memory['peak_mb']:>10}")
+        old, new = results['dataframe'], results['store']
+        assert new['first_render_s'] <= old['first_render_s'], f'{n}: the store renders slower the first time'
+        assert new['retained_mb'] <= old['retained_mb'], f'{n}: the store holds more memory than the DataFrame'
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], int(sys.argv[3]), '--traced' in sys.argv)
+    else:
+        main([int(n) for n in sys.argv[1:]] or SIZES)
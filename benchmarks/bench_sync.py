@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_filter import timed_ms
+from benchmarks.bench_sqlite import TABLE, decode_json, sqlite_query, write_table
+from benchmarks.synthetic import make_catalog
+from db import Database
+from delta_sync import FULL_QUERY, DeltaSync
+from movie_store import MovieStore
+from snapshot import read_movies_csv
+
+#------------DELTA SYNC AGAINST SQLITE--------------------------------------------
+# Usage: python benchmarks/bench_sync.py [rows ...]
+# Runs DeltaSync against a scratch SQLite table (SQLite standing in for Postgres, as in
+# bench_sqlite.py), for the shipped movies.csv and synthetic catalogs. Many rows share
+# the newest timestamp (loads come in batches), and the delta query fetches them again
+# on every sync. Checked: a sync with no change upstream returns 0 and keeps the same
+# store (so nothing per version is rebuilt); one after CHANGED of the films were
+# updated returns just those, with their new values; the next quiet sync returns 0 again.
+# Reported: the time of each against a full reload.
+
+SIZES = [100_000, 1_000_000]
+CHANGED = 0.01
+
+
+# db.Database over SQLite: the app's queries in SQLite's dialect, list columns decoded
+class SQLiteDatabase(Database):
+
+    def read_frame(self, sql, params=None):
+        return decode_json(super().read_frame(*sqlite_query(sql, params)))
+
+
+# Give `ids` one more vote and a timestamp after every other row, as an upstream write would
+def update_rows(path, ids, timestamp):
+    with sqlite3.connect(path) as connection:
+        connection.executemany(f"UPDATE {TABLE} SET vote_count = vote_count + 1, timestamp = ? WHERE id = ?",
+                               [(str(timestamp), int(film_id)) for film_id in ids])
+
+
+def check_sync(name, catalog, directory):
+    path = os.path.join(directory, f'{name}.db')
+    write_table(path, catalog)
+    database = SQLiteDatabase(lambda: sqlite3.connect(path, check_same_thread=False))
+    sync = DeltaSync(database, MovieStore.from_frame(database.read_frame(FULL_QUERY)))
+    newest = int((sync.store.timestamp == sync.store.timestamp.max()).sum())
+
+    store = sync.store
+    count, quiet_ms = timed_ms(sync.sync_once)
+    assert count == 0 and sync.store is store, f'{name}: a sync with no change pulled {count} rows and rebuilt'
+
+    ids = np.random.default_rng(0).choice(store.id, size=max(1, int(store.size * CHANGED)), replace=False)
+    votes = dict(zip(store.id.tolist(), store.vote_count.tolist()))
+    update_rows(path, ids, pd.Timestamp(store.timestamp.max()) + pd.Timedelta(seconds=1))
+    count, delta_ms = timed_ms(sync.sync_once)
+    assert count == len(ids) and sync.store.version != store.version, f'{name}: the delta sync merged {count} rows'
+    synced = dict(zip(sync.store.id.tolist(), sync.store.vote_count.tolist()))
+    assert all(synced[film_id] == votes[film_id] + 1 for film_id in ids.tolist()), f'{name}: updated rows not merged'
+
+    store = sync.store
+    assert sync.sync_once() == 0 and sync.store is store, f'{name}: the sync after a delta did not settle'
+    _, reload_ms = timed_ms(sync.reload)
+    database.pool.close_all()
+    return store.size, newest, quiet_ms, len(ids), delta_ms, reload_ms
+
+
+def main(sizes):
+    print(f"{'catalog':>12} {'rows':>10} {'newest ts':>10} {'quiet sync (ms)':>16} {'changed':>8} "
+          f"{'delta sync (ms)':>16} {'reload (ms)':>12}")
+    shipped = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'movies.csv')
+    catalogs = [('movies.csv', lambda: read_movies_csv(shipped))] + [(str(n), lambda n=n: make_catalog(n)) for n in sizes]
+    with tempfile.TemporaryDirectory() as directory:
+        for name, catalog in catalogs:
+            rows, newest, quiet_ms, changed, delta_ms, reload_ms = check_sync(name, catalog(), directory)
+            print(f"{name:>12} {rows:>10} {newest:>10} {quiet_ms:>16.1f} {changed:>8} {delta_ms:>16.1f} "
+                  f"{reload_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+from benchmarks.bench_filter import timed_ms
+from benchmarks.synthetic import make_catalog
+from delta_sync import DeltaSync
+from movie_store import MovieStore, gather_csr
+from sketches import CatalogSketch, group_argmax, top_k
+
+#------------TOP-K SELECTION AND CATALOG SKETCH----------------------------------
+# Usage: python benchmarks/bench_topk.py [rows ...]
+# Top 10 by vote_count and the most voted film per year / per provider, with the old
+# sort_values / groupby-idxmax against argpartition / per-group maximum (results are
+# checked to match). Then the catalog sketch: a full ingest, a 1% delta, the time to
+# answer and the worst error of its estimates against exact mode. Last, one delta sync
+# (raw rows, as the database sends them) is run through DeltaSync and the exact sketch
+# is checked against the genre and provider counts of the synced store.
+
+SIZES = [100_000, 1_000_000]
+RUNS = 5
+
+
+# Database stand-in for DeltaSync that answers every read with the same rows
+class DeltaDatabase:
+
+    def __init__(self, delta):
+        self.delta = delta
+        self.snapshot_path = None
+
+    def read_frame(self, sql, params=None):
+        return self.delta
+
+
+# Exact sketch counts after one delta sync against aggregates over the synced store
+def check_sync_counts(catalog, delta):
+    sync = DeltaSync(DeltaDatabase(delta), MovieStore.from_frame(catalog), exact_sketch=True)
+    sync.sketch
+    assert sync.sync_once() == len(delta), 'delta sync dropped changed rows'
+    rows = np.arange(sync.store.size)
+    exact = pd.concat([
+        aggregates.genre_counts(sync.store, rows).rename(columns={'genre': 'label'}).assign(label=lambda t: 'genre:' + t['label']),
+        aggregates.provider_counts(sync.store, rows).rename(columns={'provider': 'label'}).assign(label=lambda t: 'provider:' + t['label']),
+    ], ignore_index=True)
+    assert np.array_equal(sync.sketch.count(exact['label']), exact['count'].to_numpy()), \
+        'sketch counts drift from the store after a delta sync'
+    stray = [label for label, count in sync.sketch.counts.counts.items()
+             if count and label.startswith(('genre:', 'provider:')) and label not in set(exact['label'])]
+    assert not stray, f'sketch counts labels the store does not have: {stray[:5]}'
+
+
+def p50(function, *args):
+    return np.median([timed_ms(function, *args)[1] for _ in range(RUNS)])
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'query':>22} {'pandas (ms)':>12} {'numpy (ms)':>11}")
+    sketch_lines = []
+    for n in sizes:
+        catalog = make_catalog(n)
+        store = MovieStore.from_frame(catalog)
+        df = store.frame
+        votes = store.vote_count
+
+        rows = np.arange(store.size)
+        codes, lengths = gather_csr(store.provider_offsets, store.provider_codes, rows)
+        film_rows = np.repeat(rows, lengths)
+        pairs = pd.DataFrame({'provider': codes, 'vote_count': votes[film_rows]}, index=film_rows)
+        dated = np.flatnonzero(store.year > 0)
+        years = pd.Series(store.year[dated], index=dated)
+        year_values, year_index = np.unique(store.year[dated], return_inverse=True)
+
+        queries = {
+            'top 10 films': (lambda: df.sort_values('vote_count', ascending=False, kind='stable').head(10).index.to_numpy(),
+                             lambda: top_k(votes, 10)),
+            'top film per year': (lambda: df.loc[dated].groupby(years)['vote_count'].idxmax().to_numpy(),
+                                  lambda: group_argmax(year_index, votes[dated], dated, len(year_values))[1]),
+            'top film per provider': (lambda: pairs.groupby('provider')['vote_count'].idxmax().to_numpy(),
+                                      lambda: group_argmax(codes, votes[film_rows], film_rows, len(store.provider_names))[1]),
+        }
+        for i, (name, (old, new)) in enumerate(queries.items()):
+            assert np.array_equal(old(), new()), f'{name} disagrees'
+            print(f"{n if i == 0 else '':>10} {name:>22} {p50(old):>12.1f} {p50(new):>11.2f}")
+
+        # Sketch: full ingest, then a delta re-sending 1% of the films with more votes
+        # (written after everything else, as a real update would be)
+        delta = catalog.sample(frac=0.01, random_state=0)
+        replaced = catalog.loc[delta.index]
+        delta = delta.assign(vote_count=delta['vote_count'] * 2 + 1,
+                             timestamp=catalog['timestamp'].max() + pd.Timedelta(seconds=1))
+        start = time.perf_counter()
+        sketch = CatalogSketch().ingest(catalog)
+        ingest = time.perf_counter() - start
+        start = time.perf_counter()
+        sketch.ingest(delta, replaced=replaced)
+        update = time.perf_counter() - start
+        exact = CatalogSketch(exact=True).ingest(catalog).ingest(delta, replaced=replaced)
+
+        labels = sorted(exact.counts.counts)
+        _, answer = timed_ms(sketch.count, labels)
+        count_error = np.max((sketch.count(labels) - exact.count(labels)) / sketch.total)
+        distinct = [(sketch.distinct_films(label), exact.distinct_films(label)) for label in labels]
+        distinct_error = max(abs(estimate - true) / true for estimate, true in distinct if true >= 1000)
+        assert sketch.top_films() == exact.top_films(), 'top films disagree'
+        check_sync_counts(catalog, delta)
+        sketch_lines.append(f"{n:>10} {ingest:>11.2f} {update * 1000:>11.1f} {answer / len(labels) * 1000:>15.1f} "
+                            f"{count_error:>16.5f} {distinct_error:>17.3f}")
+
+    print(f"\n{'rows':>10} {'ingest (s)':>11} {'delta (ms)':>11} {'per label (us)':>15} "
+          f"{'max count err':>16} {'max distinct err':>17}")
+    print('\n'.join(sketch_lines))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
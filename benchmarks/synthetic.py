@@ -0,0 +1,195 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+#------------SYNTHETIC MOVIES CATALOG--------------------------------------------
+# Usage: python benchmarks/synthetic.py rows [out.csv] [--seed N]
+# Builds a DataFrame shaped like `SELECT * FROM movies` (psycopg2 returns text[] as
+# lists and dates as datetime.date), so benchmarks can run at any catalog size, from
+# 10k to 5M rows. The distributions follow the shipped movies.csv: most films have no
+# provider, providers come in bundles (a service and its "with Ads" tier), genre lists
+# are 2-4 long with Action on most films, vote_count is heavy tailed (median ~20,
+# p99 ~15k) and releases cluster in the last years with a thin tail back to 1960.
+# provider_release_dates are all NULL in the shipped export; here a share of the pairs
+# get an arrival day up to 4 months after release, so the arrivals index has work to do.
+# Run as a script it writes the catalog in the format of the Postgres CSV export.
+
+# Genres with their share of films in movies.csv
+GENRE_WEIGHTS = {
+    'Action': 0.93, 'Drama': 0.29, 'Thriller': 0.28, 'Comedy': 0.20, 'Adventure': 0.20,
+    'Crime': 0.19, 'Science Fiction': 0.18, 'Fantasy': 0.12, 'Animation': 0.10, 'Horror': 0.09,
+    'Romance': 0.06, 'Mystery': 0.05, 'Family': 0.05, 'History': 0.04, 'War': 0.04,
+    'TV Movie': 0.02, 'Western': 0.012, 'Music': 0.007, 'Documentary': 0.006
+}
+GENRES = list(GENRE_WEIGHTS)
+
+# Genres per film: share of films with 0, 1, 2, ... genres
+GENRE_COUNTS = [0.0005, 0.08, 0.28, 0.42, 0.16, 0.044, 0.0145, 0.001]
+
+# Provider bundles (always listed together) with their relative frequency
+PROVIDER_BUNDLES = [
+    (('Amazon Prime Video', 'Amazon Prime Video with Ads'), 0.36),
+    (('Netflix', 'Netflix basic with Ads'), 0.23),
+    (('Sun Nxt',), 0.09),
+    (('Disney Plus',), 0.08),
+    (('Sky Go', 'Now TV Cinema'), 0.06),
+    (('Now TV Cinema',), 0.025),
+    (('Crunchyroll Amazon Channel',), 0.025),
+    (('Paramount Plus',), 0.02),
+    (('Kocowa',), 0.017),
+    (('ITVX',), 0.013),
+    (('Now TV',), 0.013),
+    (('Apple TV',), 0.012),
+    (('Shudder', 'Shudder Amazon Channel'), 0.01),
+    (('Channel 4',), 0.007),
+    (('MUBI',), 0.005),
+]
+PROVIDERS = sorted({provider for bundle, _ in PROVIDER_BUNDLES for provider in bundle})
+
+# Provider bundles per film: share of films with 0, 1, 2, 3 bundles
+BUNDLE_COUNTS = [0.70, 0.265, 0.03, 0.005]
+
+WORDS = [
+    'night', 'dark', 'love', 'last', 'day', 'city', 'king', 'dead', 'house', 'girl', 'man',
+    'war', 'secret', 'blood', 'star', 'world', 'lost', 'return', 'game', 'summer', 'shadow',
+    'fire', 'ghost', 'queen', 'storm', 'island', 'road', 'heart', 'wild', 'silent'
+]
+
+# Overviews are cut at random offsets from one long text of made-up words drawn with a
+# Zipf law from a 20k word vocabulary, so their vocabulary looks like real prose
+OVERVIEW_VOCABULARY = 20_000
+OVERVIEW_WORDS = 400_000
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'te', 'vi', 'do', 'fa', 'gu', 'hi', 'jo', 'ba', 'ze', 'pu']
+
+
+# Long text the overviews are cut from
+def _overview_text(rng):
+    syllables = np.asarray(SYLLABLES, dtype=object)
+    parts = syllables[rng.integers(0, len(syllables), size=(OVERVIEW_VOCABULARY, 3))]
+    vocabulary = np.unique(parts[:, 0] + parts[:, 1] + parts[:, 2] + np.char.mod('%d', np.arange(OVERVIEW_VOCABULARY) % 7).astype(object))
+    ranks = np.minimum(rng.zipf(1.3, size=OVERVIEW_WORDS), len(vocabulary)) - 1
+    return ' '.join(vocabulary[ranks])
+
+# Columns exported as Postgres array literals
+ARRAY_COLUMNS = ['genres', 'providers', 'provider_release_dates']
+
+
+# Draw a variable number of labels per row, without repeats inside a row, as CSR arrays
+# (offsets, label codes sorted within each row). Built with array ops only, so it stays
+# fast at millions of rows.
+def _random_codes(rng, n, count_weights, label_weights):
+    counts = rng.choice(len(count_weights), size=n, p=np.asarray(count_weights) / np.sum(count_weights))
+    rows = np.repeat(np.arange(n, dtype=np.int64), counts)
+    labels = rng.choice(len(label_weights), size=len(rows), p=np.asarray(label_weights) / np.sum(label_weights))
+    pairs = np.unique(rows * len(label_weights) + labels)
+    rows, labels = pairs // len(label_weights), pairs % len(label_weights)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+    return offsets, labels
+
+
+# Replace each bundle code by the codes (into PROVIDERS) of its providers, without repeats inside a row
+def _expand_bundles(offsets, codes):
+    members = [[PROVIDERS.index(provider) for provider in bundle] for bundle, _ in PROVIDER_BUNDLES]
+    sizes = np.array([len(bundle) for bundle in members])[codes]
+    flat = np.concatenate([members[code] for code in range(len(members))])
+    starts = np.cumsum([0] + [len(bundle) for bundle in members])[codes]
+    rows = np.repeat(np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)), sizes)
+    providers = flat[np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())]
+    pairs = np.unique(rows * len(PROVIDERS) + providers)
+    provider_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(np.bincount(pairs // len(PROVIDERS), minlength=len(offsets) - 1), out=provider_offsets[1:])
+    return provider_offsets, pairs % len(PROVIDERS)
+
+
+# Python lists out of CSR arrays
+def _lists(offsets, items):
+    flat = list(items)
+    return [flat[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def make_catalog(n, seed=0, today=None, dated_arrivals=0.6):
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(today or 'today').normalize()
+
+    words = np.asarray(WORDS, dtype=object)
+    title_words = words[rng.integers(0, len(words), size=(n, 3))]
+    titles = [' '.join(row).title() + f' {i % 97}' for i, row in enumerate(title_words)]
+    # movies.csv overviews average ~290 characters
+    text = _overview_text(rng)
+    lengths = rng.integers(60, 520, size=n)
+    offsets = rng.integers(0, len(text) - 520, size=n)
+    overviews = [f'{title}: {text[offset:offset + length]}'
+                 for title, offset, length in zip(titles, offsets.tolist(), lengths.tolist())]
+
+    # Releases spread from 2010 to a few weeks ahead, denser towards today, plus 1% back to 1960
+    span = (today - pd.Timestamp('2010-01-01')).days
+    days_back = (span * (1 - rng.power(4, size=n))).astype(np.int64)
+    old = rng.random(n) < 0.01
+    days_back[old] = span + rng.integers(0, (pd.Timestamp('2010-01-01') - pd.Timestamp('1960-01-01')).days, size=old.sum())
+    release = (today + pd.Timedelta(days=30)).to_datetime64().astype('datetime64[D]') - days_back
+    release[rng.random(n) < 0.0005] = np.datetime64('NaT')
+
+    # Heavy tailed vote counts; films without votes have no rating
+    vote_count = np.floor(np.exp(rng.normal(3.05, 2.8, size=n))).clip(0, 40_000).astype(np.int64)
+    vote_average = np.round(rng.normal(6.2, 1.3, size=n).clip(0, 10), 1)
+    vote_average[vote_count == 0] = 0
+
+    genre_offsets, genre_codes = _random_codes(rng, n, GENRE_COUNTS, list(GENRE_WEIGHTS.values()))
+    bundle_offsets, bundle_codes = _random_codes(rng, n, BUNDLE_COUNTS, [weight for _, weight in PROVIDER_BUNDLES])
+    provider_offsets, provider_codes = _expand_bundles(bundle_offsets, bundle_codes)
+    providers = np.asarray(PROVIDERS, dtype=object)[provider_codes]
+    provider_rows = np.repeat(np.arange(n), np.diff(provider_offsets))
+    arrival = release[provider_rows] + rng.integers(0, 120, size=len(provider_rows))
+    arrival[rng.random(len(arrival)) >= dated_arrivals] = np.datetime64('NaT')
+
+    # Loads arrive in batches, so many rows share a write timestamp
+    batches = today - pd.to_timedelta(np.sort(rng.integers(0, 86_400 * 60, size=48)), unit='s')
+
+    posters = np.asarray([f'https://image.tmdb.org/t/p/w500/{i:08d}.jpg' for i in range(n)], dtype=object)
+    overviews = np.asarray(overviews, dtype=object)
+    posters[rng.random(n) < 0.008] = None
+    overviews[rng.random(n) < 0.03] = None
+
+    return pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'movie_id': rng.integers(1, 2_000_000, size=n),
+        'title': titles,
+        'vote_average': vote_average,
+        'vote_count': vote_count,
+        'overview': overviews,
+        'release_date': release.astype(object),
+        'genres': _lists(genre_offsets, np.asarray(GENRES, dtype=object)[genre_codes]),
+        'providers': _lists(provider_offsets, providers),
+        'provider_release_dates': _lists(provider_offsets, arrival.astype(object)),
+        'trending': rng.random(n) < 0.078,
+        'timestamp': batches[rng.integers(0, len(batches), size=n)],
+        'poster_image': posters,
+    })
+
+
+# Postgres array literal of a list (NULL for None)
+def array_literal(values):
+    return '{' + ','.join('NULL' if value is None else '"' + str(value).replace('"', r'\"') + '"'
+                          for value in values) + '}'
+
+
+# Write a catalog in the format of the Postgres CSV export (movies.csv)
+def write_export(path, n, seed=0):
+    catalog = make_catalog(n, seed=seed)
+    for column in ARRAY_COLUMNS:
+        catalog[column] = catalog[column].map(array_literal)
+    catalog.to_csv(path, index=False)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    seed = int(args.pop(args.index('--seed') + 1)) if '--seed' in args else 0
+    args = [arg for arg in args if arg != '--seed']
+    if not args:
+        sys.exit("Usage: python benchmarks/synthetic.py rows [out.csv] [--seed N]")
+    rows = int(args[0])
+    out = args[1] if len(args) > 1 else f'movies_{rows}.csv'
+    write_export(out, rows, seed=seed)
+    print(f"Wrote {rows} films to {out}")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+
+import numpy as np
+
+#------------CANONICAL PROVIDER AND GENRE NAMES----------------------------------
+# The same service reaches the table under several names: plan tiers ("Netflix basic
+# with Ads"), profiles ("Netflix Kids"), the service sold as an Amazon or Apple TV
+# channel ("Shudder Amazon Channel") and spelling variants ("Paramount+", a trailing
+# space). When the store is built, every distinct raw name is looked up once in the alias
+# dictionaries below (ignoring case and spacing). The films' integer codes are then
+# remapped through that small name table, and the duplicates this creates within a film
+# are dropped. All of this runs on the CSR arrays with no per-row Python. Names missing
+# from the dictionaries are kept as they are, with their spacing tidied. Pushdown mode
+# does the same mapping in SQL over the raw names found in the table.
+
+# Canonical provider name -> the other names it is listed under
+PROVIDER_ALIASES = {
+    'Amazon Prime Video': ['Amazon Prime Video with Ads', 'Prime Video'],
+    'Apple TV': ['Apple TV Plus', 'Apple TV+'],
+    'ARROW': ['Arrow Video Amazon Channel', 'Arrow Video'],
+    'BFI Player': ['BFI Player Amazon Channel', 'BFI Player Apple TV Channel'],
+    'Crunchyroll': ['Crunchyroll Amazon Channel'],
+    'CuriosityStream': ['CuriosityStream Amazon Channel', 'CuriosityStream Apple TV Channel'],
+    'Curzon Home Cinema': ['Curzon Amazon Channel'],
+    'Disney Plus': ['Disney+'],
+    'Eros Now': ['Eros Now Amazon Channel'],
+    'FilmBox': ['FilmBox+', 'FilmBox Live Amazon Channel'],
+    'Full Moon': ['Full Moon Amazon Channel'],
+    'Icon Film': ['Icon Film Amazon Channel'],
+    'MGM Plus': ['MGM Plus Amazon Channel', 'MGM+'],
+    'MUBI': ['MUBI Amazon Channel'],
+    'Netflix': ['Netflix basic with Ads', 'Netflix Standard with Ads', 'Netflix Kids'],
+    'Now TV': ['NOW'],
+    'Paramount Plus': ['Paramount+', 'Paramount+ Amazon Channel', 'Paramount Plus Apple TV Channel',
+                       'Paramount+ Apple TV Channel'],
+    'Shout! Factory TV': ['Shout! Factory Amazon Channel'],
+    'Shudder': ['Shudder Amazon Channel', 'Shudder Apple TV Channel'],
+    'Sooner': ['Sooner Amazon Channel'],
+    'Studiocanal Presents': ['Studiocanal Presents Amazon Channel', 'Studiocanal Presents Apple TV Channel'],
+    'Sundance Now': ['Sundance Now Amazon Channel'],
+}
+
+# Canonical genre name -> the other names it is listed under (TMDB's TV and older names)
+GENRE_ALIASES = {
+    'Science Fiction': ['Sci-Fi', 'SciFi', 'Science-Fiction'],
+    'TV Movie': ['TV-Movie', 'Television Movie'],
+    'Music': ['Musical'],
+    'Documentary': ['Documentaries'],
+}
+
+# Providers of the Stream & Chill filter and of the provider charts and arrivals, in display order
+MAIN_PROVIDERS = ['Amazon Prime Video', 'Netflix', 'Disney Plus', 'Apple TV', 'Now TV Cinema', 'Paramount Plus', 'Sky Go']
+CHART_PROVIDERS = [provider for provider in MAIN_PROVIDERS if provider != 'Apple TV']
+
+# Changes whenever the dictionaries do, so stores built with other names get a new version
+ALIASES_FINGERPRINT = int(hashlib.sha1(json.dumps([PROVIDER_ALIASES, GENRE_ALIASES], sort_keys=True)
+                                       .encode('utf-8')).hexdigest()[:12], 16)
+
+
+# Lookup key of a name: case and spacing do not matter
+def _key(name):
+    return ' '.join(str(name).split()).casefold()
+
+
+# Lookup of every listed name (canonical ones too) by its case- and spacing-free key
+def _lookup(aliases):
+    return {_key(name): canonical for canonical, names in aliases.items() for name in [canonical] + names}
+
+
+# Canonical name of each raw name (a loop over the distinct names only)
+def canonical_names(names, aliases):
+    lookup = _lookup(aliases)
+    return np.asarray([lookup.get(_key(name), ' '.join(str(name).split())) for name in names], dtype=object)
+
+
+# Raw names that map to the same canonical names as any of `names`, e.g. for a SQL array overlap
+def raw_variants(raw_names, names, aliases):
+    raw_names = np.asarray(raw_names, dtype=object)
+    return raw_names[np.isin(canonical_names(raw_names, aliases), canonical_names(names, aliases))].tolist()
+
+
+# Code of every name listed for a canonical name among `names` (the names' positions),
+# so lookups by a raw variant find the canonical entry
+def alias_codes(names, aliases):
+    codes = {name: code for code, name in enumerate(names)}
+    for canonical, variants in aliases.items():
+        if canonical in codes:
+            codes.update((variant, codes[canonical]) for variant in variants if variant not in codes)
+    return codes
+
+
+# CSR coded lists with their names made canonical. Entries whose names merge are kept
+# once per row: the one with the lowest `priority` (e.g. the earliest arrival date),
+# the first one on ties. Returns the new offsets, codes and sorted canonical names, plus
+# the positions of the kept entries in the old codes (in row order, so arrays that run
+# parallel to the codes can be cut the same way).
+def canonical_lists(offsets, codes, names, aliases, priority=None):
+    merged, remap = np.unique(canonical_names(names, aliases), return_inverse=True)
+    codes = remap.ravel()[codes].astype(np.int32)
+    size = len(offsets) - 1
+    rows = np.repeat(np.arange(size), np.diff(offsets))
+    positions = np.arange(len(codes))
+    order = np.lexsort((positions, positions if priority is None else priority, codes, rows))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (rows[order][1:] != rows[order][:-1]) | (codes[order][1:] != codes[order][:-1])
+    keep = np.sort(order[first])
+    new_offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[keep], minlength=size), out=new_offsets[1:])
+    return new_offsets, codes[keep], np.asarray(merged, dtype=object), keep
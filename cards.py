@@ -0,0 +1,156 @@
+import html
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from posters import IMAGE_SIZES, poster_cache
+
+#------------MOVIE CARD RENDERER--------------------------------------------------
+# Renders a whole batch of films as one HTML grid (one st.markdown call instead of
+# one per card). Card text is formatted column-wise for the batch, and every card
+# fragment is memoized by (id, data version, card class, template, extra, poster cached)
+# so reruns and other sessions reuse the HTML that was already built. Posters are small
+# lazy-loaded thumbnails (posters.py); a card is built again once its thumbnails are on disk. Cards with details link to
+# ?like=<id>, which shows the films most like that one.
+
+# How many rendered card fragments are kept in memory (least recently used go first)
+MAX_CACHED_CARDS = 20000
+
+CARD_TEMPLATES = {
+    # Trendy Picks cards: providers, rating, overview and genres
+    'details': """<div class="{card_class}">
+    <img src="{poster_src}" srcset="{poster_srcset}" sizes="{image_sizes}" loading="lazy" decoding="async" alt="{title}">
+    <div class="movie-info">
+        <h4>{title}</h4>
+        <p>{providers}</p>
+        <p class="rating">{rating}</p>
+        <details>
+            <summary>More info</summary>
+            <p><strong>Overview:</strong> {overview}</p>
+            <p><strong>Genres:</strong> {genres}</p>
+            <p><a class="more-like-this" href="?like={id}" target="_self">More like this</a></p>
+        </details>
+    </div>
+</div>""",
+    # Stream & Chill cards: the provider matching the filter, release date and rating
+    'filter': """<div class="{card_class}">
+    <img src="{poster_src}" srcset="{poster_srcset}" sizes="{image_sizes}" loading="lazy" decoding="async" alt="{title}">
+    <div class="movie-info">
+        <h4>{title}</h4>
+        <p><b>Provider:</b> {extra}</p>
+        <p><b>Release Date:</b> {release_date}</p>
+        <p class="rating">{rating}</p>
+        <details>
+            <summary>More info</summary>
+            <p>{overview}</p>
+            <p><a class="more-like-this" href="?like={id}" target="_self">More like this</a></p>
+        </details>
+    </div>
+</div>""",
+    # New arrivals: the provider the film arrived on and since when
+    'arrival': """<div class="{card_class}">
+    <img src="{poster_src}" srcset="{poster_srcset}" sizes="{image_sizes}" loading="lazy" decoding="async" alt="{title}">
+    <div class="movie-info">
+        <h4>{title}</h4>
+        <p><b>New on:</b> {extra}</p>
+        <p class="rating">{rating}</p>
+        <details>
+            <summary>More info</summary>
+            <p>{overview}</p>
+            <p><a class="more-like-this" href="?like={id}" target="_self">More like this</a></p>
+        </details>
+    </div>
+</div>""",
+    # Most popular film of each year
+    'year': """<div class="{card_class}">
+    <img src="{poster_src}" srcset="{poster_srcset}" sizes="{image_sizes}" loading="lazy" decoding="async" alt="{title}">
+    <div class="movie-info">
+        <h4>{year}</h4>
+        <p><b>Title:</b> {title}</p>
+        <details>
+            <summary>More info</summary>
+            <p>{overview}</p>
+        </details>
+    </div>
+</div>""",
+}
+
+
+class CardCache:
+
+    def __init__(self, max_cards=MAX_CACHED_CARDS):
+        self.max_cards = max_cards
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            card = self._cards.get(key)
+            if card is not None:
+                self._cards.move_to_end(key)
+            return card
+
+    def put(self, key, card):
+        with self._lock:
+            self._cards[key] = card
+            self._cards.move_to_end(key)
+            while len(self._cards) > self.max_cards:
+                self._cards.popitem(last=False)
+
+
+# Shared by every session of this process
+card_cache = CardCache()
+
+
+# Escape a text column for HTML (line breaks too: a blank line would end the HTML block)
+def _escaped(values):
+    return [html.escape(str(value), quote=True).replace('\n', '<br>') for value in values]
+
+
+# Joined text of a list column, with a placeholder for empty lists
+def _joined(values, empty=''):
+    joined = pd.Series(values).str.join(', ').fillna('')
+    return joined.where(joined != '', empty)
+
+
+# Card text of a batch of films, formatted column by column
+def format_card_columns(films):
+    rating = films['vote_average'].to_numpy(dtype=np.float64)
+    release_date = pd.to_datetime(films['release_date'])
+    posters = [poster_cache.image_sources(url) for url in films['poster_image']]
+    return {
+        'id': [str(int(value)) for value in films['id']],
+        'title': _escaped(films['title']),
+        'overview': _escaped(films['overview']),
+        'poster_src': _escaped([src for src, _ in posters]),
+        'poster_srcset': _escaped([srcset for _, srcset in posters]),
+        'providers': _escaped(_joined(films['providers'], empty='Now Showing')),
+        'genres': _escaped(_joined(films['genres'])),
+        'rating': np.where(rating != 0, np.char.mod('%.1f stars', rating), 'N/A'),
+        'release_date': release_date.dt.strftime('%d/%m/%Y').fillna('N/A').tolist(),
+        'year': release_date.dt.year.astype('Int64').astype(str).tolist(),
+    }
+
+
+# HTML of a batch of films laid out as a grid, in the order given.
+# `extra` holds one optional value per film (e.g. the matching provider) shown by the template.
+def render_cards(films, template, version, card_class="movie-card", columns=4, extra=None):
+    extra = [None] * len(films) if extra is None else list(extra)
+    keys = [(film_id, version, card_class, template, value, poster_cache.cached(url))
+            for film_id, value, url in zip(films['id'], extra, films['poster_image'])]
+    cards = [card_cache.get(key) for key in keys]
+
+    # Only the films not rendered before are formatted
+    missing = [i for i, card in enumerate(cards) if card is None]
+    if missing:
+        columns_text = format_card_columns(films.iloc[missing])
+        for j, i in enumerate(missing):
+            fields = {name: values[j] for name, values in columns_text.items()}
+            cards[i] = CARD_TEMPLATES[template].format(card_class=card_class, extra=html.escape(str(extra[i])),
+                                                       image_sizes=IMAGE_SIZES, **fields)
+            card_cache.put(keys[i], cards[i])
+
+    return (f'<div class="movie-grid" style="grid-template-columns: repeat({columns}, minmax(0, 1fr));">'
+            + ''.join(cards) + '</div>')
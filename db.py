@@ -0,0 +1,143 @@
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import warnings
+
+import pandas as pd
+
+#------------POOLED, RESILIENT QUERY LAYER---------------------------------------
+# Connections are reused from a small pool, checked before use when they have been
+# idle, and a failed query is retried with exponential backoff. A full table read
+# that succeeds is saved as the last-good snapshot on disk, and is what the app
+# falls back to while the database is down. Works with any DB-API `connect`
+# function (psycopg2 in production, sqlite3 as a local stand-in).
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class ConnectionPool:
+
+    # `connect` opens a new DB-API connection; idle connections are health checked
+    # with `SELECT 1` when they have not been used for `check_after` seconds
+    def __init__(self, connect, max_size=4, check_after=30):
+        self.connect = connect
+        self.check_after = check_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    # Borrow a connection: an idle one if it is still alive, a new one otherwise
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise DatabaseUnavailable("No database connection free in the pool")
+        try:
+            while True:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if time.monotonic() - idle_since < self.check_after or self._healthy(conn):
+                    return conn
+                self._close(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    # Give a connection back; broken ones are closed instead of reused
+    def release(self, conn, broken=False):
+        if broken:
+            self._close(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+
+class Database:
+
+    def __init__(self, connect, pool_size=4, retries=3, backoff=0.5, snapshot_path=None):
+        self.pool = ConnectionPool(connect, max_size=pool_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.snapshot_path = snapshot_path
+
+    # Run a query into a DataFrame, retrying with exponential backoff (and a little jitter)
+    def read_frame(self, sql, params=None):
+        for attempt in range(self.retries + 1):
+            conn = None
+            try:
+                conn = self.pool.acquire(timeout=self.backoff * 2 ** self.retries)
+                with warnings.catch_warnings():
+                    # pandas only officially supports SQLAlchemy and sqlite3 connections
+                    warnings.simplefilter('ignore', UserWarning)
+                    df = pd.read_sql(sql, conn, params=params)
+                # End the implicit read transaction, so an idle pooled connection holds no locks
+                conn.rollback()
+                self.pool.release(conn)
+                return df
+            except Exception as e:
+                if conn is not None:
+                    self.pool.release(conn, broken=True)
+                if attempt == self.retries:
+                    raise DatabaseUnavailable(f"Query failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+                logger.warning("Query failed (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay)
+
+    # Full table read that refreshes the snapshot, or falls back to it when the
+    # database is unavailable. Returns (frame, fresh) where fresh is False for the snapshot.
+    def read_with_fallback(self, sql):
+        try:
+            df = self.read_frame(sql)
+        except DatabaseUnavailable:
+            if self.snapshot_path and os.path.exists(self.snapshot_path):
+                logger.warning("Database unavailable, loading the last-good snapshot")
+                return self.load_snapshot(), False
+            raise
+        if self.snapshot_path:
+            self.save_snapshot(df)
+        return df, True
+
+    def save_snapshot(self, df):
+        # Written next to the target and renamed, so a crash never leaves half a snapshot
+        partial = f"{self.snapshot_path}.partial"
+        df.to_pickle(partial)
+        os.replace(partial, self.snapshot_path)
+
+    def load_snapshot(self):
+        return pd.read_pickle(self.snapshot_path)
+
+    # When the snapshot was last written (epoch seconds), None when there is none
+    def snapshot_time(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            return os.path.getmtime(self.snapshot_path)
+        return None
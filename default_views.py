@@ -0,0 +1,51 @@
+import threading
+import time
+
+from posters import poster_cache
+
+#------------MATERIALIZED DEFAULT VIEWS------------------------------------------
+# Most visits land on Trendy Picks, or open Stream & Chill, without touching a widget,
+# so the output of those default views is built once per data version (and day, as
+# the trend windows move with the date) and handed to every session as it is: card
+# HTML, chart figures ready for st.plotly_chart and the first Stream & Chill page with
+# its result count. Serving them costs a dictionary lookup; any other widget value
+# goes through the normal page code. Cards built while their posters were not cached
+# yet point at TMDB's resized images; the views are built again once the thumbnails
+# are on disk, which is checked at most every POSTER_CHECK_INTERVAL seconds.
+
+# Seconds between checks whether the posters of a view have been cached since
+POSTER_CHECK_INTERVAL = 30
+
+
+class MaterializedViews:
+
+    # `build()` returns the views as a dict and the poster URLs their cards show
+    def __init__(self, build, posters=poster_cache):
+        self.build = build
+        self.posters = posters
+        self.builds = 0
+        self._views = None
+        self._poster_urls = []
+        self._complete = False
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _build(self):
+        self._views, self._poster_urls = self.build()
+        self._poster_urls = [url for url in self._poster_urls if isinstance(url, str) and url]
+        self._complete = not self.posters.enabled or all(self.posters.cached(url) for url in self._poster_urls)
+        self._checked = time.monotonic()
+        self.builds += 1
+
+    # The views, built on first use and again when their posters have been cached since
+    def get(self):
+        if self._views is not None and (self._complete or time.monotonic() - self._checked < POSTER_CHECK_INTERVAL):
+            return self._views
+        with self._lock:
+            if self._views is None:
+                self._build()
+            elif not self._complete and time.monotonic() - self._checked >= POSTER_CHECK_INTERVAL:
+                self._checked = time.monotonic()
+                if all(self.posters.cached(url) for url in self._poster_urls):
+                    self._build()
+            return self._views
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from movie_store import STORE_COLUMNS, MovieStore
+from sketches import CatalogSketch
+
+#------------INCREMENTAL SYNC FROM POSTGRES--------------------------------------
+# Keeps the movie store fresh without a cold full reload: only the rows whose
+# `timestamp` moved past the last high-water mark are pulled and merged by `id`.
+# Stale-while-revalidate: readers always get the store they already have, possibly
+# from the saved copy of an earlier run, while the background thread checks it
+# against the database. Deltas cannot see deleted rows, so once the last full read
+# is older than the TTL the whole table is read again, also in the background. A store
+# that did not come from the database at all (the CSV export served while it was down)
+# is never merged into: the first refresh that reaches the database reads the whole table.
+
+logger = logging.getLogger(__name__)
+
+# Full table, used when nothing is held in memory yet
+FULL_QUERY = "SELECT * FROM movies"
+
+# Rows written since the high-water mark. `>=` so rows sharing the last timestamp are
+# fetched again rather than missed; the ones held already (same id and timestamp) are
+# dropped before merging, so a sync with no change upstream rebuilds nothing.
+DELTA_QUERY = "SELECT * FROM movies WHERE timestamp >= %(since)s ORDER BY timestamp"
+
+
+# Replace the rows whose id appears in the delta and append the new ones
+def merge_delta(frame, delta):
+    if delta.empty:
+        return frame
+    delta = delta.drop_duplicates('id', keep='last')
+    kept = frame[~frame['id'].isin(delta['id'])]
+    return pd.concat([kept, delta.reindex(columns=STORE_COLUMNS)], ignore_index=True)
+
+
+# Rows of a delta that the store does not hold as they are: new ids, or a new timestamp
+def changed_rows(store, delta):
+    held = pd.MultiIndex.from_arrays([store.id, store.timestamp])
+    pulled = pd.MultiIndex.from_arrays([
+        pd.to_numeric(delta['id'], errors='coerce').fillna(-1).to_numpy(np.int64),
+        pd.to_datetime(delta['timestamp'], errors='coerce').to_numpy(dtype='datetime64[ns]'),
+    ])
+    return delta[~pulled.isin(held)]
+
+
+class DeltaSync:
+
+    # `database` is a db.Database; its errors propagate to the caller (or the sync loop).
+    # `loaded_at` is when the store was read from the database (epoch seconds, now by
+    # default); a store from an older saved copy is revalidated as soon as the loop starts.
+    # `fallback` marks a store from another source, replaced by a full read once possible.
+    def __init__(self, database, store, interval=900, ttl=86400, loaded_at=None, exact_sketch=False,
+                 fallback=False):
+        self.database = database
+        self.store = store
+        self.fallback = fallback
+        self.interval = interval
+        self.ttl = ttl
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        self.refreshed_at = self.loaded_at
+        self.last_error = None
+        self.exact_sketch = exact_sketch
+        self._sketch = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Latest `timestamp` already held in memory
+    @property
+    def high_water(self):
+        if self.store.size == 0:
+            return None
+        latest = pd.Timestamp(self.store.timestamp.max())
+        return None if pd.isna(latest) else latest.to_pydatetime()
+
+    # Seconds since the data was last checked against the database
+    @property
+    def age(self):
+        return time.time() - self.refreshed_at
+
+    # Running label counts, distinct films and most voted films (sketches.CatalogSketch),
+    # built from the store on first use and then updated with each delta instead of rebuilt
+    @property
+    def sketch(self):
+        with self._lock:
+            if self._sketch is None:
+                self._sketch = CatalogSketch(exact=self.exact_sketch).ingest(self.store.films()[STORE_COLUMNS])
+            return self._sketch
+
+    # Pull the changed rows and swap in a rebuilt store. Returns the number of rows that
+    # changed (0 leaves the store, its version and the sketch as they are). With nothing
+    # in memory yet (the first load failed) the whole table is read instead.
+    def sync_once(self):
+        with self._lock:
+            since = self.high_water
+            if since is None:
+                delta = self.database.read_frame(FULL_QUERY)
+            else:
+                delta = changed_rows(self.store, self.database.read_frame(DELTA_QUERY, params={'since': since}))
+            if delta.empty:
+                return 0
+            current = self.store.films()[STORE_COLUMNS]
+            merged = merge_delta(current, delta)
+            if self._sketch is not None:
+                latest = delta.drop_duplicates('id', keep='last')
+                self._sketch.ingest(latest, replaced=current[current['id'].isin(latest['id'])])
+            # Readers keep using the old store until this single assignment
+            self.store = MovieStore.from_frame(merged)
+            logger.info("Delta sync merged %d rows (version %s)", len(delta), self.store.version)
+            return len(delta)
+
+    # Read the whole table again (which also refreshes the saved copy) and swap it in.
+    # Returns the number of rows read.
+    def reload(self):
+        with self._lock:
+            df = self.database.read_frame(FULL_QUERY)
+            if self.database.snapshot_path:
+                self.database.save_snapshot(df)
+            self._sketch = None
+            self.store = MovieStore.from_frame(df)
+            self.fallback = False
+            self.loaded_at = self.refreshed_at = time.time()
+            logger.info("Full reload read %d rows (version %s)", len(df), self.store.version)
+            return len(df)
+
+    # One background round: a full reload while the store is a fallback or once the last
+    # full read is older than the TTL, a delta sync otherwise
+    def refresh(self):
+        if self.fallback or (self.ttl is not None and time.time() - self.loaded_at >= self.ttl):
+            return self.reload()
+        count = self.sync_once()
+        self.refreshed_at = time.time()
+        return count
+
+    # Run the sync on a background schedule
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='movies-delta-sync', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # Data older than the interval (a saved copy) or from a fallback is revalidated right away
+    def _run(self):
+        wait = 0 if self.fallback or self.age >= self.interval else self.interval
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                logger.exception("Background refresh failed, keeping the current data")
+            wait = self.interval
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from movie_store import gather_csr
+from sketches import group_argmax
+
+#------------YEAR x PROVIDER / YEAR x GENRE FACT COUNTS---------------------------
+# Built once per data version for the Interesting facts page. Every chart there is a
+# slice of these counts, so nothing is exploded or regrouped on a rerun, and memory
+# depends on the vocabulary sizes, not on the length of the lists.
+#   year_provider[y, p]  films released in year y streaming on provider p
+#   year_genre[y, g]     films released in year y tagged with genre g
+#   top_rows[y]          the most voted film of year y
+# The count matrices are a few thousand cells and mostly filled, so they stay dense.
+
+
+# Films per (year, code) of a list column, counting each film once per code
+def _year_counts(offsets, codes, n_codes, rows, year_index, n_years):
+    row_codes, lengths = gather_csr(offsets, codes, rows)
+    cells = np.repeat(year_index, lengths) * n_codes + row_codes
+    return np.bincount(cells, minlength=n_years * n_codes).reshape(n_years, n_codes)
+
+
+class FactsCube:
+
+    def __init__(self, store, first_year=2010):
+        self.version = store.version
+        self.provider_names = store.provider_names
+        self.genre_names = store.genre_names
+        n_providers, n_genres = len(self.provider_names), len(self.genre_names)
+
+        # Films from first_year onwards, grouped by year
+        rows = np.flatnonzero(store.year >= first_year)
+        rows = rows[np.argsort(store.year[rows], kind='stable')]
+        self.years = np.unique(store.year[rows])
+        year_index = np.searchsorted(self.years, store.year[rows])
+        n_years = len(self.years)
+
+        self.year_provider = _year_counts(store.provider_offsets, store.provider_codes, n_providers,
+                                          rows, year_index, n_years)
+        self.year_genre = _year_counts(store.genre_offsets, store.genre_codes, n_genres,
+                                       rows, year_index, n_years)
+
+        # Most voted film per year (ties keep the earliest row, like idxmax)
+        _, self.top_rows = group_argmax(year_index, store.vote_count[rows], rows, n_years)
+
+    # Long table [year, <label>, count] of a (year x code) count matrix, zero cells dropped
+    def _long(self, counts, names, label, keep_names=None, keep_years=None):
+        year_index, codes = np.nonzero(counts)
+        table = pd.DataFrame({'year': self.years[year_index], label: names[codes], 'count': counts[year_index, codes]})
+        if keep_names is not None:
+            table = table[table[label].isin(keep_names)]
+        if keep_years is not None:
+            table = table[table['year'].isin(keep_years)]
+        return table.reset_index(drop=True)
+
+    # Films released each year by provider
+    def films_per_year_by_provider(self, providers=None):
+        return self._long(self.year_provider, self.provider_names, 'providers', providers)
+
+    # Films released each year by genre
+    def films_per_year_by_genre(self, genres=None, years=None):
+        return self._long(self.year_genre, self.genre_names, 'genres', genres, years)
+
+    # Row positions of the most voted film of each year, oldest year first
+    def most_popular_per_year(self):
+        return self.top_rows
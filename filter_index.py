@@ -0,0 +1,127 @@
+import numpy as np
+
+from canonical import GENRE_ALIASES, PROVIDER_ALIASES, alias_codes
+
+#------------BITMAP FILTER ENGINE FOR STREAM & CHILL-----------------------------
+# One packed bitset per provider and per genre, plus rows sorted by year and by
+# rating, so a filter query is a handful of bit operations and binary searches
+# instead of a Python lambda per row.
+
+# Columns with at most this many distinct values get cumulative bitsets, so any range
+# is two bitsets combined; wider columns scatter the sorted rows into a fresh bitset.
+MAX_RANGE_LEVELS = 512
+
+# Keys the filter results can be sorted by (highest / newest first)
+SORT_KEYS = ['vote_count', 'vote_average', 'release_date']
+
+
+# Packed bitset (1 bit per movie) with the given row positions set
+def rows_to_bits(rows, size):
+    mask = np.zeros(size, dtype=bool)
+    mask[rows] = True
+    return np.packbits(mask, bitorder='little')
+
+
+# Row positions (ascending) of the bits that are set
+def bits_to_rows(bits, size):
+    return np.flatnonzero(np.unpackbits(bits, count=size, bitorder='little').view(bool))
+
+
+# One bitset per code of a CSR list column, stacked into a (codes x bytes) matrix
+def _code_bitsets(offsets, codes, n_codes, size):
+    rows = np.repeat(np.arange(size), np.diff(offsets))
+    bitsets = np.zeros((n_codes, (size + 7) // 8), dtype=np.uint8)
+    for code in range(n_codes):
+        bitsets[code] = rows_to_bits(rows[codes == code], size)
+    return bitsets
+
+
+# Row positions ordered by a column, highest (or newest) first, missing dates last
+def _descending_order(values):
+    if values.dtype.kind == 'M':
+        values = values.view(np.int64)
+    return np.argsort(-values.astype(np.float64), kind='stable')
+
+
+# Sorted copy of a numeric column answering inclusive [low, high] range queries as bitsets
+class RangeBitsets:
+
+    def __init__(self, values):
+        self.size = len(values)
+        self.order = np.argsort(values, kind='stable')
+        self.sorted = values[self.order]
+        self.levels, starts = np.unique(self.sorted, return_index=True)
+        self.cumulative = None
+        if len(self.levels) <= MAX_RANGE_LEVELS:
+            # cumulative[k] holds every row whose value is <= levels[k]
+            ends = np.append(starts[1:], self.size)
+            mask = np.zeros(self.size, dtype=bool)
+            self.cumulative = np.zeros((len(self.levels), (self.size + 7) // 8), dtype=np.uint8)
+            for k, (start, end) in enumerate(zip(starts, ends)):
+                mask[self.order[start:end]] = True
+                self.cumulative[k] = np.packbits(mask, bitorder='little')
+
+    def between(self, low, high):
+        if self.cumulative is None:
+            start = np.searchsorted(self.sorted, low, side='left')
+            stop = np.searchsorted(self.sorted, high, side='right')
+            return rows_to_bits(self.order[start:stop], self.size)
+        first = np.searchsorted(self.levels, low, side='left')
+        last = np.searchsorted(self.levels, high, side='right') - 1
+        if last < first:
+            return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        bits = self.cumulative[last].copy()
+        if first > 0:
+            bits &= ~self.cumulative[first - 1]
+        return bits
+
+
+class FilterIndex:
+
+    def __init__(self, store):
+        self.size = store.size
+        self.version = store.version
+        # Raw variants ("Netflix basic with Ads") look up their canonical name's bitset
+        self.provider_codes = alias_codes(store.provider_names, PROVIDER_ALIASES)
+        self.genre_codes = alias_codes(store.genre_names, GENRE_ALIASES)
+        self.provider_bits = _code_bitsets(store.provider_offsets, store.provider_codes, len(store.provider_names), store.size)
+        self.genre_bits = _code_bitsets(store.genre_offsets, store.genre_codes, len(store.genre_names), store.size)
+
+        self.years = RangeBitsets(store.year)
+        self.ratings = RangeBitsets(store.vote_average)
+        self.all_bits = rows_to_bits(np.arange(self.size), self.size)
+
+        # Global sort orders, so a result set is sorted with one pass instead of a sort
+        self.orders = {key: _descending_order(getattr(store, key)) for key in SORT_KEYS}
+
+    # Movies available on any of the providers (or tagged with any of the genres)
+    def any_of(self, bitsets, codes, names):
+        bits = np.zeros_like(self.all_bits)
+        for name in names:
+            if name in codes:
+                bits |= bitsets[codes[name]]
+        return bits
+
+    # Combined Stream & Chill query. A None argument means "no constraint" and an empty
+    # list matches nothing, like the `any(...)` lambdas it replaces. `rows` restricts the
+    # result to candidate positions (e.g. from the title search).
+    def query(self, providers=None, genres=None, years=None, ratings=None, rows=None):
+        bits = self.all_bits.copy()
+        if providers is not None:
+            bits &= self.any_of(self.provider_bits, self.provider_codes, providers)
+        if genres is not None:
+            bits &= self.any_of(self.genre_bits, self.genre_codes, genres)
+        if years is not None:
+            bits &= self.years.between(years[0], years[1])
+        if ratings is not None:
+            bits &= self.ratings.between(ratings[0], ratings[1])
+        if rows is not None:
+            bits &= rows_to_bits(rows, self.size)
+        return bits_to_rows(bits, self.size)
+
+    # Result rows ordered by a sort key: the global order filtered by membership
+    def sort(self, rows, key):
+        member = np.zeros(self.size, dtype=bool)
+        member[rows] = True
+        order = self.orders[key]
+        return order[member[order]]
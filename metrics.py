@@ -0,0 +1,155 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+#------------PER-STAGE TIMING----------------------------------------------------
+# Each stage of a page rerun (load, filter, aggregate, figure, cards) is timed along with
+# the rows it handled and the bytes of HTML it emitted. The registry lives for the whole
+# process and is shared by every session: the last SAMPLES durations of each stage give the
+# p50/p95 shown in the admin view, and running totals are exported in the Prometheus text
+# format (for the node_exporter textfile collector) and as one log line per rerun.
+
+# Durations kept per stage for the percentiles
+SAMPLES = 1000
+
+# Prefix of the exported metric names
+METRIC_PREFIX = 'moviedash_stage'
+
+# Seconds between writes of the metrics file (Prometheus' default scrape interval)
+EXPORT_INTERVAL = 15
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+
+    def __init__(self):
+        self.rows = 0
+        self.html_bytes = 0
+
+
+# Size of an HTML fragment as sent to the browser
+def html_size(html):
+    return len(html.encode('utf-8'))
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StageMetrics:
+
+    def __init__(self, samples=SAMPLES):
+        self._lock = threading.Lock()
+        self._durations = defaultdict(lambda: deque(maxlen=samples))
+        # (page, stage) -> [count, seconds, rows, html bytes]
+        self._totals = defaultdict(lambda: [0, 0.0, 0, 0])
+        # Stages of the rerun running in the current thread (one script thread per session)
+        self._rerun = threading.local()
+        self._exported_at = None
+        self._export_lock = threading.Lock()
+
+    # Time the block as one stage of a page; set `.rows` / `.html_bytes` on the yielded object
+    @contextmanager
+    def stage(self, page, name):
+        stage = Stage()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            self.record(page, name, time.perf_counter() - start, stage.rows, stage.html_bytes)
+
+    def record(self, page, name, seconds, rows=0, html_bytes=0):
+        with self._lock:
+            self._durations[page, name].append(seconds)
+            totals = self._totals[page, name]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += rows
+            totals[3] += html_bytes
+        if not hasattr(self._rerun, 'stages'):
+            self._rerun.stages = []
+        self._rerun.stages.append((page, name, seconds, rows, html_bytes))
+
+    # Log the stages of the rerun that just finished in this thread as one line
+    def end_rerun(self):
+        stages = getattr(self._rerun, 'stages', [])
+        if stages:
+            logger.info("rerun %.1fms %s", sum(stage[2] for stage in stages) * 1000,
+                        ' '.join(f"{page}/{name}={seconds * 1000:.1f}ms,rows={rows},html={html_bytes}B"
+                                 for page, name, seconds, rows, html_bytes in stages))
+        self._rerun.stages = []
+
+    # [page, stage, runs, p50 (ms), p95 (ms), rows, HTML bytes] per stage, rows and bytes per run
+    def summary(self):
+        with self._lock:
+            items = [(key, np.asarray(self._durations[key]) * 1000, list(totals)) for key, totals in self._totals.items()]
+        return pd.DataFrame([{
+            'page': page, 'stage': name, 'runs': count,
+            'p50 (ms)': np.percentile(durations, 50), 'p95 (ms)': np.percentile(durations, 95),
+            'rows/run': rows / count, 'html bytes/run': html_bytes / count,
+        } for (page, name), durations, (count, seconds, rows, html_bytes) in items],
+            columns=['page', 'stage', 'runs', 'p50 (ms)', 'p95 (ms)', 'rows/run', 'html bytes/run'])
+
+    # Prometheus text exposition: a summary of the stage durations plus row and byte counters
+    def prometheus(self):
+        with self._lock:
+            items = [(key, sorted(self._durations[key]), list(totals)) for key, totals in self._totals.items()]
+        lines = [f"# HELP {METRIC_PREFIX}_seconds Time spent in a page stage.",
+                 f"# TYPE {METRIC_PREFIX}_seconds summary"]
+        for (page, name), durations, (count, seconds, _, _) in items:
+            labels = f'page="{_label(page)}",stage="{_label(name)}"'
+            for quantile in (0.5, 0.95):
+                lines.append(f'{METRIC_PREFIX}_seconds{{{labels},quantile="{quantile}"}} '
+                             f'{np.percentile(durations, quantile * 100):.6f}')
+            lines.append(f'{METRIC_PREFIX}_seconds_sum{{{labels}}} {seconds:.6f}')
+            lines.append(f'{METRIC_PREFIX}_seconds_count{{{labels}}} {count}')
+        for index, metric, help_text in [(2, 'rows_total', 'Rows handled by a page stage.'),
+                                         (3, 'html_bytes_total', 'Bytes of HTML emitted by a page stage.')]:
+            lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} counter"]
+            for (page, name), _, totals in items:
+                lines.append(f'{METRIC_PREFIX}_{metric}{{page="{_label(page)}",stage="{_label(name)}"}} {totals[index]}')
+        return '\n'.join(lines) + '\n'
+
+    # Write the Prometheus text to a file, renamed into place so a scrape never sees half of it.
+    # Each writer gets its own temporary file next to the target, so concurrent writes never
+    # truncate each other's; the last rename wins.
+    def write_prometheus(self, path):
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                       prefix=f".{os.path.basename(path)}.", suffix='.partial')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus())
+            # mkstemp creates the file private; the collector may run as another user
+            os.chmod(partial, 0o644)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    # Write the metrics file at most once per interval (called after every rerun). A rerun
+    # that finds another session writing, or the last write too recent, skips the export.
+    def export_prometheus(self, path, interval=EXPORT_INTERVAL):
+        if not self._export_lock.acquire(blocking=False):
+            return False
+        try:
+            now = time.monotonic()
+            if self._exported_at is not None and now - self._exported_at < interval:
+                return False
+            self._exported_at = now
+            self.write_prometheus(path)
+            return True
+        finally:
+            self._export_lock.release()
+
+
+# Shared by every session of this process
+stage_metrics = StageMetrics()
@@ -0,0 +1,281 @@
+import json
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from canonical import ALIASES_FINGERPRINT, GENRE_ALIASES, PROVIDER_ALIASES, canonical_lists
+
+#------------COLUMNAR MOVIE STORE------------------------------------------------
+# The movies table is parsed and typed once per process and then shared read-only
+# by every page, so no page has to reconvert dates or re-split genres/providers.
+# The store is immutable: its arrays are flagged read-only and `frame` hands out a
+# copy-on-write view, so a page that assigns a column changes only its own view and
+# every session keeps sharing the one copy of the data. Provider and genre names are
+# made canonical on the way in (canonical.py), so "Netflix basic with Ads" is Netflix.
+# List columns stay as CSR codes; `films` turns them back into tuples for just the rows
+# a page shows, so the store never holds a Python object per row.
+
+# Columns of the movies table, in the order SELECT * returns them
+STORE_COLUMNS = [
+    'id', 'movie_id', 'title', 'vote_average', 'vote_count', 'overview', 'release_date',
+    'genres', 'providers', 'provider_release_dates', 'trending', 'timestamp', 'poster_image'
+]
+
+# Columns that come out of Postgres as text[] and are kept as integer codes
+LIST_COLUMNS = ['genres', 'providers']
+
+# Store attributes held as plain numeric arrays (saved and memory-mapped as they are)
+NUMERIC_COLUMNS = [
+    'id', 'movie_id', 'release_date', 'year', 'timestamp', 'vote_average', 'vote_count', 'trending',
+    'genre_offsets', 'genre_codes', 'provider_offsets', 'provider_codes',
+    'release_dates_offsets', 'release_dates_codes', 'release_dates_names'
+]
+
+# Values a list column can hold a list as (lists from the database, tuples from `films`)
+LIST_TYPES = (list, tuple, np.ndarray)
+
+# Store attributes held as text, one value per row
+TEXT_COLUMNS = ['title', 'overview', 'poster_image']
+
+# Layout of the saved columns, part of the data version so a store saved by an older
+# layout is rebuilt instead of loaded
+STORE_FORMAT = 2
+
+
+# Split a column of lists into CSR style arrays (offsets into a flat array of codes).
+# A value that is not a list counts as a one-item list, and missing items are dropped.
+def encode_lists(values):
+    lists = [value if isinstance(value, LIST_TYPES) else (value,) for value in pd.Series(values, dtype=object).to_numpy()]
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    flat = np.fromiter(chain.from_iterable(lists), dtype=object, count=int(lengths.sum()))
+    keep = pd.notna(flat)
+    codes, names = pd.factorize(flat[keep], sort=True)
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(np.repeat(np.arange(len(lists)), lengths)[keep], minlength=len(lists)), out=offsets[1:])
+    return offsets, codes.astype(np.int32), np.asarray(names, dtype=object)
+
+
+# Turn CSR arrays back into one tuple per row (used for the card text).
+# Rows with the same combination share a single tuple, so the column costs one pointer
+# per row instead of one new list per row; being a tuple, a shared one cannot be changed.
+def decode_lists(offsets, codes, names):
+    size = len(offsets) - 1
+    lengths = np.diff(offsets)
+    width = max(int(lengths.max()), 1) if size else 1
+    matrix = np.full((size, width), -1, dtype=np.int32)
+    matrix[np.repeat(np.arange(size), lengths), np.arange(len(codes)) - np.repeat(offsets[:-1], lengths)] = codes
+    keys = matrix.view(np.dtype((np.void, width * 4))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    combos = np.empty(len(first), dtype=object)
+    for k, row in enumerate(first):
+        combos[k] = tuple(names[matrix[row][matrix[row] >= 0]].tolist())
+    return combos[inverse.ravel()]
+
+
+# Concatenated CSR entries of several keys (rows), plus how many entries each key has
+def gather_csr(offsets, items, keys):
+    lengths = offsets[keys + 1] - offsets[keys]
+    starts = np.repeat(offsets[keys] - np.cumsum(lengths) + lengths, lengths)
+    return items[starts + np.arange(lengths.sum())], lengths
+
+
+# Text column as a pandas string array ('' for missing), which is Arrow backed when
+# pyarrow is installed, so a value costs its bytes instead of a Python object
+def _text(values):
+    return pd.Series(values).fillna('').astype('str').array
+
+
+# Column as datetime64[ns] (NaT where unparseable); one that is already datetime is only
+# cast, as to_datetime walks it value by value
+def _datetimes(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[ns]')
+    return pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[ns]')
+
+
+# Text values saved as one UTF-8 byte array, each value followed by a NUL byte
+def _save_text(path, values):
+    np.save(path, np.frombuffer(''.join(f'{value}\x00' for value in values).encode('utf-8'), dtype=np.uint8))
+
+
+def _load_text(path):
+    return np.load(path).tobytes().decode('utf-8').split('\x00')[:-1]
+
+
+# Lists of dates (None for unknown) as CSR offsets, codes and the distinct dates (NaT for unknown)
+def encode_dates(values):
+    lists = [value if isinstance(value, LIST_TYPES) else () for value in pd.Series(values, dtype=object).to_numpy()]
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, lists), dtype=np.int64, count=len(lists)), out=offsets[1:])
+    flat = np.fromiter(chain.from_iterable(lists), dtype=object, count=int(offsets[-1]))
+    codes, names = pd.factorize(pd.to_datetime(flat, errors='coerce'), use_na_sentinel=False)
+    return offsets, codes.astype(np.int32), np.asarray(names, dtype='datetime64[ns]')
+
+
+# Content based version id, so caches can be keyed by the data they were built from.
+# The alias dictionaries are part of it, as they change what the same rows are built into.
+def data_version(df):
+    if df.empty:
+        return 'empty'
+    hashed = pd.util.hash_pandas_object(df[['id', 'timestamp']], index=False)
+    return f"{len(df)}-{(int(hashed.sum()) ^ ALIASES_FINGERPRINT ^ STORE_FORMAT) & 0xFFFFFFFFFFFF:012x}"
+
+
+# Providers coded under their canonical names, with the arrival dates (CSR) cut to match.
+# Where two variants of a film's provider merge, the earlier arrival is kept. Rows whose
+# dates do not line up with their providers lose them if the merge changed the count,
+# so they can never line up by accident.
+def canonical_providers(providers, release_dates):
+    offsets, codes, names = encode_lists(providers)
+    date_offsets, date_codes, date_names = encode_dates(release_dates)
+    lengths, date_lengths = np.diff(offsets), np.diff(date_offsets)
+    aligned = lengths == date_lengths
+    days = date_names.astype('datetime64[D]').astype(np.int64)
+    days[np.isnat(date_names)] = np.iinfo(np.int64).max
+    priority = np.full(len(codes), np.iinfo(np.int64).max)
+    priority[np.repeat(aligned, lengths)] = days[date_codes[np.repeat(aligned, date_lengths)]]
+    raw_offsets = offsets
+    offsets, codes, names, keep = canonical_lists(offsets, codes, names, PROVIDER_ALIASES, priority)
+
+    # Aligned rows keep the dates of the providers kept; the others keep all their
+    # dates, or none when they lost a provider
+    rows = np.repeat(np.arange(len(lengths)), date_lengths)
+    kept = ~aligned[rows] & (np.diff(offsets) == lengths)[rows]
+    keep_rows = np.repeat(np.arange(len(lengths)), lengths)[keep]
+    keep = keep[aligned[keep_rows]]
+    keep_rows = keep_rows[aligned[keep_rows]]
+    kept[keep - raw_offsets[keep_rows] + date_offsets[keep_rows]] = True
+    new_date_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[kept], minlength=len(lengths)), out=new_date_offsets[1:])
+    return offsets, codes, names, (new_date_offsets, date_codes[kept], date_names)
+
+
+class MovieStore:
+
+    # Build the store from the raw DataFrame returned by the database
+    @classmethod
+    def from_frame(cls, df):
+        df = df.reindex(columns=STORE_COLUMNS).reset_index(drop=True)
+        store = cls()
+        store.size = len(df)
+        store.version = data_version(df)
+
+        store.id = pd.to_numeric(df['id'], errors='coerce').fillna(-1).to_numpy(np.int64)
+        store.movie_id = pd.to_numeric(df['movie_id'], errors='coerce').fillna(-1).to_numpy(np.int64)
+        store.title = _text(df['title'])
+        store.overview = _text(df['overview'])
+        store.poster_image = _text(df['poster_image'])
+
+        # Dates are parsed once and truncated to the day, ratings are kept compact
+        release_date = pd.to_datetime(df['release_date'], errors='coerce').dt.normalize()
+        store.release_date = release_date.to_numpy(dtype='datetime64[ns]')
+        store.year = release_date.dt.year.fillna(0).to_numpy(np.int16)
+        store.timestamp = _datetimes(df['timestamp'])
+        store.vote_average = pd.to_numeric(df['vote_average'], errors='coerce').fillna(0).to_numpy(np.float32)
+        store.vote_count = pd.to_numeric(df['vote_count'], errors='coerce').fillna(0).to_numpy(np.int32)
+        store.trending = df['trending'].fillna(False).to_numpy(bool)
+
+        # Genres and providers are pre-split into integer codes of their canonical names
+        store.genre_offsets, store.genre_codes, store.genre_names, _ = canonical_lists(
+            *encode_lists(df['genres']), GENRE_ALIASES)
+        (store.provider_offsets, store.provider_codes, store.provider_names,
+         (store.release_dates_offsets, store.release_dates_codes, store.release_dates_names)) = \
+            canonical_providers(df['providers'], df['provider_release_dates'])
+
+        store._frame = store._build_frame()
+        return store._freeze()
+
+    # Save the typed columns as .npy files in a directory, so `load` can memory-map them
+    def save(self, directory, **meta):
+        os.makedirs(directory)
+        for name in NUMERIC_COLUMNS:
+            np.save(os.path.join(directory, f'{name}.npy'), np.asarray(getattr(self, name)))
+        for name in TEXT_COLUMNS + ['genre_names', 'provider_names']:
+            _save_text(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'size': self.size, 'version': self.version, **meta}, f)
+
+    # Store saved by `save`; the numeric columns stay memory-mapped (read-only)
+    @classmethod
+    def load(cls, directory):
+        path = lambda name: os.path.join(directory, f'{name}.npy')
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        store = cls()
+        store.size, store.version = meta['size'], meta['version']
+        for name in NUMERIC_COLUMNS:
+            setattr(store, name, np.load(path(name), mmap_mode='r'))
+        for name in TEXT_COLUMNS:
+            setattr(store, name, _text(_load_text(path(name))))
+        store.genre_names = np.asarray(_load_text(path('genre_names')), dtype=object)
+        store.provider_names = np.asarray(_load_text(path('provider_names')), dtype=object)
+        store._frame = store._build_frame()
+        return store._freeze()
+
+    # Flag every numpy array read-only, so an accidental in-place write raises instead of
+    # silently changing the data of all sessions. A write to a text column of `frame`
+    # only changes that frame's copy, and the list columns are only handed out as tuples,
+    # so no mutable Python object is shared between sessions.
+    def _freeze(self):
+        for name in NUMERIC_COLUMNS + ['genre_names', 'provider_names']:
+            getattr(self, name).setflags(write=False)
+        return self
+
+    # DataFrame over the typed columns for the pages. Each call returns a new shallow view
+    # (no data is copied); with copy-on-write any change to it copies just what it touches.
+    @property
+    def frame(self):
+        return self._frame.copy(deep=False)
+
+    # Films at row positions `rows` (every film when None), as a DataFrame with the columns
+    # of the movies table and `year`. Genres, providers and release dates are decoded into
+    # tuples for these rows only.
+    def films(self, rows=None):
+        rows = np.arange(self.size) if rows is None else np.asarray(rows, dtype=np.int64)
+        films = self._frame.iloc[rows]
+        dates = pd.DatetimeIndex(self.release_dates_names)
+        lists = {
+            'genres': (self.genre_offsets, self.genre_codes, self.genre_names),
+            'providers': (self.provider_offsets, self.provider_codes, self.provider_names),
+            'provider_release_dates': (self.release_dates_offsets, self.release_dates_codes,
+                                       np.where(dates.isna(), None, dates.date.astype(object))),
+        }
+        for column, (offsets, codes, names) in lists.items():
+            items, lengths = gather_csr(offsets, codes, rows)
+            row_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=row_offsets[1:])
+            films[column] = decode_lists(row_offsets, items, names)
+        return films[STORE_COLUMNS + ['year']]
+
+    # DataFrame over the typed columns, built once and shared by the pages
+    def _build_frame(self):
+        year = pd.array(self.year, dtype='Int16')
+        year[self.year == 0] = pd.NA
+        return pd.DataFrame({
+            'id': self.id,
+            'movie_id': self.movie_id,
+            'title': self.title,
+            'vote_average': self.vote_average,
+            'vote_count': self.vote_count,
+            'overview': self.overview,
+            'release_date': self.release_date,
+            'trending': self.trending,
+            'timestamp': self.timestamp,
+            'poster_image': self.poster_image,
+            'year': year,
+        }, copy=False)
+
+    # Row positions of the movies tagged with a genre / available on a provider
+    def genre_rows(self, code):
+        return _rows_with_code(self.genre_offsets, self.genre_codes, code)
+
+    def provider_rows(self, code):
+        return _rows_with_code(self.provider_offsets, self.provider_codes, code)
+
+
+# Map each flat code position back to its row and keep the rows holding the code
+def _rows_with_code(offsets, codes, code):
+    rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return np.unique(rows[codes == code])
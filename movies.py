@@ -1,11 +1,29 @@
+import logging
+import os
+import pickle
+from html import escape as html_escape
 import streamlit as st
 import pandas as pd
-import psycopg2
 from datetime import datetime
-import plotly.express as px
 import plotly.graph_objects as go
-from PIL import Image
-import math
+import plotly.io as pio
+import numpy as np
+from movie_store import STORE_COLUMNS, MovieStore
+from canonical import CHART_PROVIDERS, MAIN_PROVIDERS
+from db import Database, DatabaseUnavailable
+from pushdown import PushdownQueries
+from snapshot import load_csv_store
+from delta_sync import DeltaSync
+import shared_store
+from query_engine import INDEX_BUILDERS, QueryEngine, month_window, week_window
+import aggregates
+from cards import render_cards
+from default_views import MaterializedViews
+from posters import poster_cache
+from sketches import CatalogSketch, top_k
+from metrics import EXPORT_INTERVAL, html_size, stage_metrics
+
+logger = logging.getLogger(__name__)
 
 #---------STREAMLIT PAGE CONFIGURATION (Has to be at the beginning)----------------------------------
 
@@ -14,65 +32,208 @@ st.set_page_config(layout="wide")
 
 #---------------CONNECT AND LOAD DATA FROM THE DATABASE-----------------------------------
 
-# Load environment variables from Streamlit secrets
-db_username = st.secrets["DB_USERNAME"]
-db_password = st.secrets["DB_PASSWORD"]
-db_host = st.secrets["DB_HOST"]
-db_port = st.secrets["DB_PORT"]
-db_name = st.secrets["DB_NAME"]
+# "database" reads the movies table, "snapshot" runs from the movies.csv export (no database needed),
+# "shared" attaches to the data a loader process (shared_store.py) published for every worker
+data_source = st.secrets.get("DATA_SOURCE", "database")
+shared_dir = st.secrets.get("SHARED_DIR", shared_store.SHARED_DIR)
 
-# Connect to the PostgreSQL database
+# Connect to the PostgreSQL database (timeouts keep a slow database from stalling the app).
+# Credentials come from Streamlit secrets and are only needed once a connection is opened.
 def get_connection():
-    try:
-        return psycopg2.connect(
-            database=db_name,
-            user=db_username,
-            password=db_password,
-            host=db_host,
-            port=db_port
-        )
-    except Exception as e:
-        st.error(f"Error connecting to database: {e}")
-        return None
+    import psycopg2  # only needed when a database is used
+    return psycopg2.connect(
+        database=st.secrets["DB_NAME"],
+        user=st.secrets["DB_USERNAME"],
+        password=st.secrets["DB_PASSWORD"],
+        host=st.secrets["DB_HOST"],
+        port=st.secrets["DB_PORT"],
+        connect_timeout=int(st.secrets.get("DB_CONNECT_TIMEOUT", 5)),
+        options=f"-c statement_timeout={int(st.secrets.get('DB_STATEMENT_TIMEOUT_MS', 30000))}"
+    )
+
+# What reading a damaged saved copy of the table raises (e.g. a write cut short)
+SNAPSHOT_ERRORS = (pickle.UnpicklingError, EOFError)
+
+# Pooled connections with retries, falling back to the last-good snapshot on disk
+@st.cache_resource
+def get_database():
+    return Database(
+        get_connection,
+        pool_size=int(st.secrets.get("DB_POOL_SIZE", 4)),
+        snapshot_path=st.secrets.get("SNAPSHOT_PATH", "movies_snapshot.pkl")
+    )
 
-# Load data from the PostgreSQL database
-@st.cache_data
+# Load data from the PostgreSQL database, or its last saved copy when it is unreachable, as
+# (frame, when the saved copy was written or None when fresh, error or None)
 def load_data():
-    conn = get_connection()
-    if conn is None:
-        return pd.DataFrame()
-    query = "SELECT * FROM movies"
-    df = pd.read_sql(query, conn)
-    conn.close()
-    # Ensure the release_date is in datetime format
-    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
-    df['year'] = df['release_date'].dt.year
-    return df
-
-movies_df = load_data()
+    try:
+        df, fresh = get_database().read_with_fallback("SELECT * FROM movies")
+    except DatabaseUnavailable as e:
+        return None, None, e
+    except SNAPSHOT_ERRORS as e:
+        logger.warning("The saved copy of the movies table could not be read: %r", e)
+        return None, None, e
+    return df, (None if fresh else get_database().snapshot_time()), None
+
+# Seconds between checks for new or changed films
+sync_interval = int(st.secrets.get("DELTA_SYNC_INTERVAL", 900))
+# Seconds after which the whole table is read again in the background (deltas miss deleted films)
+data_ttl = int(st.secrets.get("DATA_TTL", 86400))
+
+# "memory" holds the whole table in the process, "pushdown" sends every page query to Postgres
+pushdown_mode = st.secrets.get("QUERY_MODE", "memory") == "pushdown" and data_source == "database"
+
+# Store of the movies.csv export, parsed once and saved as memory-mapped .npy columns,
+# and when the export was written (None when there is no export)
+def load_snapshot_store():
+    csv_path = st.secrets.get("SNAPSHOT_CSV", "movies.csv")
+    if not os.path.exists(csv_path):
+        return MovieStore.from_frame(pd.DataFrame()), None
+    return load_csv_store(csv_path, st.secrets.get("SNAPSHOT_DIR", "movies_snapshot")), os.path.getmtime(csv_path)
+
+# Build the typed columnar store once per process and share it read-only with every session.
+# Stale-while-revalidate: when a saved copy of an earlier full read exists it is served at
+# once and checked against the database in the background, so no visitor waits on Postgres.
+# Only the first start without a saved copy reads the table up front. After that only rows
+# changed since the last sync are pulled, and the whole table again once it is older than the TTL.
+# The CSV export is the last resort when neither the database nor its saved copy can be read:
+# the sync is then marked as a fallback and replaces it with a full read once the database
+# answers, instead of merging deltas into the export. Nothing here writes to the page, as
+# Streamlit would replay it on every cache hit; show_data_notice reports the state instead.
+@st.cache_resource
+def load_store():
+    if data_source != "database":
+        store, exported_at = load_snapshot_store()
+        return DeltaSync(get_database(), store, interval=sync_interval, ttl=data_ttl, loaded_at=exported_at)
+    saved_at, error = get_database().snapshot_time(), None
+    if saved_at is not None:
+        try:
+            df = get_database().load_snapshot()
+        except SNAPSHOT_ERRORS as e:
+            logger.warning("The saved copy of the movies table could not be read: %r", e)
+            error = e
+    else:
+        df, saved_at, error = load_data()
+    if error is not None:
+        store, exported_at = load_snapshot_store()
+        sync = DeltaSync(get_database(), store, interval=sync_interval, ttl=data_ttl,
+                         loaded_at=exported_at, fallback=True)
+        sync.last_error = error
+        return sync.start()
+    return DeltaSync(get_database(), MovieStore.from_frame(df), interval=sync_interval, ttl=data_ttl,
+                     loaded_at=saved_at).start()
+
+# Tell the visitor, once per run, when the films shown do not come from the database
+def show_data_notice(sync):
+    if sync.fallback:
+        st.warning(f"The movie database is not reachable right now ({sync.last_error}), "
+                   "showing the films of the movies.csv export instead.")
+
+# An index of the current data version: the one the loader published in shared mode,
+# built in this process otherwise (or when the loader did not publish it)
+def build_index(name, store, version):
+    index = shared_store.load_index(shared_dir, version, name) if data_source == "shared" else None
+    return INDEX_BUILDERS[name](store) if index is None else index
+
+# Query engine of a data version, shared by every session. Its indexes (bitmap filters,
+# title search, release-day buckets, arrivals, facts cube, "more like this") are each
+# built the first time a page needs them, and again only when the data version changes.
+@st.cache_resource(max_entries=2)
+def load_engine(_store, version):
+    return QueryEngine(_store, build=lambda name, store: build_index(name, store, version))
+
+# Store of a version published in shared mode; its arrays are memory-mapped, so every worker
+# process shares one copy. The previous version stays attached until no page uses it.
+@st.cache_resource(max_entries=2)
+def attach_shared_store(version):
+    return shared_store.attach(shared_dir, version)
+
+# Page queries compiled to SQL, for the pushdown mode
+@st.cache_resource
+def load_pushdown():
+    return PushdownQueries(get_database())
+
+# Version of the table in pushdown mode, checked again every sync interval
+@st.cache_data(ttl=sync_interval)
+def get_pushdown_version():
+    return load_pushdown().data_version()
+
+if pushdown_mode:
+    try:
+        data_version = get_pushdown_version()
+    except DatabaseUnavailable as e:
+        st.error(f"Error connecting to database: {e}")
+        st.stop()
+    pushdown = load_pushdown()
+elif data_source == "shared":
+    # CURRENT is read on every rerun, so a version the loader flips to shows up at once
+    shared_version = shared_store.current_version(shared_dir)
+    if shared_version is None:
+        st.error(f"No movies have been published to {shared_dir} yet (run shared_store.py).")
+        st.stop()
+    with stage_metrics.stage("All pages", "load_data") as stage:
+        movie_store = attach_shared_store(shared_version)
+        stage.rows = movie_store.size
+else:
+    with stage_metrics.stage("All pages", "load_data") as stage:
+        movie_store = load_store().store
+        stage.rows = movie_store.size
+    if data_source == "database":
+        show_data_notice(load_store())
+
+if not pushdown_mode:
+    # Pages take their films from the shared store with movie_store.films(rows), which
+    # decodes only the rows a page shows; nothing a page does to them reaches other sessions
+    data_version = movie_store.version
+
+# Results of the pushdown queries every viewer shares, cached per table version
+@st.cache_data(max_entries=64)
+def query_pushdown(version, name, *args, **kwargs):
+    return getattr(pushdown, name)(*args, **kwargs)
+
+# Query engine of the current data version (memory mode)
+def get_engine():
+    return load_engine(movie_store, data_version)
+
+# Read a static file once per process
+@st.cache_resource
+def read_static_file(file_name, mode='r'):
+    with open(file_name, mode) as f:
+        return f.read()
 
 # Load custom CSS
 def local_css(file_name):
-    with open(file_name) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+    st.markdown(f'<style>{read_static_file(file_name)}</style>', unsafe_allow_html=True)
 
 # Apply custom CSS
 local_css("style.css")
 
+# Disk budget of the poster thumbnails served from static/posters (0 keeps the cards on TMDB's images)
+poster_cache.max_bytes = int(st.secrets.get("POSTER_CACHE_MB", 200)) * 2 ** 20
+
+# Thumbnails of the most voted trending films, queued for a background fetch once per data
+# version so the first visitor after a refresh already gets them from disk
+@st.cache_resource(max_entries=2)
+def prefetch_trending_posters(_store, version, count=100):
+    trending = np.flatnonzero(_store.trending)
+    rows = trending[top_k(_store.vote_count[trending], count)]
+    poster_cache.prefetch(_store.poster_image[rows])
+    return len(rows)
+
+if not pushdown_mode:
+    prefetch_trending_posters(movie_store, data_version)
+
 #------------FUNCTIONS FOR EACH PAGE--------------------------------------------
 
 #------------Trendy Pick Page Functions-----------------------------------------
-# Get the HotPick for Today
+# Get the HotPick for Today (most voted first)
 def get_trendy_films_today():
     today = pd.to_datetime('today').normalize()
-    # Normalize the release_date column to ensure the comparison is done only on the date part
-    movies_df['release_date'] = pd.to_datetime(movies_df['release_date']).dt.normalize()
-    trendy_films = movies_df[movies_df['release_date'] == today]
-
-    if trendy_films.empty:
-        latest_film = movies_df[movies_df['release_date'] < today].sort_values(by='release_date', ascending=False).head(1)
-        return latest_film    
-    return trendy_films
+    if pushdown_mode:
+        films = query_pushdown(data_version, 'window_films', today, today)
+        return films if not films.empty else query_pushdown(data_version, 'latest_before', today, k=1)
+    # Falls back to the latest film released before today
+    return movie_store.films(get_engine().today_rows(today))
 
 # Function to format the date in Trendy Section
 def format_date(date_str):
@@ -87,27 +248,52 @@ def format_date(date_str):
         return date_obj.strftime('%d-%m-%Y')
     return ''
 
-# Function to get trendy films for the week
+# Function to get trendy films for the week (top 10 Popular Films by vote_count)
 def get_trendy_films_week():
-    today = pd.to_datetime('today').normalize()
-    start_of_last_week = today - pd.Timedelta(days=today.weekday() + 7)
-    end_of_last_week = start_of_last_week + pd.Timedelta(days=6)
-    
-    # Filter films released in the past week
-    trendy_films = movies_df[(movies_df['release_date'] >= start_of_last_week) & (movies_df['release_date'] <= end_of_last_week)]
-    
-    # Sort by vote_count and select top 10 Popular Films (vote_count)
-    top_trendy_films = trendy_films.sort_values(by='vote_count', ascending=False).head(10)
-    
-    return top_trendy_films
+    if pushdown_mode:
+        return query_pushdown(data_version, 'window_films', *week_window(), limit=10)
+    return movie_store.films(get_engine().trending_rows('week'))
 
-# Function to get trendy films for the month (make sure are the ones before today)
+# Function to get trendy films for the month (top 10 Popular Films by vote_count)
 def get_trendy_films_month():
-    today = pd.to_datetime('today').normalize()
-    start_of_month = today.replace(day=1)
-    end_of_month = (start_of_month + pd.DateOffset(months=1)) - pd.Timedelta(days=1)
-    trendy_films = movies_df[(movies_df['release_date'] >= start_of_month) & (movies_df['release_date'] <= end_of_month)]
-    return trendy_films
+    if pushdown_mode:
+        return query_pushdown(data_version, 'window_films', *month_window(), limit=10)
+    return movie_store.films(get_engine().trending_rows('month'))
+
+# Genre distribution pie of a trend window, as plotly JSON.
+# Cached across sessions per data version and window, so each viewer gets a cache hit.
+@st.cache_data(max_entries=16)
+def get_genre_pie_json(version, window, window_dates, title):
+    import plotly.express as px  # the slowest plotly module, only imported by the chart builders
+    if pushdown_mode:
+        genre_counts = pushdown.window_genre_counts(*window_dates, limit=10 if window == 'week' else None)
+    else:
+        genre_counts = get_engine().window_genre_counts(window)
+    fig = px.pie(genre_counts, names='genre', values='count', title=title,
+                 labels={'count': 'Count', 'genre': 'Genre'},
+                 hole=0.3)
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    return fig.to_json()
+
+# Whether the data has any provider arrival dates (the new arrivals sections are hidden otherwise)
+def has_arrivals():
+    if pushdown_mode:
+        return query_pushdown(data_version, 'has_arrivals')
+    return get_engine().has_arrivals()
+
+# Films that arrived on any of the providers in the last days (top 10 by vote count),
+# with "provider (date)" labels of their arrival for the cards
+def get_new_arrivals(providers, days=7):
+    if pushdown_mode:
+        today = pd.to_datetime('today').normalize()
+        start = today - pd.Timedelta(days=days - 1)
+        films = query_pushdown(data_version, 'provider_arrivals', tuple(providers), start, today, limit=10)
+        arrivals = films
+    else:
+        arrivals = get_engine().new_arrivals(providers, days=days, limit=10)
+        films = movie_store.films(arrivals['row'])
+    labels = [f"{provider} ({pd.Timestamp(day):%d-%m-%Y})" for provider, day in zip(arrivals['provider'], arrivals['available_from'])]
+    return films, labels
 
 # Get today's date for the trendy Section
 today_date = datetime.now().strftime('%A %d-%m-%Y')
@@ -115,72 +301,254 @@ today_date = datetime.now().strftime('%A %d-%m-%Y')
 # Function to display films in rows for Trendy Section(movie_card_small css))
 def display_films_in_rows(films, card_class="movie-card-small"):
     films = films.head(10)  # Select top 10 films
-    cols = st.columns(5)
-    for i, film in enumerate(films.itertuples()):
-        with cols[i % 5]:
-            st.markdown(f"""
-            <div class="{card_class}">
-                <img src="{film.poster_image}" alt="{film.title}">
-                <div class="movie-info">
-                    <h4>{film.title}</h4>
-                    <p>{format_providers(film.providers)}</p>
-                    <p class="rating">{format_rating(film.vote_average)}</p>
-                    <details>
-                        <summary>More info</summary>
-                        <p><strong>Overview:</strong> {film.overview}</p>
-                        <p><strong>Genres:</strong> {format_genres(film.genres)}</p>
-                    </details>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+    html = render_cards(films, 'details', data_version, card_class, columns=5)
+    st.markdown(html, unsafe_allow_html=True)
+    return html_size(html)
 
 #------------Streaming Filter Page Functions---------------------------------
 
 # Function to display films in styled HTML For Filter Section
-def display_films(films, card_class="movie-card"):
-    for i in range(len(films)):
-        film = films.iloc[i]
-        st.markdown(f"""
-        <div class="{card_class}">
-            <img src="{film['poster_image']}" alt="{film['title']}">
-            <div class="movie-info">
-                <h4>{film['title']}</h4>
-                <p>{format_providers(film['providers'])}</p>
-                <p class="rating">{format_rating(film['vote_average'])}</p>
-                <details>
-                    <summary>More info</summary>
-                    <p><strong>Overview:</strong> {film['overview']}</p>
-                    <p><strong>Genres:</strong> {format_genres(film['genres'])}</p>
-                </details>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+def display_films(films, card_class="movie-card", extra=None):
+    html = render_cards(films, 'filter', data_version, card_class, columns=4, extra=extra)
+    st.markdown(html, unsafe_allow_html=True)
+    return html_size(html)
+
+# Providers shown in the Fun Fact provider charts (canonical names, so every variant counts)
+market_share_providers = CHART_PROVIDERS
+
+# Provider market share donut and most-popular-films bar chart, as plotly JSON.
+# Cached across sessions per data version, so each viewer gets a cache hit.
+@st.cache_data(max_entries=4)
+def get_provider_charts_json(version):
+    import plotly.express as px
+    # Count number of films per provider
+    if pushdown_mode:
+        provider_counts = pushdown.provider_counts(market_share_providers)
+    else:
+        provider_counts, provider_popularity_counts = get_engine().provider_counts(market_share_providers)
+    provider_counts = provider_counts[provider_counts['provider'].isin(market_share_providers)]
+
+    # Create the 3D donut chart
+    fig_donut = go.Figure(data=[go.Pie(
+        labels=provider_counts['provider'],
+        values=provider_counts['count'],
+        hole=.3,
+        hoverinfo="label+percent",
+        textinfo='label+percent',
+        textposition='inside'
+    )])
+
+    # Update layout to hide the legend
+    fig_donut.update_layout(
+        title_text="",
+        showlegend=False
+    )
+
+    # Find the most popular film of each provider (by vote count), then count for every
+    # provider how many of those films it streams
+    if pushdown_mode:
+        provider_popularity_counts = pushdown.top_film_provider_counts(market_share_providers)
+
+    # Create the bar chart
+    fig_bar_popularity = px.bar(
+        provider_popularity_counts,
+        x='provider',
+        y='count',
+        title='',
+        labels={'provider': 'Provider', 'count': 'Number of Most Popular Films'}
+    )
+    return fig_donut.to_json(), fig_bar_popularity.to_json()
+
+# Sort keys and page sizes of the filter results
+results_sort_options = {
+    "Most popular": 'vote_count',
+    "Highest rated": 'vote_average',
+    "Newest": 'release_date'
+}
+results_page_sizes = [20, 40, 80]
+
+# Genre choices and rating bounds of the filter widgets
+def get_filter_options():
+    if pushdown_mode:
+        return query_pushdown(data_version, 'filter_options')
+    return get_engine().filter_options()
+
+# Provider choices of the filter and the ones selected by default
+stream_providers = MAIN_PROVIDERS
+stream_default_providers = MAIN_PROVIDERS
+
+# Number of films matching the filters, with the matching rows and ranked search candidates
+# in memory mode (Postgres counts the matches in pushdown mode, the rows are then None)
+def filter_films(filters, search_query):
+    if pushdown_mode:
+        return pushdown.count_films(search=search_query or None, **filters), None, None
+    # Ranked candidate rows for the search query (typos tolerated), combined with
+    # the other user selections through the bitmap index
+    filtered_rows, search_rows = get_engine().filter_rows(search=search_query or None, **filters)
+    return len(filtered_rows), filtered_rows, search_rows
+
+# Films of one result page in a sort order; only these rows are turned into cards
+def page_films(filters, search_query, filtered_rows, search_rows, sort, page, page_size):
+    if pushdown_mode:
+        return pushdown.films(search=search_query or None, sort=sort, limit=page_size,
+                              offset=(page - 1) * page_size, **filters)
+    return movie_store.films(get_engine().page_rows(filtered_rows, sort, page, page_size, search_rows=search_rows))
+
+# The first selected provider each film is on, shown on its card
+def matching_providers(films, selected_providers):
+    return [next((provider for provider in providers if provider in selected_providers), None)
+            for providers in films['providers']]
+
 # Current Year for the Section Best films per Year
 current_year = datetime.now().year
 
+#------------Interesting Facts Page Functions---------------------------------
+
+# Films per year from 2010 onwards as a [year, <column>, count] table, aggregated by Postgres
+# once per version in pushdown mode (memory mode slices the facts counts instead)
+def get_year_counts(version, column):
+    return query_pushdown(version, 'year_counts', column, first_year=2010)
+
+# Genre and year choices of the genre chart
+@st.cache_data(max_entries=4)
+def get_facts_options(version):
+    if pushdown_mode:
+        year_genre_counts = get_year_counts(version, 'genres')
+        return sorted(year_genre_counts['genres'].unique()), sorted(int(year) for year in year_genre_counts['year'].unique())
+    return get_engine().facts_options()
+
+# Films released each year by provider as a line chart (plotly JSON), cached per selection
+@st.cache_data(max_entries=32)
+def get_films_per_year_chart_json(version, providers):
+    import plotly.express as px
+    if pushdown_mode:
+        year_provider_counts = get_year_counts(version, 'providers')
+        films_per_year_provider = year_provider_counts[year_provider_counts['providers'].isin(providers)]
+    else:
+        films_per_year_provider = get_engine().films_per_year_by_provider(list(providers))
+
+    # Create the line chart
+    fig = px.line(films_per_year_provider, x='year', y='count', color='providers', 
+                title='See how many films each streaming service pops out annually.',
+                labels={'year': 'Year', 'count': 'Number of Films', 'providers': 'Provider'})
+    return fig.to_json()
+
+# Films per year and genre as a grouped bar chart (plotly JSON), cached per selection
+@st.cache_data(max_entries=32)
+def get_genre_year_chart_json(version, genres, years):
+    import plotly.express as px
+    if pushdown_mode:
+        year_genre_counts = get_year_counts(version, 'genres')
+        films_per_genre_year = year_genre_counts[year_genre_counts['genres'].isin(genres) &
+                                                 year_genre_counts['year'].isin(years)]
+    else:
+        films_per_genre_year = get_engine().films_per_year_by_genre(list(genres), list(years))
+
+    # Create the bar chart
+    fig_bar = px.bar(films_per_genre_year, x='year', y='count', color='genres', title='Number of Films in Each Genre per Year',
+                     labels={'year': 'Year', 'count': 'Number of Films', 'genres': 'Genre'}, barmode='group')
+    return fig_bar.to_json()
+
+# Weekly arrivals of the providers as a line chart (plotly JSON), cached per selection
+@st.cache_data(max_entries=32)
+def get_arrivals_chart_json(version, providers):
+    import plotly.express as px
+    if pushdown_mode:
+        arrivals_per_week = pushdown.arrival_timeline(list(providers), freq='W')
+    else:
+        arrivals_per_week = get_engine().arrivals_timeline(list(providers), freq='W')
+
+    # Create the line chart
+    fig = px.line(arrivals_per_week, x='date', y='count', color='provider',
+                  title='Films arriving on each streaming service per week.',
+                  labels={'date': 'Week', 'count': 'Number of Films', 'provider': 'Provider'})
+    return fig.to_json()
+
+#------------Admin Page Functions---------------------------------------------
+
+# Catalog sketch of a version published in shared mode: the loader's own, memory-mapped
+# like the store, or built here once per version when the loader did not publish one
+@st.cache_resource(max_entries=2)
+def load_shared_sketch(_store, version):
+    sketch = shared_store.load_sketch(shared_dir, version)
+    return CatalogSketch().ingest(_store.films()[STORE_COLUMNS]) if sketch is None else sketch
+
+# Films per genre and provider as estimated by the running catalog sketch, next to the
+# exact counts of the loaded data (the sketch is built on the first visit, then kept
+# up to date by the delta sync; in shared mode it comes with the published version)
+def get_sketch_report():
+    sketch = load_shared_sketch(movie_store, data_version) if data_source == "shared" else load_store().sketch
+    all_rows = np.arange(movie_store.size)
+    report = pd.concat([
+        aggregates.genre_counts(movie_store, all_rows).rename(columns={'genre': 'label'}).assign(label=lambda t: 'genre:' + t['label']),
+        aggregates.provider_counts(movie_store, all_rows).rename(columns={'provider': 'label'}).assign(label=lambda t: 'provider:' + t['label']),
+    ], ignore_index=True)
+    report['estimate'] = sketch.count(report['label'])
+    report['distinct films (HLL)'] = [sketch.distinct_films(label) for label in report['label']]
+    return report
+
 #------------Functions used in common-----------------------------------
 
+# A number of seconds as a short age ("40 s", "12 min", "3 h", "2 days")
+def format_age(seconds):
+    for unit, size in [("days", 86400), ("h", 3600), ("min", 60)]:
+        if seconds >= size:
+            return f"{int(seconds // size)} {unit}"
+    return f"{int(seconds)} s"
+
+# Rows of the film with this id and of the 10 films most like it (None if the id is unknown).
+# Cached per data version, so a film shared between viewers is looked up once.
+@st.cache_data(max_entries=256)
+def get_similar_rows(version, film_id):
+    return get_engine().similar_rows(film_id, k=10)
+
 # Function to format the release date in Fun Fact Section
 def format_release_date(date_string):
     return date_string[:10] if date_string else "N/A"
 
-# Function to format rating
-def format_rating(rating):
-    return f"{rating:.1f} stars" if rating else "N/A"
-
-# Function to format genres
-def format_genres(genres):
-    if isinstance(genres, list):
-        return ", ".join(genres)
-    return genres
-
-# Function to format providers
-def format_providers(providers):
-    if not providers:
-        return "Now Showing"
-    if isinstance(providers, list):
-        return ", ".join(providers)
-    return providers
+# Trendy Picks and Stream & Chill as a visitor first sees them, before touching a widget:
+# card HTML, chart figures and the first page of results, with the poster URLs of the cards
+def build_default_views():
+    views, posters = {}, []
+    windows = [('today', get_trendy_films_today()), ('week', get_trendy_films_week()), ('month', get_trendy_films_month())]
+    for window, films in windows:
+        films = films.head(10)
+        views[f'{window}_rows'] = len(films)
+        views[f'{window}_html'] = render_cards(films, 'details', data_version, "movie-card-small", columns=5)
+        posters += list(films['poster_image'])
+    if views['week_rows'] and views['month_rows']:
+        # Figures, so a page view skips parsing the chart JSON
+        views['week_pie'] = pio.from_json(get_genre_pie_json(data_version, 'week', week_window(), 'Genre Distribution This Week'))
+        views['month_pie'] = pio.from_json(get_genre_pie_json(data_version, 'month', month_window(), 'Genre Distribution This Month'))
+
+    views['has_arrivals'] = has_arrivals()
+    if views['has_arrivals']:
+        new_arrivals, arrival_labels = get_new_arrivals(market_share_providers)
+        views['arrivals_rows'] = len(new_arrivals)
+        views['arrivals_html'] = render_cards(new_arrivals, 'arrival', data_version, "movie-card-small", columns=5, extra=arrival_labels)
+        posters += list(new_arrivals['poster_image'])
+
+    genre_options, min_rating, max_rating = views['filter_options'] = get_filter_options()
+    views['stream_filters'] = dict(providers=stream_default_providers, genres=genre_options, years=(2010, current_year),
+                                   ratings=(int(min_rating), int(max_rating)))
+    views['stream_count'], filtered_rows, search_rows = filter_films(views['stream_filters'], '')
+    films = page_films(views['stream_filters'], '', filtered_rows, search_rows, results_sort_options["Most popular"], 1,
+                       results_page_sizes[0])
+    views['stream_page_rows'] = len(films)
+    views['stream_html'] = render_cards(films, 'filter', data_version, "movie-card", columns=4,
+                                        extra=matching_providers(films, stream_default_providers))
+    posters += list(films['poster_image'])
+    views['provider_donut'], views['provider_bar'] = map(pio.from_json, get_provider_charts_json(data_version))
+    return views, posters
+
+# Default views of the current data version, built once for every session (again each day,
+# as the trend windows move, and once the posters of their cards are cached)
+@st.cache_resource(max_entries=2)
+def load_default_views(version, day):
+    return MaterializedViews(build_default_views)
+
+def get_default_views():
+    return load_default_views(data_version, pd.Timestamp('today').normalize()).get()
 
 #---------SIDEBAR SETTINGS-----------------------------------------------------------------
 
@@ -196,7 +564,7 @@ st.markdown("""
 # Sidebar Logo
 logo_path = "logo_moviedash.png"
 # Load the logo image
-logo_image = st.sidebar.image(logo_path, width=300)  # Adjust width and height as needed
+logo_image = st.sidebar.image(read_static_file(logo_path, 'rb'), width=300)  # Adjust width and height as needed
 
 # Sidebar Menu Initialisation
 st.sidebar.markdown('<h2>Grab your popcorn and explore our latest hot picks, streaming options, and movie trivia!</h2>', unsafe_allow_html=True)
@@ -210,10 +578,28 @@ menu_options = {
     "Interesting facts": "🌟 Movies Fun Facts"
 }
 
+# Hidden admin view with the stage latencies, only listed when the URL carries ?admin=<ADMIN_TOKEN>
+admin_token = st.secrets.get("ADMIN_TOKEN")
+if admin_token and st.query_params.get("admin") == admin_token:
+    menu_options["Admin"] = "🛠️ Stage latency"
+
 # Update menu based on selection
 menu = st.sidebar.radio("", list(menu_options.values()))
 st.session_state.menu = [key for key, value in menu_options.items() if value == menu][0]
 
+# Data version shown and, when it is kept in sync, how long ago it was checked against the database
+if pushdown_mode or data_source != "database":
+    st.sidebar.caption(f"Data version {data_version}")
+else:
+    sync = load_store()
+    if sync.fallback:
+        status = f"Data version {data_version}, from the movies.csv export of {format_age(sync.age)} ago"
+    else:
+        status = f"Data version {data_version}, refreshed {format_age(sync.age)} ago"
+    if sync.last_error is not None and not sync.fallback:
+        status += " (the last refresh failed, the data shown may be out of date)"
+    st.sidebar.caption(status)
+
 # Sidebar footer
 st.sidebar.markdown('''
 ---
@@ -222,6 +608,30 @@ Created with ❤️ by [Marta Matias](https://digitalfutures.com).
 Data provided by Justwatch and TMDB
 ''')
 
+#----------------------0) MORE LIKE THIS (opened from a card with ?like=<id>) ------------------
+
+like = st.query_params.get("like")
+if like is not None:
+    if pushdown_mode:
+        st.info("More like this is not available while the pages query the database directly.")
+    elif not like.isdigit() or get_similar_rows(data_version, int(like)) is None:
+        st.warning("That film could not be found in the catalog.")
+    else:
+        with stage_metrics.stage("All pages", "more_like_this") as stage:
+            liked_row, similar_rows = get_similar_rows(data_version, int(like))
+            similar_films = movie_store.films(similar_rows)
+            stage.rows = len(similar_films)
+        st.markdown(f"<h2>More like {html_escape(movie_store.title[liked_row])} 🎞️</h2>", unsafe_allow_html=True)
+        if similar_films.empty:
+            st.write("No similar films found.")
+        else:
+            with stage_metrics.stage("All pages", "more_like_this_cards") as stage:
+                stage.rows = len(similar_films)
+                stage.html_bytes = display_films_in_rows(similar_films)
+    if st.button("Close"):
+        del st.query_params["like"]
+        st.rerun()
+
 #----------------------1) TRENDY SECTION PAGE ------------------------------------------
 
 # Welcome message
@@ -248,12 +658,16 @@ if st.session_state.menu == "Trendy Films": # Display the selected menu content
     st.markdown(f"Discover the top movies released Today (<strong>{today_date}</strong>), freshly popped just for you!", unsafe_allow_html=True)
     st.markdown('<div class="movies-container">', unsafe_allow_html=True)
 
-    trendy_films_today = get_trendy_films_today()
-    if trendy_films_today.empty:
+    # Every section of this page but arrivals on other providers is served from the default views
+    with stage_metrics.stage("Trendy Films", "today_films") as stage:
+        default_views = get_default_views()
+        stage.rows = default_views['today_rows']
+    if default_views['today_rows'] == 0:
         st.write("No trendy films for today.")
     else:
-        trendy_films_today = trendy_films_today.sort_values(by=['vote_count'], ascending=[False])
-        display_films_in_rows(trendy_films_today)
+        with stage_metrics.stage("Trendy Films", "today_cards") as stage:
+            st.markdown(default_views['today_html'], unsafe_allow_html=True)
+            stage.rows, stage.html_bytes = default_views['today_rows'], html_size(default_views['today_html'])
 
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -276,21 +690,43 @@ if st.session_state.menu == "Trendy Films": # Display the selected menu content
     </div>
     """, unsafe_allow_html=True)
     
-    # Fetch and display the weekly/monthly trendy films data based on user selection (week or month)
+    # Display the weekly/monthly trendy films data based on user selection (week or month)
     if selection == "This Week":
         st.markdown("<h2>This Week's Must-Watch Popcorn Flicks 🍿</h2>", unsafe_allow_html=True)
-        trendy_films = get_trendy_films_week()
+        window = 'week'
     else:
         st.markdown("<h2>This Month's Must-Watch Popcorn Flicks 🍿</h2>", unsafe_allow_html=True)
-        trendy_films = get_trendy_films_month()
+        window = 'month'
     
-    if trendy_films.empty:
+    if default_views[f'{window}_rows'] == 0:
         st.write(f"No trendy films for {selection.lower()}.")
     else:
-        # Sort films by vote count in descending order and select top 10
-        trendy_films = trendy_films.sort_values(by=['vote_count'], ascending=[False])
-        display_films_in_rows(trendy_films)
-    
+        # Films already come sorted by vote count, the top 10 are shown
+        with stage_metrics.stage("Trendy Films", "window_cards") as stage:
+            st.markdown(default_views[f'{window}_html'], unsafe_allow_html=True)
+            stage.rows, stage.html_bytes = default_views[f'{window}_rows'], html_size(default_views[f'{window}_html'])
+    
+# New Arrivals Section - films that landed on a streaming service this week-----------
+
+    if default_views['has_arrivals']:
+        st.markdown("<h2>Just Landed on Streaming 📺</h2>", unsafe_allow_html=True)
+        arrival_providers = st.multiselect("Show arrivals on", market_share_providers, default=market_share_providers)
+        with stage_metrics.stage("Trendy Films", "new_arrivals") as stage:
+            if arrival_providers == market_share_providers:
+                arrival_count, html = default_views['arrivals_rows'], default_views['arrivals_html']
+            else:
+                new_arrivals, arrival_labels = get_new_arrivals(arrival_providers)
+                arrival_count = len(new_arrivals)
+            stage.rows = arrival_count
+        if arrival_count == 0:
+            st.write("No new arrivals on these providers this week.")
+        else:
+            with stage_metrics.stage("Trendy Films", "arrival_cards") as stage:
+                if arrival_providers != market_share_providers:
+                    html = render_cards(new_arrivals, 'arrival', data_version, "movie-card-small", columns=5, extra=arrival_labels)
+                st.markdown(html, unsafe_allow_html=True)
+                stage.rows, stage.html_bytes = arrival_count, html_size(html)
+
 # Fun Fact Section (Bottom)-----------------------------------------------------
 
     st.markdown("""
@@ -306,12 +742,8 @@ if st.session_state.menu == "Trendy Films": # Display the selected menu content
     </div>
     """, unsafe_allow_html=True)
     
-    # Fetch the data for the genre distribution
-    trendy_films_week = get_trendy_films_week()
-    trendy_films_month = get_trendy_films_month()
-
     #Display results
-    if trendy_films_week is not None and not trendy_films_week.empty and trendy_films_month is not None and not trendy_films_month.empty:
+    if default_views['week_rows'] and default_views['month_rows']:
         col1, col2 = st.columns(2)
     
         with col1:
@@ -320,25 +752,9 @@ if st.session_state.menu == "Trendy Films": # Display the selected menu content
             <h2>Popping This Week</h2>
             """, unsafe_allow_html=True)
             
-            # Create a list of all genres from the films
-            genres_list_week = []
-            for genres in trendy_films_week['genres']:
-                if isinstance(genres, list):
-                    genres_list_week.extend(genres)
-                elif isinstance(genres, str):
-                    genres_list_week.extend(genres.split(', '))
-            
-            # Create a DataFrame for genres
-            genres_df_week = pd.DataFrame(genres_list_week, columns=['genre'])
-            genre_counts_week = genres_df_week['genre'].value_counts().reset_index()
-            genre_counts_week.columns = ['genre', 'count']
-            
-            # Create a pie chart with percentage and genre type
-            fig_week = px.pie(genre_counts_week, names='genre', values='count', title='Genre Distribution This Week',
-                         labels={'count': 'Count', 'genre': 'Genre'},
-                         hole=0.3)
-            fig_week.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig_week)
+            # The pie chart figure is part of the default views
+            with stage_metrics.stage("Trendy Films", "week_genre_pie"):
+                st.plotly_chart(default_views['week_pie'])
             st.markdown("""
                     </div>
                     """, unsafe_allow_html=True)
@@ -350,25 +766,8 @@ if st.session_state.menu == "Trendy Films": # Display the selected menu content
             <h2>Sizzling This Month</h2>
             """, unsafe_allow_html=True)
             
-            # Create a list of all genres from the films
-            genres_list_month = []
-            for genres in trendy_films_month['genres']:
-                if isinstance(genres, list):
-                    genres_list_month.extend(genres)
-                elif isinstance(genres, str):
-                    genres_list_month.extend(genres.split(', '))
-
-            # Create a DataFrame for genres
-            genres_df_month = pd.DataFrame(genres_list_month, columns=['genre'])
-            genre_counts_month = genres_df_month['genre'].value_counts().reset_index()
-            genre_counts_month.columns = ['genre', 'count']
-            
-            # Create a pie chart with percentage and genre type
-            fig_month = px.pie(genre_counts_month, names='genre', values='count', title='Genre Distribution This Month',
-                         labels={'count': 'Count', 'genre': 'Genre'},
-                         hole=0.3)
-            fig_month.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig_month)
+            with stage_metrics.stage("Trendy Films", "month_genre_pie"):
+                st.plotly_chart(default_views['month_pie'])
             st.markdown("""
                     </div>
                     """, unsafe_allow_html=True)
@@ -377,9 +776,6 @@ if st.session_state.menu == "Trendy Films": # Display the selected menu content
 
 #------------------- 2) STREAMING FILTER PAGE --------------------------------------
 
-# Ensure genres column has no NaN values
-movies_df['genres'] = movies_df['genres'].apply(lambda x: x if isinstance(x, list) else [])
-
 # "Streaming Options" Sidebar Section
 if st.session_state.menu == "Streaming Options":
     st.title("Find Your Perfect Film 🎬")
@@ -394,12 +790,13 @@ if st.session_state.menu == "Streaming Options":
         # Filter options
         selected_providers = st.multiselect(
             "📺 Select Provider",
-            options=['Amazon Prime Video', 'Netflix', 'Disney Plus', 'Apple TV', 'Now TV Cinema', 'Paramount Plus', 'Sky Go'],
-            default=['Netflix', 'Amazon Prime Video', 'Disney Plus', 'Apple TV', 'Now TV Cinema', 'Paramount Plus', 'Sky Go']
+            options=stream_providers,
+            default=stream_default_providers
         )
     
         # Filter options without NaN or empty lists
-        genre_options = movies_df['genres'].explode().dropna().unique().tolist()
+        default_views = get_default_views()
+        genre_options, min_rating, max_rating = default_views['filter_options']
         selected_genres = st.multiselect(
             "🎭 Select Genres",
             options=genre_options,
@@ -417,53 +814,64 @@ if st.session_state.menu == "Streaming Options":
     
         popularity_range = st.slider(
             "📈 Select Popularity Range",
-            min_value=int(movies_df['vote_average'].min()),
-            max_value=int(movies_df['vote_average'].max()),
-            value=(int(movies_df['vote_average'].min()), int(movies_df['vote_average'].max())),
+            min_value=int(min_rating),
+            max_value=int(max_rating),
+            value=(int(min_rating), int(max_rating)),
             format="%d",
             help="Slide to choose between less popular to extremely popular movies based on vote count."
         )
     # Filter results
     with col2:
-        # Filter the dataframe based on the search query
-        if search_query:
-            filtered_movies_df = movies_df[movies_df['title'].str.contains(search_query, case=False, na=False)]
-        else:
-            filtered_movies_df = movies_df.copy()
-    
-        # Further filter the dataframe based on other user selections
-        filtered_movies_df = filtered_movies_df[
-            filtered_movies_df['providers'].apply(lambda x: any(provider in x for provider in selected_providers)) &
-            filtered_movies_df['genres'].apply(lambda x: any(genre in x for genre in selected_genres)) &
-            filtered_movies_df['year'].between(year_filter[0], year_filter[1]) &
-            filtered_movies_df['vote_average'].between(popularity_range[0], popularity_range[1])
-        ]
-    
-        # Display the filtered films in a grid layout
-        if filtered_movies_df.empty:
+        with stage_metrics.stage("Streaming Options", "filter") as stage:
+            filters = dict(providers=selected_providers, genres=selected_genres, years=year_filter, ratings=popularity_range)
+            # The default filters are counted once per data version
+            default_filters = not search_query and filters == default_views['stream_filters']
+            if default_filters:
+                result_count, filtered_rows, search_rows = default_views['stream_count'], None, None
+            else:
+                result_count, filtered_rows, search_rows = filter_films(filters, search_query)
+            stage.rows = result_count
+    
+        # Display the filtered films in a grid layout, one page at a time
+        if result_count == 0:
             st.write("No films match the selected criteria.")
         else:
-            cols = st.columns(4)
-            for i, film in filtered_movies_df.iterrows():
-                # Find the matching provider for the selected provider
-                matching_provider = next((provider for provider in film['providers'] if provider in selected_providers), None)
-                
-                with cols[i % 4]:
-                    st.markdown(f"""
-                    <div class="movie-card">
-                        <img src="{film['poster_image']}" alt="{film['title']}">
-                        <div class="movie-info">
-                            <h4>{film['title']}</h4>
-                            <p><b>Provider:</b> {matching_provider}</p>
-                            <p><b>Release Date:</b> {film['release_date'].strftime('%d/%m/%Y')}</p>
-                                <p class="rating">{format_rating(film.vote_average)}</p>
-                            <details>
-                                <summary>More info</summary>
-                                <p>{film['overview']}</p>
-                            </details>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+            # Sorting and page size options (Best match keeps the search ranking)
+            sort_options = dict(results_sort_options)
+            if search_rows is not None:
+                sort_options = {"Best match": None, **sort_options}
+            sort_col, size_col, page_col = st.columns(3)
+            with sort_col:
+                sort_label = st.selectbox("↕️ Sort by", list(sort_options))
+            with size_col:
+                page_size = st.selectbox("🎞️ Films per page", results_page_sizes)
+            page_count = (result_count + page_size - 1) // page_size
+            with page_col:
+                page = st.number_input("📄 Page", min_value=1, max_value=page_count, value=1, step=1)
+
+            # Only the rows of the visible page are turned into cards; the first page of the
+            # default filters comes ready from the default views
+            default_page = default_filters and (sort_label, page_size, page) == ("Most popular", results_page_sizes[0], 1)
+            with stage_metrics.stage("Streaming Options", "sort_page") as stage:
+                if default_page:
+                    page_rows = default_views['stream_page_rows']
+                else:
+                    if default_filters:
+                        _, filtered_rows, search_rows = filter_films(filters, search_query)
+                    filtered_movies_df = page_films(filters, search_query, filtered_rows, search_rows,
+                                                    sort_options[sort_label], page, page_size)
+                    page_rows = len(filtered_movies_df)
+                stage.rows = page_rows
+            st.caption(f"Showing {(page - 1) * page_size + 1}-{(page - 1) * page_size + page_rows} of {result_count} films")
+
+            # Find the matching provider for the selected provider
+            with stage_metrics.stage("Streaming Options", "cards") as stage:
+                stage.rows = page_rows
+                if default_page:
+                    st.markdown(default_views['stream_html'], unsafe_allow_html=True)
+                    stage.html_bytes = html_size(default_views['stream_html'])
+                else:
+                    stage.html_bytes = display_films(filtered_movies_df, extra=matching_providers(filtered_movies_df, selected_providers))
 
 # Fun Fact in the Streaming Filter Page (Bottom Section)------------------------------------ 
 
@@ -491,35 +899,10 @@ if st.session_state.menu == "Streaming Options":
             <p>Explore the percentage of films available on each provider.</p>
             """, unsafe_allow_html=True)  
         
-        # Filter only the specified providers
-        selected_providers = [
-            'Amazon Prime Video', 'Netflix', 'Disney Plus', 'Now TV Cinema', 'Paramount Plus', 'Sky Go'
-        ]
-        filtered_movies_df = movies_df[movies_df['providers'].apply(lambda x: any(provider in selected_providers for provider in x))]
-
-        # Group by provider and count number of films
-        provider_counts = filtered_movies_df.explode('providers')['providers'].value_counts().reset_index()
-        provider_counts.columns = ['provider', 'count']
-        provider_counts = provider_counts[provider_counts['provider'].isin(selected_providers)]
-
-        # Create the 3D donut chart
-        fig_donut = go.Figure(data=[go.Pie(
-            labels=provider_counts['provider'],
-            values=provider_counts['count'],
-            hole=.3,
-            hoverinfo="label+percent",
-            textinfo='label+percent',
-            textposition='inside'
-        )])
-
-        # Update layout to hide the legend
-        fig_donut.update_layout(
-            title_text="",
-            showlegend=False
-        )
-
-        # Display the chart
-        st.plotly_chart(fig_donut)
+        # Provider counts and charts are part of the default views
+        with stage_metrics.stage("Streaming Options", "provider_charts"):
+            # Display the chart
+            st.plotly_chart(default_views['provider_donut'])
 
     with col2:
         # Most Popular Films by Provider
@@ -529,25 +912,9 @@ if st.session_state.menu == "Streaming Options":
         <p>Explore which provider has the most popular films based on vote count.</p>
         """, unsafe_allow_html=True)  
 
-        # Explode 'providers' column to create separate rows for each provider
-        exploded_movies_df = filtered_movies_df.explode('providers')
-
-        # Find the most popular films by provider based on vote count
-        popular_movies_df = exploded_movies_df.loc[exploded_movies_df.groupby('providers')['vote_count'].idxmax()]
-        provider_popularity_counts = popular_movies_df['providers'].value_counts().reset_index()
-        provider_popularity_counts.columns = ['provider', 'count']
-
-        # Create the bar chart
-        fig_bar_popularity = px.bar(
-            provider_popularity_counts,
-            x='provider',
-            y='count',
-            title='',
-            labels={'provider': 'Provider', 'count': 'Number of Most Popular Films'}
-        )
-
         # Display the chart
-        st.plotly_chart(fig_bar_popularity)
+        with stage_metrics.stage("Streaming Options", "popularity_chart"):
+            st.plotly_chart(default_views['provider_bar'])
 
 
 # -------------3) INTERESTING FACTS PAGE------------------------------------------------------
@@ -557,23 +924,7 @@ elif st.session_state.menu == "Interesting facts":
     st.title("Film Release Trends Over Time")
     st.header("Track the popping number of films released each year from 2010 to the present.")
 
-    # Load the data
-    movies_df = load_data()
-    
 # GRAPHIC 1: Number of films released each year from 2010 to the present------------------------
-    
-    # Filter data from 2010 onwards
-    movies_df['release_date'] = pd.to_datetime(movies_df['release_date'])
-    movies_df = movies_df[movies_df['release_date'].dt.year >= 2010]
-
-    # Extract year from release_date
-    movies_df['year'] = movies_df['release_date'].dt.year
-
-    # Ensure 'providers' is in list format
-    movies_df['providers'] = movies_df['providers'].apply(lambda x: x.split(',') if isinstance(x, str) else x)
-
-    # Explode providers to separate rows
-    movies_df = movies_df.explode('providers')
 
     # Displaying the UI components
     st.subheader("Number of Films Released Each Year by Provider")
@@ -581,50 +932,32 @@ elif st.session_state.menu == "Interesting facts":
     # Multiselect widget for selecting providers
     selected_providers = st.multiselect(
         "Select Providers",
-        ['Amazon Prime Video', 'Netflix', 'Disney Plus', 'Now TV Cinema', 'Paramount Plus', 'Sky Go'],
-        default=['Amazon Prime Video', 'Netflix', 'Disney Plus']
+        market_share_providers,
+        default=market_share_providers[:3]
     )
 
-    # Filter the data based on selected providers
-    films_per_year_provider = movies_df.groupby(['year', 'providers']).size().reset_index(name='count')
-    films_per_year_provider = films_per_year_provider[films_per_year_provider['providers'].isin(selected_providers)]
-
-    # Create the line chart
-    fig = px.line(films_per_year_provider, x='year', y='count', color='providers', 
-                title='See how many films each streaming service pops out annually.',
-                labels={'year': 'Year', 'count': 'Number of Films', 'providers': 'Provider'})
-
-    # Display the chart
-    st.plotly_chart(fig)
+    # Line chart of the selected providers, from the shared chart cache
+    with stage_metrics.stage("Interesting facts", "provider_chart"):
+        st.plotly_chart(pio.from_json(get_films_per_year_chart_json(data_version, tuple(selected_providers))))
     
+    # Weekly arrivals of the same providers, when the data has arrival dates
+    if has_arrivals():
+        st.subheader("New Arrivals per Week by Provider")
+        with stage_metrics.stage("Interesting facts", "arrivals_chart"):
+            st.plotly_chart(pio.from_json(get_arrivals_chart_json(data_version, tuple(selected_providers))))
+
 # GRAPHIC 2: Genre Popularity per Year---------------------------------------------------------------------------  
 
     st.subheader("Genre Popularity per Year: Discover the popularity of different genres of films over the years.")
     
-    # Ensure 'genres' is in list format
-    movies_df['genres'] = movies_df['genres'].apply(lambda x: x.split(',') if isinstance(x, str) else x)
-    
-    # Explode genres to separate rows
-    movies_df = movies_df.explode('genres')
+    # Multiselect for genres and years
+    genre_options, year_options = get_facts_options(data_version)
+    selected_genres = st.multiselect("Select Genres", options=genre_options, default=genre_options)
+    selected_years = st.multiselect("Select Years", options=year_options, default=year_options)
     
-    # Multiselect for genres
-    selected_genres = st.multiselect("Select Genres", options=movies_df['genres'].unique(), default=movies_df['genres'].unique())
-    
-    # Multiselect for years
-    selected_years = st.multiselect("Select Years", options=movies_df['year'].unique(), default=movies_df['year'].unique())
-    
-    # Filter data based on selections
-    filtered_movies = movies_df[(movies_df['genres'].isin(selected_genres)) & (movies_df['year'].isin(selected_years))]
-    
-    # Group by year and genre and count number of films
-    films_per_genre_year = filtered_movies.groupby(['year', 'genres']).size().reset_index(name='count')
-    
-    # Create the bar chart
-    fig_bar = px.bar(films_per_genre_year, x='year', y='count', color='genres', title='Number of Films in Each Genre per Year',
-                     labels={'year': 'Year', 'count': 'Number of Films', 'genres': 'Genre'}, barmode='group')
-    
-    # Display the chart
-    st.plotly_chart(fig_bar)
+    # Bar chart of the selected genres and years, from the shared chart cache
+    with stage_metrics.stage("Interesting facts", "genre_chart"):
+        st.plotly_chart(pio.from_json(get_genre_year_chart_json(data_version, tuple(selected_genres), tuple(selected_years))))
 
     
 # GRAPHIC 3: Popular Film per Year (showed in cards format)-------------------------------------------------------------
@@ -633,26 +966,40 @@ elif st.session_state.menu == "Interesting facts":
     st.subheader("Most Popular Film of Each Year")
     st.write("Find out which film popped to the top each year based on vote count.")
 
-    # Group by year and find the film with the highest vote count
-    most_popular_each_year = movies_df.loc[movies_df.groupby('year')['vote_count'].idxmax()]
-
-    # Display the most popular film of each year in rows with 5 columns each
-    cols = st.columns(8)
-    for i, year in enumerate(most_popular_each_year['year'].unique()):
-        film = most_popular_each_year[most_popular_each_year['year'] == year].iloc[0]
-        with cols[i % 8]:
-            st.markdown(f"""
-            <div class="movie-card">
-                <img src="{film['poster_image']}" alt="{film['title']}">
-                <div class="movie-info">
-                    <h4>{year}</h4>
-                    <p><b>Title:</b> {film['title']}</p>
-                    <details>
-                        <summary>More info</summary>
-                        <p>{film['overview']}</p>
-                    </details>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-    
-
+    # The film with the highest vote count of each year
+    with stage_metrics.stage("Interesting facts", "top_films") as stage:
+        if pushdown_mode:
+            most_popular_each_year = query_pushdown(data_version, 'most_popular_per_year', first_year=2010)
+        else:
+            most_popular_each_year = movie_store.films(get_engine().most_popular_per_year())
+        stage.rows = len(most_popular_each_year)
+
+    # Display the most popular film of each year in rows with 8 columns each
+    with stage_metrics.stage("Interesting facts", "cards") as stage:
+        html = render_cards(most_popular_each_year, 'year', data_version, columns=8)
+        st.markdown(html, unsafe_allow_html=True)
+        stage.rows, stage.html_bytes = len(most_popular_each_year), html_size(html)
+
+# -------------4) ADMIN: STAGE LATENCY (hidden, opened with ?admin=<ADMIN_TOKEN>)--------------
+
+elif st.session_state.menu == "Admin":
+    st.title("Stage latency")
+    st.write("Latency of every page stage over its last runs in this process, with the rows and HTML bytes it handled per run.")
+    st.dataframe(stage_metrics.summary(), hide_index=True)
+    st.subheader("Catalog sketch")
+    if pushdown_mode:
+        st.write("The catalog sketch is kept in memory mode only.")
+    else:
+        st.write("Films per genre and provider from the running count-min and HyperLogLog sketches, next to the exact count.")
+        st.dataframe(get_sketch_report(), hide_index=True)
+    st.subheader("Prometheus export")
+    st.code(stage_metrics.prometheus(), language="text")
+
+#------------------- METRICS EXPORT -------------------------------------------------------
+
+# One log line per rerun, and the Prometheus text file for the node_exporter textfile collector
+# (written at most once per scrape interval, not on every rerun)
+stage_metrics.end_rerun()
+if st.secrets.get("METRICS_PATH"):
+    stage_metrics.export_prometheus(st.secrets["METRICS_PATH"],
+                                    interval=float(st.secrets.get("METRICS_INTERVAL", EXPORT_INTERVAL)))
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+#------------POSTER THUMBNAIL CACHE----------------------------------------------
+# Cards used to embed the full w500 TMDB poster, so a page of cards made the browser
+# pull hundreds of 500px images at once. Posters are now fetched once, resized to
+# small thumbnails and kept as JPEG files under static/posters, which Streamlit serves
+# at app/static/posters/ (server.enableStaticServing). Cards list the thumbnails in a
+# srcset and load them lazily. The folder is a size-bounded LRU shared by every session.
+# A poster that is not cached yet is queued for a background fetch and the card points
+# at TMDB's own resized variants meanwhile, so rendering never waits on the image host.
+
+logger = logging.getLogger(__name__)
+
+# Where thumbnails are written and the URL Streamlit serves that folder at
+POSTER_DIR = os.path.join('static', 'posters')
+POSTER_URL = 'app/static/posters'
+
+# Thumbnail widths in pixels, listed in the srcset of every card
+THUMBNAIL_WIDTHS = [154, 342]
+JPEG_QUALITY = 80
+
+# Width a card image takes on screen, so the browser can pick from the srcset
+IMAGE_SIZES = '(max-width: 768px) 45vw, 200px'
+
+# Disk budget of the thumbnails (least recently used go first)
+MAX_CACHE_BYTES = 200 * 2 ** 20
+
+# Seconds to wait for the image host, and before a failed poster is tried again
+FETCH_TIMEOUT = 5
+RETRY_AFTER = 3600
+FETCH_WORKERS = 4
+
+# TMDB image URLs carry their size in the path (.../t/p/w500/<file>)
+TMDB_SIZE = re.compile(r'/t/p/(w\d+|original)/')
+
+
+class PosterCache:
+
+    # `session` is anything with a requests-like get(); `max_bytes` of 0 turns the cache
+    # off (cards then only use TMDB's resized variants)
+    def __init__(self, directory=POSTER_DIR, url_prefix=POSTER_URL, max_bytes=MAX_CACHE_BYTES,
+                 widths=THUMBNAIL_WIDTHS, session=None, workers=FETCH_WORKERS):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.max_bytes = max_bytes
+        self.widths = widths
+        self.session = session or requests.Session()
+        self.size = 0
+        self._files = OrderedDict()
+        self._pending = set()
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='poster-fetch')
+
+        # Thumbnails kept from an earlier run, least recently written first
+        if os.path.isdir(directory):
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.jpg')]
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                self._files[entry.name] = entry.stat().st_size
+                self.size += entry.stat().st_size
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _name(self, url, width):
+        return f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]}_w{width}.jpg"
+
+    # Whether every thumbnail of a poster is on disk; marks them as recently used
+    def cached(self, url):
+        if not self.enabled or not isinstance(url, str):
+            return False
+        names = [self._name(url, width) for width in self.widths]
+        with self._lock:
+            if not all(name in self._files for name in names):
+                return False
+            for name in names:
+                self._files.move_to_end(name)
+            return True
+
+    # Download a poster and write its thumbnails (never wider than the original)
+    def fetch(self, url):
+        response = self.session.get(url, timeout=FETCH_TIMEOUT)
+        response.raise_for_status()
+        image = Image.open(BytesIO(response.content)).convert('RGB')
+        for width in self.widths:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((width, width * 3))
+            buffer = BytesIO()
+            thumbnail.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            self._write(self._name(url, width), buffer.getvalue())
+
+    # Write a thumbnail (renamed into place, so a half-written file is never served)
+    # and evict the least recently used ones over the budget
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(f"{path}.partial", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.partial", path)
+        with self._lock:
+            self.size += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            evicted = []
+            while self.size > self.max_bytes and len(self._files) > 1:
+                old, size = self._files.popitem(last=False)
+                self.size -= size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+    # Queue the posters that are not cached yet for a background fetch
+    def prefetch(self, urls):
+        if not self.enabled:
+            return
+        for url in urls:
+            if not isinstance(url, str) or not url.startswith('http') or self.cached(url):
+                continue
+            with self._lock:
+                if url in self._pending or time.time() - self._failed.get(url, 0) < RETRY_AFTER:
+                    continue
+                self._pending.add(url)
+            self._executor.submit(self._fetch_queued, url)
+
+    def _fetch_queued(self, url):
+        try:
+            self.fetch(url)
+        except Exception as e:
+            logger.warning("Poster %s could not be fetched: %s", url, e)
+            with self._lock:
+                self._failed[url] = time.time()
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    # Wait until the queued fetches are done (benchmarks)
+    def wait(self, timeout=60):
+        deadline = time.time() + timeout
+        while self._pending and time.time() < deadline:
+            time.sleep(0.05)
+
+    # src and srcset of a poster's <img>: the local thumbnails when cached, TMDB's own
+    # resized variants otherwise (the poster is queued for fetching then)
+    def image_sources(self, url):
+        if not isinstance(url, str) or not url:
+            return '', ''
+        if self.cached(url):
+            sources = [(f"{self.url_prefix}/{self._name(url, width)}", width) for width in self.widths]
+        elif TMDB_SIZE.search(url):
+            self.prefetch([url])
+            sources = [(TMDB_SIZE.sub(f'/t/p/w{width}/', url), width) for width in self.widths]
+        else:
+            self.prefetch([url])
+            return url, ''
+        return sources[0][0], ', '.join(f"{source} {width}w" for source, width in sources)
+
+
+# Shared by every session of this process
+poster_cache = PosterCache()
@@ -0,0 +1,270 @@
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from canonical import GENRE_ALIASES, PROVIDER_ALIASES, canonical_names, raw_variants
+from search_index import query_words
+
+#------------QUERY PUSHDOWN TO POSTGRES------------------------------------------
+# The alternative to holding the whole movies table in the process: every question a
+# page asks is compiled into one parameterized query, so only the result rows (or a
+# small aggregate table) cross the wire. Providers/genres are matched with array
+# overlap (`&&`) and years with plain date ranges, which Postgres can serve from
+#   CREATE INDEX ON movies USING gin (providers);
+#   CREATE INDEX ON movies USING gin (genres);
+#   CREATE INDEX ON movies (release_date, vote_count DESC);
+# The table keeps the raw provider/genre names. Filters are widened to every raw variant
+# of the asked canonical names, group-bys map each raw name to its canonical one (once
+# per film), and the list columns of returned rows are made canonical like the store's.
+
+# ORDER BY of each results sort key; ties are broken by id so pages never overlap
+SORT_SQL = {
+    'vote_count': 'vote_count DESC NULLS LAST, id',
+    'vote_average': 'vote_average DESC NULLS LAST, id',
+    'release_date': 'release_date DESC NULLS LAST, id',
+}
+
+# List columns that the per-year counts can be broken down by
+YEAR_COUNT_COLUMNS = ['providers', 'genres']
+
+# date_trunc unit of each arrivals timeline bucket (same keys as arrivals.TIMELINE_FREQS)
+TIMELINE_UNITS = {'D': 'day', 'W': 'week', 'M': 'month'}
+
+# Alias dictionary of each list column
+LIST_ALIASES = {'providers': PROVIDER_ALIASES, 'genres': GENRE_ALIASES}
+
+# Seconds the distinct raw names of a list column are reused before they are read again
+RAW_NAMES_TTL = 60
+
+# (provider, available_from) pairs of every film. Like ArrivalIndex, only rows with one
+# date per provider are used, since unnest pads the shorter array with NULLs.
+ARRIVALS_SQL = ("{table}, unnest(providers, provider_release_dates) AS arrival(provider, available_from) "
+                "WHERE cardinality(providers) = cardinality(provider_release_dates)")
+
+
+# WHERE clause and parameters of a Stream & Chill query. Same rules as FilterIndex.query:
+# None means "no constraint" and an empty list matches nothing. The title search is a
+# case-insensitive match of every query word (no typo tolerance, unlike SearchIndex).
+def filter_clause(providers=None, genres=None, years=None, ratings=None, search=None):
+    conditions, params = ['TRUE'], {}
+    if providers is not None:
+        conditions.append('providers && %(providers)s::text[]')
+        params['providers'] = list(providers)
+    if genres is not None:
+        conditions.append('genres && %(genres)s::text[]')
+        params['genres'] = list(genres)
+    if years is not None:
+        conditions.append('release_date >= %(year_start)s AND release_date < %(year_end)s')
+        params['year_start'], params['year_end'] = date(int(years[0]), 1, 1), date(int(years[1]) + 1, 1, 1)
+    if ratings is not None:
+        conditions.append('vote_average BETWEEN %(rating_low)s AND %(rating_high)s')
+        params['rating_low'], params['rating_high'] = float(ratings[0]), float(ratings[1])
+    if search:
+        # Like SearchIndex, a query with no searchable words matches nothing (ALL over no
+        # patterns would be true for every title)
+        words = query_words(search)
+        if words:
+            conditions.append('title ILIKE ALL(%(title_patterns)s)')
+            params['title_patterns'] = ['%' + word.replace('_', r'\_') + '%' for word in words]
+        else:
+            conditions.append('FALSE')
+    return ' AND '.join(conditions), params
+
+
+# A film's providers and arrival dates under canonical names, merged the way MovieStore
+# merges them: each name once, with its earliest arrival; dates that do not line up with
+# the providers are dropped if the merge changed the count
+def _canonical_providers(providers, dates, names):
+    if not isinstance(providers, list):
+        return providers, dates
+    aligned = isinstance(dates, list) and len(dates) == len(providers)
+    first = {}
+    for provider, day in zip(providers, dates if aligned else [None] * len(providers)):
+        name = names[provider]
+        if name not in first or (day is not None and (first[name] is None or day < first[name])):
+            first[name] = day
+    if len(first) == len(providers):
+        return list(first), dates
+    return list(first), list(first.values()) if aligned else None
+
+
+# Genre and provider lists of returned film rows under canonical names. These are pages
+# of results, small enough that mapping each row's list beats building CSR arrays.
+def canonical_rows(df):
+    if df.empty:
+        return df
+    names = {column: set().union(*(value for value in df[column] if isinstance(value, list)))
+             for column in LIST_ALIASES}
+    names = {column: dict(zip(raw, canonical_names(raw, LIST_ALIASES[column]))) for column, raw in names.items()}
+    df['genres'] = [list(dict.fromkeys(names['genres'][genre] for genre in genres)) if isinstance(genres, list)
+                    else genres for genres in df['genres']]
+    providers, dates = zip(*(_canonical_providers(providers, dates, names['providers'])
+                             for providers, dates in zip(df['providers'], df['provider_release_dates'])))
+    df['providers'], df['provider_release_dates'] = list(providers), list(dates)
+    return df
+
+
+# Window [start, end] of release days as query parameters
+def _window(start, end):
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    return {'start': start.date(), 'end': (end + pd.Timedelta(days=1)).date()}
+
+
+class PushdownQueries:
+
+    # `database` is a db.Database; `table` only changes for benchmarks
+    def __init__(self, database, table='movies'):
+        self.database = database
+        self.table = table
+        self._raw_names = {}
+
+    def _read(self, sql, params=None):
+        return self.database.read_frame(sql.format(table=self.table), params=params)
+
+    # Film rows with their genres and providers under canonical names
+    def _read_films(self, sql, params=None):
+        return canonical_rows(self._read(sql, params))
+
+    # Distinct raw names of a list column, read again every RAW_NAMES_TTL seconds
+    def raw_names(self, column):
+        read_at, names = self._raw_names.get(column, (0.0, None))
+        if names is None or time.monotonic() - read_at > RAW_NAMES_TTL:
+            names = self._read(f"SELECT DISTINCT unnest({column}) AS name FROM {{table}} ORDER BY name")
+            names = names['name'].dropna().tolist()
+            self._raw_names[column] = (time.monotonic(), names)
+        return names
+
+    # Raw names matching any of the canonical names of a list column (the names themselves too)
+    def variants(self, column, names):
+        return sorted(set(names) | set(raw_variants(self.raw_names(column), names, LIST_ALIASES[column])))
+
+    # SQL expression of the canonical name of the raw name `expr` of a list column, and its parameters
+    def canonical_sql(self, column, expr):
+        raw = self.raw_names(column)
+        return (f"coalesce((%({column}_canonical)s::text[])[array_position(%({column}_raw)s::text[], {expr})], {expr})",
+                {f'{column}_raw': raw, f'{column}_canonical': canonical_names(raw, LIST_ALIASES[column]).tolist()})
+
+    # FROM item with one `name` row per distinct canonical name of a film's list column
+    def canonical_unnest(self, column, films='{table}'):
+        name, params = self.canonical_sql(column, 'raw_name')
+        return f"LATERAL (SELECT DISTINCT {name} AS name FROM unnest({films}.{column}) AS raw_name) AS names", params
+
+    # filter_clause with the provider and genre filters widened to their raw variants
+    def _filter_clause(self, providers=None, genres=None, **filters):
+        return filter_clause(providers=None if providers is None else self.variants('providers', providers),
+                             genres=None if genres is None else self.variants('genres', genres), **filters)
+
+    # Cheap change marker of the table (row count and latest write), used as the cache
+    # key of everything derived from it, like MovieStore.version in memory mode
+    def data_version(self):
+        row = self._read("SELECT count(*) AS size, max(timestamp) AS latest FROM {table}").iloc[0]
+        return f"pg-{row['size']}-{row['latest']}"
+
+    # Number of films matching the Stream & Chill filters
+    def count_films(self, **filters):
+        where, params = self._filter_clause(**filters)
+        return int(self._read(f"SELECT count(*) AS total FROM {{table}} WHERE {where}", params)['total'].iloc[0])
+
+    # One page of the films matching the filters, ordered by a sort key
+    def films(self, sort='vote_count', limit=None, offset=0, **filters):
+        where, params = self._filter_clause(**filters)
+        params.update(limit=limit, offset=offset)
+        return self._read_films(f"SELECT * FROM {{table}} WHERE {where} ORDER BY {SORT_SQL[sort]} "
+                                "LIMIT %(limit)s OFFSET %(offset)s", params)
+
+    # Films released in [start, end], most voted first (LIMIT NULL returns them all)
+    def window_films(self, start, end, limit=None):
+        return self._read_films("SELECT * FROM {table} WHERE release_date >= %(start)s AND release_date < %(end)s "
+                                "ORDER BY vote_count DESC NULLS LAST, id LIMIT %(limit)s",
+                                {**_window(start, end), 'limit': limit})
+
+    # Top-k films of the latest release day before a date (the "today" fallback)
+    def latest_before(self, day, k=1):
+        return self._read_films("SELECT * FROM {table} WHERE release_date = "
+                                "(SELECT max(release_date) FROM {table} WHERE release_date < %(start)s) "
+                                "ORDER BY vote_count DESC NULLS LAST, id LIMIT %(limit)s",
+                                {'start': _window(day, day)['start'], 'limit': k})
+
+    # Genre counts of the top `limit` films of a window, as a [genre, count] table
+    def window_genre_counts(self, start, end, limit=None):
+        genres, params = self.canonical_unnest('genres', 'films')
+        return self._read("SELECT name AS genre, count(*) AS count FROM "
+                          "(SELECT genres FROM {table} WHERE release_date >= %(start)s AND release_date < %(end)s "
+                          f"ORDER BY vote_count DESC NULLS LAST, id LIMIT %(limit)s) AS films, {genres} "
+                          "GROUP BY name ORDER BY count DESC, name",
+                          {**_window(start, end), 'limit': limit, **params})
+
+    # Genre choices and rating bounds of the Stream & Chill widgets
+    def filter_options(self):
+        genres = np.unique(canonical_names(self.raw_names('genres'), GENRE_ALIASES)).tolist()
+        bounds = self._read("SELECT min(vote_average) AS low, max(vote_average) AS high FROM {table}").iloc[0]
+        return genres, bounds['low'], bounds['high']
+
+    # Films per provider among the films on any of the providers, as a [provider, count] table
+    def provider_counts(self, providers):
+        names, params = self.canonical_unnest('providers')
+        return self._read(f"SELECT name AS provider, count(*) AS count FROM {{table}}, {names} "
+                          "WHERE providers && %(providers)s::text[] GROUP BY name ORDER BY count DESC, name",
+                          {'providers': self.variants('providers', providers), **params})
+
+    # Take the most voted film of every provider (among the films on any of the providers),
+    # then count for every provider how many of those films it streams
+    def top_film_provider_counts(self, providers):
+        names, params = self.canonical_unnest('providers')
+        top_names, _ = self.canonical_unnest('providers', 'top_films')
+        return self._read("SELECT name AS provider, count(*) AS count FROM "
+                          f"(SELECT DISTINCT ON (name) providers FROM {{table}}, {names} "
+                          "WHERE providers && %(providers)s::text[] "
+                          "ORDER BY name, vote_count DESC NULLS LAST, id) AS top_films, "
+                          f"{top_names} GROUP BY name ORDER BY count DESC, name",
+                          {'providers': self.variants('providers', providers), **params})
+
+    # Films released each year by provider or genre from first_year on, as a long
+    # [year, <column>, count] table
+    def year_counts(self, column, first_year=2010):
+        if column not in YEAR_COUNT_COLUMNS:
+            raise ValueError(f"Unknown list column {column!r}")
+        names, params = self.canonical_unnest(column)
+        return self._read(f"SELECT EXTRACT(YEAR FROM release_date)::int AS year, name AS {column}, count(*) AS count "
+                          f"FROM {{table}}, {names} WHERE release_date >= %(start)s "
+                          "GROUP BY 1, 2 ORDER BY 1, 2", {'start': date(first_year, 1, 1), **params})
+
+    # The most voted film of each year from first_year on, oldest year first
+    def most_popular_per_year(self, first_year=2010):
+        return self._read_films("SELECT DISTINCT ON (EXTRACT(YEAR FROM release_date)) * FROM {table} "
+                                "WHERE release_date >= %(start)s "
+                                "ORDER BY EXTRACT(YEAR FROM release_date), vote_count DESC NULLS LAST, id",
+                                {'start': date(first_year, 1, 1)})
+
+    # Whether any film has a provider arrival date at all
+    def has_arrivals(self):
+        return bool(self._read(f"SELECT EXISTS (SELECT 1 FROM {ARRIVALS_SQL} AND available_from IS NOT NULL) AS found")
+                    ['found'].iloc[0])
+
+    # FROM item with the earliest arrival of every film on each of the providers, as
+    # `provider` (canonical name) and `available_from` next to the asked film columns.
+    # Like the store, a film that arrived on several variants of a provider counts once.
+    def _first_arrivals(self, providers, columns='id'):
+        name, params = self.canonical_sql('providers', 'provider')
+        return (f"(SELECT DISTINCT ON (id, {name}) {columns}, {name} AS provider, available_from "
+                f"FROM {ARRIVALS_SQL} AND provider = ANY(%(providers)s) AND available_from IS NOT NULL "
+                f"ORDER BY id, {name}, available_from) AS first_arrivals",
+                {'providers': self.variants('providers', providers), **params})
+
+    # Films that arrived on any of the providers in [start, end], most voted first, with the
+    # first of those providers each film arrived on (`provider`, `available_from` columns)
+    def provider_arrivals(self, providers, start, end, limit=None):
+        arrivals, params = self._first_arrivals(providers, columns='{table}.*')
+        return self._read_films(f"SELECT * FROM (SELECT DISTINCT ON (id) * FROM {arrivals} "
+                                "WHERE available_from >= %(start)s AND available_from < %(end)s "
+                                "ORDER BY id, available_from) AS arrivals "
+                                "ORDER BY vote_count DESC NULLS LAST, id LIMIT %(limit)s",
+                                {**_window(start, end), 'limit': limit, **params})
+
+    # Arrivals per provider and period as a long [date, provider, count] table
+    def arrival_timeline(self, providers, freq='W'):
+        arrivals, params = self._first_arrivals(providers)
+        return self._read(f"SELECT date_trunc('{TIMELINE_UNITS[freq]}', available_from)::date AS date, provider, "
+                          f"count(*) AS count FROM {arrivals} GROUP BY 1, 2 ORDER BY 2, 1", params)
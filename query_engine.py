@@ -0,0 +1,172 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+from arrivals import ArrivalIndex
+from facts_cube import FactsCube
+from filter_index import FilterIndex
+from search_index import SearchIndex
+from similar import SimilarityIndex
+from trends import TrendIndex
+
+#------------HEADLESS QUERY ENGINE-----------------------------------------------
+# Everything the pages ask of the data, with no Streamlit in it: trend windows, the
+# Stream & Chill filters, search and sorting, the facts aggregates, new arrivals and
+# "more like this". Answers are row positions or small tables; the Streamlit app turns
+# them into cards and charts, the HTTP API (api.py) into JSON. One engine serves one
+# data version and builds each index the first time a query needs it.
+
+# Index builders by name (the shared-memory loader publishes the same set)
+INDEX_BUILDERS = {
+    'filter': FilterIndex,
+    'search': SearchIndex,
+    'trend': TrendIndex,
+    'arrival': ArrivalIndex,
+    'facts': lambda store: FactsCube(store, first_year=2010),
+    'similar': SimilarityIndex,
+}
+
+# Trend windows and how many films they show
+TREND_WINDOWS = ['today', 'week', 'month']
+TOP_FILMS = 10
+
+# Sort keys of the filter results (None keeps the search ranking)
+SORT_KEYS = ['vote_count', 'vote_average', 'release_date']
+
+
+def _today(today=None):
+    return pd.Timestamp('today' if today is None else today).normalize()
+
+
+# Date window of the past week (Monday to Sunday)
+def week_window(today=None):
+    today = _today(today)
+    start = today - pd.Timedelta(days=today.weekday() + 7)
+    return start, start + pd.Timedelta(days=6)
+
+
+# Date window of the current month
+def month_window(today=None):
+    start = _today(today).replace(day=1)
+    return start, start + pd.DateOffset(months=1) - pd.Timedelta(days=1)
+
+
+class QueryEngine:
+
+    # `build(name, store)` returns the index of that name; by default it is built here,
+    # the app passes one that loads the published index in shared mode
+    def __init__(self, store, build=None):
+        self.store = store
+        self.version = store.version
+        self.build = build or (lambda name, store: INDEX_BUILDERS[name](store))
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    # Index by name, built on first use
+    def index(self, name):
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                if name not in self._indexes:
+                    self._indexes[name] = self.build(name, self.store)
+                index = self._indexes[name]
+        return index
+
+    #------------Trend windows------------------------------------------------
+
+    # Films released today, most voted first; the latest film before today when there are none
+    def today_rows(self, today=None):
+        today = _today(today)
+        rows = self.index('trend').day(today)
+        return rows if len(rows) else self.index('trend').latest_before(today, k=1)
+
+    # Top k films of a trend window ('today', 'week' or 'month'), most voted first
+    def trending_rows(self, window, k=TOP_FILMS, today=None):
+        if window == 'today':
+            return self.today_rows(today)[:k]
+        if window == 'week':
+            return self.index('trend').top(*week_window(today), k=k)
+        if window == 'month':
+            return self.index('trend').top(*month_window(today), k=k)
+        raise ValueError(f"Unknown trend window {window!r}")
+
+    # Genre counts of a window's films: the top 10 of the week, every film of the month
+    def window_genre_counts(self, window, today=None):
+        if window == 'month':
+            rows = self.index('trend').range_rows(*month_window(today))
+        else:
+            rows = self.trending_rows(window, today=today)
+        return aggregates.genre_counts(self.store, rows)
+
+    #------------Stream & Chill filters---------------------------------------
+
+    # Rows matching the filters and, with a search query, the ranked search candidates.
+    # None means "no constraint" for every filter; an empty list matches nothing.
+    def filter_rows(self, providers=None, genres=None, years=None, ratings=None, search=None):
+        search_rows = self.index('search').search(search) if search else None
+        rows = self.index('filter').query(providers=providers, genres=genres, years=years, ratings=ratings,
+                                          rows=search_rows)
+        return rows, search_rows
+
+    # One page of filter results in a sort order (None: best search match first)
+    def page_rows(self, rows, sort='vote_count', page=1, page_size=20, search_rows=None):
+        if sort is None and search_rows is not None:
+            rows = search_rows[np.isin(search_rows, rows)]
+        elif sort is not None:
+            if sort not in SORT_KEYS:
+                raise ValueError(f"Unknown sort key {sort!r}")
+            rows = self.index('filter').sort(rows, sort)
+        return rows[(page - 1) * page_size:page * page_size]
+
+    # Genre choices and rating bounds of the filter widgets
+    def filter_options(self):
+        if self.store.size == 0:
+            return [], 0.0, 0.0
+        return list(self.store.genre_names), float(self.store.vote_average.min()), float(self.store.vote_average.max())
+
+    #------------Facts---------------------------------------------------------
+
+    # Films per provider among the providers' films, and how many of the providers'
+    # most voted films each provider streams
+    def provider_counts(self, providers):
+        rows = self.index('filter').query(providers=providers)
+        top_films = aggregates.top_film_per_provider(self.store, rows)
+        return aggregates.provider_counts(self.store, rows), aggregates.provider_counts(self.store, top_films['row'])
+
+    def films_per_year_by_provider(self, providers=None):
+        return self.index('facts').films_per_year_by_provider(providers)
+
+    def films_per_year_by_genre(self, genres=None, years=None):
+        return self.index('facts').films_per_year_by_genre(genres, years)
+
+    # Genre and year choices of the genre chart
+    def facts_options(self):
+        facts = self.index('facts')
+        return list(facts.genre_names), [int(year) for year in facts.years]
+
+    # Rows of the most voted film of each year, oldest year first
+    def most_popular_per_year(self):
+        return self.index('facts').most_popular_per_year()
+
+    #------------Arrivals and similar films-----------------------------------
+
+    def has_arrivals(self):
+        return len(self.index('arrival')) > 0
+
+    # Films that arrived on any of the providers in the last days, most voted first,
+    # as (row, provider, available_from)
+    def new_arrivals(self, providers, days=7, limit=TOP_FILMS, today=None):
+        today = _today(today)
+        return self.index('arrival').arrivals(providers, today - pd.Timedelta(days=days - 1), today, limit=limit)
+
+    def arrivals_timeline(self, providers, freq='W'):
+        return self.index('arrival').timeline(providers, freq=freq)
+
+    # Row of the film with this id and the rows of the k films most like it (None if unknown)
+    def similar_rows(self, film_id, k=TOP_FILMS):
+        rows = np.flatnonzero(self.store.id == film_id)
+        if len(rows) == 0:
+            return None
+        return rows[0], self.index('similar').similar(rows[0], k=k)
@@ -0,0 +1,134 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from movie_store import gather_csr
+
+#------------TITLE SEARCH INDEX---------------------------------------------------
+# Built once per data version over the case-folded words of every title:
+#   word -> titles (CSR postings), trigram -> words (CSR postings), title -> rows,
+# plus the sorted word list for prefix lookups. A query only touches the postings
+# of its own words and trigrams, never the whole column, and a few typos still match.
+
+# Minimum similarity (Dice coefficient over padded trigrams) for a word to count as a match
+MIN_WORD_SCORE = 0.5
+
+# Shortest query word also matched by trigrams; a shorter one only has padding trigrams,
+# so it matches the words it is a prefix of ("x" finds the film "X")
+MIN_TRIGRAM_WORD = 2
+
+
+# Padded trigrams of a word, in the style of pg_trgm ("  da", " dar", ...)
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Case-folded words of a text
+def split_words(text):
+    return re.findall(r'\w+', text.casefold())
+
+
+# Words of a search query. A query with no words (only punctuation) matches nothing
+# instead of everything.
+def query_words(query):
+    return split_words(query)
+
+
+# Group `items` by `keys` into CSR arrays (offsets per key + items in key order)
+def _postings(keys, items, n_keys):
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+    return offsets, items[order]
+
+
+class SearchIndex:
+
+    def __init__(self, store):
+        self.version = store.version
+        self.vote_count = store.vote_count
+        # Rows of every distinct title
+        title_codes, titles = pd.factorize(store.title)
+        self.titles = np.asarray(titles, dtype=object)
+        titles = pd.Series(self.titles, dtype=object)
+        title_codes = title_codes.astype(np.int64)
+        self.title_offsets, self.title_rows = _postings(title_codes, np.arange(store.size), len(titles))
+
+        # Word -> titles postings; words come sorted so prefixes are a binary search
+        words = titles.str.casefold().str.findall(r'\w+').explode().dropna()
+        pairs = pd.DataFrame({'word': words.to_numpy(), 'title': words.index.to_numpy()}).drop_duplicates()
+        word_ids, self.words = pd.factorize(pairs['word'], sort=True)
+        self.words = np.asarray(self.words, dtype=object)
+        self.word_offsets, self.word_titles = _postings(word_ids, pairs['title'].to_numpy(np.int64), len(self.words))
+
+        # Trigram -> words postings
+        grams = [trigrams(word) for word in self.words]
+        self.word_gram_counts = np.array([len(g) for g in grams], dtype=np.int32)
+        flat = pd.Series([gram for g in grams for gram in g], dtype=object)
+        gram_ids, gram_names = pd.factorize(flat)
+        self.gram_ids = {name: i for i, name in enumerate(gram_names)}
+        owners = np.repeat(np.arange(len(self.words)), self.word_gram_counts)
+        self.gram_offsets, self.gram_words = _postings(gram_ids, owners, len(gram_names))
+
+    # Index words similar to a query word, with a score in (0, 1]
+    def match_word(self, word):
+        scores = {}
+        # Words the query is a prefix of (the word being typed) count as exact matches
+        start = np.searchsorted(self.words, word, side='left')
+        stop = np.searchsorted(self.words, word + '\U0010ffff', side='left')
+        for word_id in range(start, stop):
+            scores[word_id] = 1.0
+
+        if len(word) < MIN_TRIGRAM_WORD:
+            return scores
+
+        # Words sharing enough trigrams with the query word
+        query_grams = trigrams(word)
+        hits = [self.gram_words[self.gram_offsets[i]:self.gram_offsets[i + 1]]
+                for i in (self.gram_ids.get(g) for g in query_grams) if i is not None]
+        if hits:
+            candidates, shared = np.unique(np.concatenate(hits), return_counts=True)
+            dice = 2 * shared / (len(query_grams) + self.word_gram_counts[candidates])
+            for word_id, score in zip(candidates, dice):
+                # Substring hits (like the old `str.contains`) rank just below prefixes
+                if word in self.words[word_id]:
+                    score = max(score, 0.9)
+                if score >= MIN_WORD_SCORE:
+                    scores[word_id] = max(scores.get(word_id, 0.0), float(score))
+        return scores
+
+    # Rows matching the query, best match first (ties broken by vote count)
+    def search(self, query, limit=None):
+        words = query_words(query)
+        if not words:
+            return np.arange(0)
+        # Best score each title gets for each query word, then averaged over the query words
+        per_word_titles, per_word_scores = [], []
+        for word in words:
+            matches = self.match_word(word)
+            word_ids = np.fromiter(matches.keys(), dtype=np.int64, count=len(matches))
+            titles, lengths = gather_csr(self.word_offsets, self.word_titles, word_ids)
+            scores = np.repeat(np.fromiter(matches.values(), dtype=float, count=len(matches)), lengths)
+            order = np.lexsort((-scores, titles))
+            titles, scores = titles[order], scores[order]
+            first = np.r_[True, titles[1:] != titles[:-1]] if len(titles) else np.zeros(0, dtype=bool)
+            per_word_titles.append(titles[first])
+            per_word_scores.append(scores[first])
+        # A title must match every query word (it is in every word's candidates), so titles
+        # that only share a few trigrams with part of the query never rank in
+        titles, inverse, counts = np.unique(np.concatenate(per_word_titles), return_inverse=True, return_counts=True)
+        scores = np.bincount(inverse, weights=np.concatenate(per_word_scores), minlength=len(titles)) / len(words)
+        keep = counts == len(words)
+        if not keep.any():
+            return np.arange(0)
+        # Titles holding the whole query as typed go first
+        if len(words) > 1:
+            phrase = pd.Series(self.titles[titles[keep]]).str.contains(query.strip(), case=False, regex=False)
+            scores[keep] += phrase.to_numpy(dtype=float)
+
+        rows, lengths = gather_csr(self.title_offsets, self.title_rows, titles[keep])
+        row_scores = np.repeat(scores[keep], lengths)
+        ranked = rows[np.lexsort((-self.vote_count[rows], -row_scores))]
+        return ranked if limit is None else ranked[:limit]
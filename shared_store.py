@@ -0,0 +1,169 @@
+import argparse
+import logging
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+
+from movie_store import STORE_COLUMNS, MovieStore
+from query_engine import INDEX_BUILDERS
+from sketches import CatalogSketch
+
+#------------SHARED DATASET ACROSS WORKER PROCESSES------------------------------
+# One loader process reads the data, builds the store and every index once, and
+# publishes them as files under a shared directory (RAM-backed /dev/shm by default).
+# Each Streamlit worker memory-maps the arrays, so the OS holds one copy in RAM for all
+# of them instead of one per process. Layout:
+#   <root>/<version>/store/           MovieStore.save columns
+#   <root>/<version>/indexes/<name>   the index pickled, with every numeric array kept
+#                                     aside as a .npy file that is memory-mapped on load
+#   <root>/<version>/sketch           the catalog sketch of the admin view, saved the same way
+#   <root>/CURRENT                    name of the published version
+# A version is written under a temporary name and renamed into place, then CURRENT is
+# replaced in one rename, so workers only ever see a complete version. Older versions
+# are removed; workers still attached to them keep their mappings until they move on.
+# Text columns (titles, overviews, poster URLs) are still read into each worker.
+
+logger = logging.getLogger(__name__)
+
+# Where the loader publishes and the workers attach
+SHARED_DIR = '/dev/shm/moviedash'
+
+# Indexes the loader builds and publishes with each version (every index the query engine uses)
+PUBLISHED_INDEXES = INDEX_BUILDERS
+
+# Published versions kept on disk (the current one and the one before)
+KEEP_VERSIONS = 2
+
+
+# Pickle an object, saving each numeric array inside it as its own .npy file
+def save_arrays_apart(obj, directory, name):
+    arrays = []
+
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, value):
+            if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+                file_name = f"{name}-{len(arrays)}.npy"
+                np.save(os.path.join(directory, file_name), value)
+                arrays.append(file_name)
+                return file_name
+            return None
+
+    with open(os.path.join(directory, f"{name}.pkl"), 'wb') as f:
+        Pickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+
+
+# Object saved by save_arrays_apart, its arrays memory-mapped read-only
+def load_arrays_apart(directory, name):
+
+    class Unpickler(pickle.Unpickler):
+        def persistent_load(self, file_name):
+            return np.load(os.path.join(directory, file_name), mmap_mode='r')
+
+    with open(os.path.join(directory, f"{name}.pkl"), 'rb') as f:
+        return Unpickler(f).load()
+
+
+# Version currently published under root, None before the first publish
+def current_version(root):
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# Write a store, its indexes and its catalog sketch (built from the store when none is
+# given, e.g. the one a delta sync keeps up to date) as a new version and flip CURRENT to it
+def publish(store, root, indexes=PUBLISHED_INDEXES, sketch=None):
+    target = os.path.join(root, store.version)
+    if not os.path.exists(target):
+        partial = f"{target}.partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(os.path.join(partial, 'indexes'))
+        os.makedirs(os.path.join(partial, 'sketch'))
+        store.save(os.path.join(partial, 'store'))
+        for name, build in indexes.items():
+            save_arrays_apart(build(store), os.path.join(partial, 'indexes'), name)
+        sketch = CatalogSketch().ingest(store.films()[STORE_COLUMNS]) if sketch is None else sketch
+        save_arrays_apart(sketch, os.path.join(partial, 'sketch'), 'sketch')
+        os.replace(partial, target)
+
+    with open(os.path.join(root, 'CURRENT.partial'), 'w') as f:
+        f.write(store.version)
+    os.replace(os.path.join(root, 'CURRENT.partial'), os.path.join(root, 'CURRENT'))
+    logger.info("Published version %s", store.version)
+
+    # Oldest versions go, keeping the current one and the ones just before it
+    versions = sorted((entry for entry in os.scandir(root) if entry.name != store.version
+                       and os.path.isdir(os.path.join(entry.path, 'store'))), key=lambda entry: entry.stat().st_mtime)
+    for entry in versions[:max(0, len(versions) - KEEP_VERSIONS + 1)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+# Store of a published version, its numeric columns memory-mapped
+def attach(root, version):
+    return MovieStore.load(os.path.join(root, version, 'store'))
+
+
+# Index published with a version, None when the loader did not publish it
+def load_index(root, version, name):
+    directory = os.path.join(root, version, 'indexes')
+    if not os.path.exists(os.path.join(directory, f"{name}.pkl")):
+        return None
+    return load_arrays_apart(directory, name)
+
+
+# Catalog sketch published with a version, None when the loader did not publish one
+def load_sketch(root, version):
+    directory = os.path.join(root, version, 'sketch')
+    if not os.path.exists(os.path.join(directory, 'sketch.pkl')):
+        return None
+    return load_arrays_apart(directory, 'sketch')
+
+
+# Loader process: publish the data once, then again whenever it changes.
+# From the database the rows are kept fresh by the same background sync as the app.
+def main():
+    parser = argparse.ArgumentParser(description="Publish the movies and their indexes for the app workers")
+    parser.add_argument('root', nargs='?', default=SHARED_DIR)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dsn', help="Postgres connection string of the movies database")
+    source.add_argument('--csv', help="movies.csv export to publish instead")
+    parser.add_argument('--interval', type=int, default=900, help="seconds between checks for changes")
+    parser.add_argument('--ttl', type=int, default=86400, help="seconds before the whole table is read again")
+    parser.add_argument('--once', action='store_true', help="publish the current data and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    os.makedirs(args.root, exist_ok=True)
+
+    if args.csv:
+        from snapshot import load_csv_store
+        # Parsed columns are kept next to the CSV, as the app does in snapshot mode
+        read_store = lambda: load_csv_store(args.csv, f"{os.path.splitext(args.csv)[0]}_snapshot")
+        read_sketch = lambda: None
+    else:
+        import psycopg2
+        from db import Database
+        from delta_sync import FULL_QUERY, DeltaSync
+        database = Database(lambda: psycopg2.connect(args.dsn))
+        sync = DeltaSync(database, MovieStore.from_frame(database.read_frame(FULL_QUERY)),
+                         interval=args.interval, ttl=args.ttl)
+        read_store = lambda: sync.store
+        read_sketch = lambda: sync.sketch
+        if not args.once:
+            sync.start()
+
+    while True:
+        store = read_store()
+        if store.version != current_version(args.root):
+            publish(store, args.root, sketch=read_sketch())
+        if args.once:
+            return
+        time.sleep(args.interval if args.csv else 5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from movie_store import gather_csr
+from search_index import _postings
+from sketches import top_k
+
+#------------"MORE LIKE THIS" SIMILARITY INDEX-----------------------------------
+# Built once per data version, entirely in NumPy (no model service):
+#   overview   TF-IDF over the words of every distinct overview, cut to its best words,
+#              L2-normalised and kept as float32 postings (word -> overviews), so a query
+#              only touches the postings of its own words; words are hashed into a fixed
+#              number of features, so no vocabulary is held
+#   genres     one bit per genre and provider in uint64 masks; the cosine of two 0/1
+#   providers  vectors is the popcount of the AND over sqrt(|a| * |b|)
+# A film's neighbours are the best weighted sum of the three cosines (argpartition).
+
+# Share of the score coming from the overview, the genres and the providers
+OVERVIEW_WEIGHT = 0.6
+GENRE_WEIGHT = 0.3
+PROVIDER_WEIGHT = 0.1
+
+# Words kept per overview (its highest weighted ones), both to index and to query
+MAX_TEXT_WORDS = 24
+
+# Words in more than this share of the overviews say nothing about a film and are dropped,
+# as are words of one or two letters
+MAX_DOC_SHARE = 0.05
+MIN_WORD_LENGTH = 3
+
+# Overviews tokenized per block, to bound the memory of the word lists
+CHUNK_TEXTS = 20_000
+
+
+# Distinct 0/1 rows of a CSR list column packed into uint64 masks, their number of codes
+# and the mask of every row. Few genre or provider combinations exist, so a query scores
+# the combinations and looks the rows up.
+def _bit_masks(offsets, codes, n_codes):
+    lengths = np.diff(offsets)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    masks = np.zeros((len(lengths), max(1, (n_codes + 63) // 64)), dtype=np.uint64)
+    np.bitwise_or.at(masks, (rows, codes // 64), np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64)))
+    masks, row_masks = np.unique(masks, axis=0, return_inverse=True)
+    return masks, np.bitwise_count(masks).sum(axis=1, dtype=np.int64), row_masks.reshape(-1).astype(np.int32)
+
+
+# Cosine between one mask and every mask
+def _mask_cosine(masks, lengths, mask):
+    shared = np.bitwise_count(masks & masks[mask]).sum(axis=1, dtype=np.int64)
+    norms = np.sqrt(lengths.astype(np.float64) * lengths[mask])
+    return np.divide(shared, norms, out=np.zeros(len(masks)), where=norms > 0).astype(np.float32)
+
+
+# Bytes that belong to a word: ASCII letters and digits, underscore and any UTF-8
+# multi-byte sequence (non-ASCII letters are kept as they are, not case folded)
+WORD_BYTES = np.zeros(256, dtype=bool)
+for first, last in [(b'0', b'9'), (b'A', b'Z'), (b'a', b'z'), (b'_', b'_'), (b'\x80', b'\xff')]:
+    WORD_BYTES[ord(first):ord(last) + 1] = True
+
+# Polynomial word hash mod 2**64; the base is odd, so its powers can be divided out
+HASH_BASE = 0x100000001B3
+HASH_BASE_INVERSE = pow(HASH_BASE, -1, 2 ** 64)
+
+# Words are hashed into this many features (the hashing trick); the top bits of
+# hash * golden ratio pick the feature
+FEATURE_BITS = 22
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+# base**1 .. base**n and the same powers of the inverse, wrapping mod 2**64
+def _hash_powers(n):
+    return (np.cumprod(np.full(n, HASH_BASE, dtype=np.uint64)),
+            np.cumprod(np.full(n, HASH_BASE_INVERSE, dtype=np.uint64)))
+
+
+# (text, feature, count) of every distinct word of every text, one block of texts at a
+# time. Words are found and hashed on the UTF-8 bytes of the whole block: prefix sums of
+# byte * base**position give any word's hash by one subtraction and one multiplication.
+def _word_counts(texts):
+    powers, inverse_powers = _hash_powers(0)
+    for start in range(0, len(texts), CHUNK_TEXTS):
+        encoded = [str(text).encode('utf-8') for text in texts[start:start + CHUNK_TEXTS]]
+        data = np.frombuffer(b'\n'.join(encoded), dtype=np.uint8)
+        data = data | (((data >= 65) & (data <= 90)) * np.uint8(32))
+        edges = np.diff(WORD_BYTES[data].astype(np.int8), prepend=0, append=0)
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        keep = ends - starts >= MIN_WORD_LENGTH
+        starts, ends = starts[keep], ends[keep]
+
+        if len(powers) < len(data):
+            powers, inverse_powers = _hash_powers(2 * len(data))
+        prefix = np.zeros(len(data) + 1, dtype=np.uint64)
+        np.cumsum(data * powers[:len(data)], out=prefix[1:])
+        hashes = (prefix[ends] - prefix[starts]) * inverse_powers[starts]
+        features = ((hashes * GOLDEN) >> np.uint64(64 - FEATURE_BITS)).astype(np.int64)
+
+        # Text of each word from the byte offsets where texts start
+        text_starts = np.cumsum([0] + [len(text) + 1 for text in encoded[:-1]])
+        text_ids = np.searchsorted(text_starts, starts, side='right') - 1
+        keys, counts = np.unique((text_ids << FEATURE_BITS) | features, return_counts=True)
+        yield (keys >> FEATURE_BITS) + start, keys & ((1 << FEATURE_BITS) - 1), counts
+
+
+class SimilarityIndex:
+
+    def __init__(self, store):
+        self.version = store.version
+        self.size = store.size
+        self.movie_id = store.movie_id
+        overview_codes, texts = pd.factorize(store.overview)
+        self.overview_codes = overview_codes.astype(np.int64)
+        texts = np.asarray(texts, dtype=object)
+
+        # Words shared by at least two overviews and by at most MAX_DOC_SHARE of them
+        blocks = list(_word_counts(texts))
+        doc_freq = np.zeros(1 << FEATURE_BITS, dtype=np.int64)
+        for _, features, _ in blocks:
+            doc_freq += np.bincount(features, minlength=len(doc_freq))
+        idf = np.log(max(len(texts), 1) / np.maximum(doc_freq, 1))
+        idf[(doc_freq < 2) | (doc_freq > MAX_DOC_SHARE * len(texts))] = 0
+
+        # TF-IDF of the MAX_TEXT_WORDS best words of each overview, L2-normalised
+        text_ids, features, weights = [], [], []
+        for block_texts, block_features, counts in blocks:
+            block_weights = (1 + np.log(counts)) * idf[block_features]
+            order = np.lexsort((-block_weights, block_texts))
+            block_texts, block_features, block_weights = block_texts[order], block_features[order], block_weights[order]
+            firsts = np.flatnonzero(np.r_[True, block_texts[1:] != block_texts[:-1]])
+            ranks = np.arange(len(order)) - np.repeat(firsts, np.diff(np.r_[firsts, len(order)]))
+            keep = (ranks < MAX_TEXT_WORDS) & (block_weights > 0)
+            text_ids.append(block_texts[keep])
+            features.append(block_features[keep])
+            weights.append(block_weights[keep])
+        text_ids = np.concatenate(text_ids + [np.zeros(0, dtype=np.int64)])
+        features = np.concatenate(features + [np.zeros(0, dtype=np.int64)])
+        weights = np.concatenate(weights + [np.zeros(0)])
+        norms = np.sqrt(np.bincount(text_ids, weights=weights ** 2, minlength=len(texts)))
+        weights = (weights / np.where(norms > 0, norms, 1)[text_ids]).astype(np.float32)
+
+        # text -> features (the query side, already grouped by text) and feature -> texts
+        self.text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(text_ids, minlength=len(texts)), out=self.text_offsets[1:])
+        self.text_features, self.text_weights = features.astype(np.int32), weights
+        self.feature_offsets, order = _postings(features, np.arange(len(features)), len(doc_freq))
+        self.feature_texts, self.feature_weights = text_ids[order].astype(np.int32), weights[order]
+
+        self.genre_masks, self.genre_lengths, self.row_genres = _bit_masks(
+            store.genre_offsets, store.genre_codes, len(store.genre_names))
+        self.provider_masks, self.provider_lengths, self.row_providers = _bit_masks(
+            store.provider_offsets, store.provider_codes, len(store.provider_names))
+
+    # Cosine of the overview of a row with every distinct overview
+    def overview_scores(self, row):
+        text = self.overview_codes[row]
+        start, end = self.text_offsets[text], self.text_offsets[text + 1]
+        features, query_weights = self.text_features[start:end], self.text_weights[start:end]
+        texts, lengths = gather_csr(self.feature_offsets, self.feature_texts, features)
+        weights, _ = gather_csr(self.feature_offsets, self.feature_weights, features)
+        return np.bincount(texts, weights=weights * np.repeat(query_weights, lengths),
+                           minlength=len(self.text_offsets) - 1).astype(np.float32)
+
+    # Rows of the k films most like a row, best first (the film itself left out)
+    def similar(self, row, k=10):
+        overview = OVERVIEW_WEIGHT * self.overview_scores(row)
+        genres = GENRE_WEIGHT * _mask_cosine(self.genre_masks, self.genre_lengths, self.row_genres[row])
+        providers = PROVIDER_WEIGHT * _mask_cosine(self.provider_masks, self.provider_lengths, self.row_providers[row])
+        scores = overview[self.overview_codes] + genres[self.row_genres] + providers[self.row_providers]
+        scores[self.movie_id == self.movie_id[row]] = -1
+        best = top_k(scores, k)
+        return best[scores[best] > 0]
@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+
+from canonical import GENRE_ALIASES, PROVIDER_ALIASES, canonical_lists
+from movie_store import encode_lists
+
+#------------TOP-K SELECTION AND STREAMING SKETCHES------------------------------
+# Popularity questions ("the 10 most voted films", "the most voted film per year or
+# provider") only need the best few rows, so they are answered with argpartition or a
+# per-group maximum in O(n) instead of sorting everything. Ties always go to the
+# earliest row, like sort_values(kind='stable') and idxmax, so results do not change.
+#
+# CatalogSketch keeps running answers that are updated as rows are ingested (each delta
+# sync) instead of being recomputed over the catalog, in memory that does not grow with it:
+#   CountMinSketch  films per label (genre, provider, year:provider, ...), never under
+#                   the true count and over by at most e/width * total with
+#                   probability 1 - exp(-depth); removals are subtracted
+#   HyperLogLog     distinct films seen per label, ~1.04/sqrt(2^p) relative error; a
+#                   film sent again by an overlapping delta is not counted twice
+#   TopK            the most voted films (a bounded candidate buffer), exact as long
+#                   as vote counts only grow
+# Every sketch takes `exact=True`, which keeps the exact counts, sets and rankings
+# instead (memory grows with the catalog) to verify the estimates against.
+
+
+# Alias dictionary of each list column the labels are built from
+LIST_ALIASES = {'genres': GENRE_ALIASES, 'providers': PROVIDER_ALIASES}
+
+
+# Positions of the k largest values, largest first; ties keep the earlier position
+def top_k(values, k=None):
+    values = np.asarray(values)
+    if k is None or k >= len(values):
+        return np.argsort(-values.astype(np.float64), kind='stable')
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    threshold = np.partition(values, len(values) - k)[len(values) - k]
+    above = np.flatnonzero(values > threshold)
+    ties = np.flatnonzero(values == threshold)[:k - len(above)]
+    candidates = np.sort(np.concatenate([above, ties]))
+    return candidates[np.argsort(-values[candidates].astype(np.float64), kind='stable')]
+
+
+# The item with the largest value in every group (groups numbered 0..n_groups-1), as
+# (groups, items) of the groups that have any; ties keep the smallest item
+def group_argmax(groups, values, items, n_groups):
+    values = np.asarray(values, dtype=np.float64)
+    best = np.full(n_groups, -np.inf)
+    np.maximum.at(best, groups, values)
+    winners = values == best[groups]
+    first = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first, groups[winners], np.asarray(items, dtype=np.int64)[winners])
+    present = np.flatnonzero(np.isfinite(best))
+    return present, first[present]
+
+
+# 64-bit hashes of labels or ids, stable across processes (no Python hash seed)
+def hash_keys(values):
+    return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False).astype(np.uint64)
+
+
+# Mix a 64-bit hash with a seed (splitmix64 finalizer)
+def _mix(hashes, seed):
+    with np.errstate(over='ignore'):
+        z = hashes + np.uint64((0x9E3779B97F4A7C15 * (seed + 1)) & 0xFFFFFFFFFFFFFFFF)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+class CountMinSketch:
+
+    def __init__(self, width=2048, depth=4, exact=False):
+        self.width, self.depth, self.exact = width, depth, exact
+        self.table = None if exact else np.zeros((depth, width), dtype=np.int64)
+        self.counts = {} if exact else None
+
+    # Add (or with negative counts remove) occurrences of labels
+    def add(self, labels, counts=1):
+        labels = np.asarray(labels, dtype=object)
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), labels.shape)
+        if self.exact:
+            for label, count in pd.Series(counts).groupby(labels).sum().items():
+                self.counts[label] = self.counts.get(label, 0) + int(count)
+            return
+        hashes = hash_keys(labels)
+        for row in range(self.depth):
+            np.add.at(self.table[row], _mix(hashes, row) % np.uint64(self.width), counts)
+
+    # Estimated count of each label (never below the true count while counts stay >= 0)
+    def estimate(self, labels):
+        labels = np.asarray(labels, dtype=object)
+        if self.exact:
+            return np.array([self.counts.get(label, 0) for label in labels], dtype=np.int64)
+        hashes = hash_keys(labels)
+        return np.min([self.table[row][_mix(hashes, row) % np.uint64(self.width)]
+                       for row in range(self.depth)], axis=0)
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=12, exact=False):
+        self.precision, self.exact = precision, exact
+        self.registers = None if exact else np.zeros(2 ** precision, dtype=np.uint8)
+        self.members = set() if exact else None
+
+    # Add items given as 64-bit hashes (see hash_keys)
+    def add(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if self.exact:
+            self.members.update(hashes.tolist())
+            return
+        hashes = _mix(hashes, 99)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes << np.uint64(self.precision)
+        # Rank = position of the first 1 bit in the remaining bits (64 - p + 1 if none)
+        bits = 64 - self.precision
+        ranks = np.full(len(hashes), bits + 1, dtype=np.uint8)
+        nonzero = rest != 0
+        ranks[nonzero] = 64 - np.floor(np.log2(rest[nonzero].astype(np.float64))).clip(0, 63).astype(np.uint8)
+        np.maximum.at(self.registers, index, np.minimum(ranks, bits + 1))
+
+    def count(self):
+        if self.exact:
+            return len(self.members)
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        # Small range correction (linear counting)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class TopK:
+
+    # The k highest scored keys (integer ids), kept in a buffer of 2k candidates so a few
+    # removals can be absorbed; exact while scores only grow (vote counts do)
+    def __init__(self, k=10, exact=False):
+        self.k, self.exact = k, exact
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.scores = np.zeros(0, dtype=np.int64)
+
+    # Add keys or give known keys a new score
+    def add(self, keys, scores):
+        keys, scores = np.asarray(keys, dtype=np.int64), np.asarray(scores, dtype=np.int64)
+        keep = ~np.isin(self.keys, keys)
+        keys, scores = np.concatenate([self.keys[keep], keys]), np.concatenate([self.scores[keep], scores])
+        # Later entries of the same key win
+        _, last = np.unique(keys[::-1], return_index=True)
+        keys, scores = keys[::-1][last], scores[::-1][last]
+        if not self.exact:
+            best = top_k(scores, 2 * self.k)
+            keys, scores = keys[best], scores[best]
+        self.keys, self.scores = keys, scores
+
+    def remove(self, keys):
+        keep = ~np.isin(self.keys, np.asarray(keys, dtype=np.int64))
+        self.keys, self.scores = self.keys[keep], self.scores[keep]
+
+    # (key, score) of the best k, highest score first, ties by smallest key
+    def top(self):
+        order = np.argsort(self.keys, kind='stable')
+        best = order[top_k(self.scores[order], self.k)]
+        return list(zip(self.keys[best].tolist(), self.scores[best].tolist()))
+
+
+class CatalogSketch:
+
+    # Label counts, distinct films and the most voted films of everything ingested
+    def __init__(self, k=10, width=2048, depth=4, precision=12, exact=False):
+        self.exact, self.precision = exact, precision
+        self.counts = CountMinSketch(width, depth, exact)
+        self.distinct = {}
+        self.top_voted = TopK(k, exact)
+        self.total = 0
+
+    # (film positions, label names, label of each position) of a frame of the movies table,
+    # one entry per film and canonical label: genre:<g>, provider:<p> and year:<y>:provider:<p>
+    @staticmethod
+    def labels(frame):
+        frame = frame.reset_index(drop=True)
+        year = pd.to_datetime(frame['release_date'], errors='coerce').dt.year.fillna(0).to_numpy(np.int64)
+        positions, names, label_index = [], [], []
+        for column, prefix in [('genres', 'genre'), ('providers', 'provider')]:
+            # Under canonical names like the store, whether the frame is raw (a delta from
+            # the database) or already canonical (the store's own rows)
+            offsets, codes, column_names, _ = canonical_lists(*encode_lists(frame[column]), LIST_ALIASES[column])
+            rows = np.repeat(np.arange(len(frame)), np.diff(offsets))
+            positions.append(rows)
+            label_index.append(codes + sum(len(n) for n in names))
+            names.append(np.asarray([f"{prefix}:{name}" for name in column_names], dtype=object))
+            if column == 'providers':
+                dated = year[rows] > 0
+                pairs, inverse = np.unique(year[rows][dated] * len(column_names) + codes[dated], return_inverse=True)
+                positions.append(rows[dated])
+                label_index.append(inverse.ravel() + sum(len(n) for n in names))
+                names.append(np.asarray([f"year:{pair // len(column_names)}:provider:{column_names[pair % len(column_names)]}"
+                                         for pair in pairs.tolist()], dtype=object))
+        return np.concatenate(positions), np.concatenate(names), np.concatenate(label_index)
+
+    # Ingest new or changed films; `replaced` holds the previous rows of changed films
+    def ingest(self, frame, replaced=None):
+        if replaced is not None and len(replaced):
+            _, names, label_index = self.labels(replaced)
+            self.counts.add(names, -np.bincount(label_index, minlength=len(names)))
+            self.total -= len(replaced)
+        positions, names, label_index = self.labels(frame)
+        self.counts.add(names, np.bincount(label_index, minlength=len(names)))
+        self.total += len(frame)
+
+        # Distinct films per label: the film id hashes grouped by label
+        id_hashes = hash_keys(frame['id'].to_numpy())[positions]
+        order = np.argsort(label_index, kind='stable')
+        bounds = np.searchsorted(label_index[order], np.arange(len(names) + 1))
+        for label, start, end in zip(names, bounds[:-1], bounds[1:]):
+            if label not in self.distinct:
+                self.distinct[label] = HyperLogLog(self.precision, self.exact)
+            self.distinct[label].add(id_hashes[order[start:end]])
+
+        votes = pd.to_numeric(frame['vote_count'], errors='coerce').fillna(0).to_numpy(np.int64)
+        self.top_voted.add(pd.to_numeric(frame['id']).to_numpy(np.int64), votes)
+        return self
+
+    # Estimated films per label
+    def count(self, labels):
+        return self.counts.estimate(labels)
+
+    # Estimated distinct films ever seen with a label
+    def distinct_films(self, label):
+        return self.distinct[label].count() if label in self.distinct else 0
+
+    # (id, vote_count) of the most voted films
+    def top_films(self):
+        return self.top_voted.top()
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from canonical import ALIASES_FINGERPRINT
+from movie_store import STORE_FORMAT, MovieStore
+
+#------------OFFLINE SNAPSHOT FROM movies.csv------------------------------------
+# Runs the app from the `movies.csv` Postgres export instead of the database (dev, CI,
+# or when the database is down). Array columns such as `{Netflix,"Netflix basic with Ads"}`
+# are parsed for all rows at once on the raw bytes, with no per-row eval or regex. The
+# parsed store is saved as .npy columns next to the CSV, so later cold starts memory-map
+# the arrays instead of parsing the CSV again.
+
+# Columns exported as Postgres array literals
+ARRAY_COLUMNS = ['genres', 'providers', 'provider_release_dates']
+
+# Array literal syntax, as byte values
+QUOTE, BACKSLASH, OPEN, COMMA, CLOSE = b'"\\{,}'
+
+# Byte that stands for "end of element" while the tokens are split out
+TOKEN_END = 0x1f
+
+
+# Parse a column of one-dimensional Postgres array literals in bulk.
+# Returns CSR style (offsets, items) with None for NULL elements and an empty list for
+# missing cells. Quotes and backslash escapes are resolved with cumulative sums over the
+# bytes of all literals joined together, then every element is cut out with one split.
+def parse_pg_arrays(values):
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    present = values.notna().to_numpy()
+    literals = values[present].astype(str)
+    encoded = literals.str.encode('utf-8')
+    buf = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    ends = np.cumsum(encoded.str.len().to_numpy(np.int64))
+
+    # A backslash escapes the next byte unless it is escaped itself
+    backslash = buf == BACKSLASH
+    escaped = np.zeros(len(buf), dtype=bool)
+    if backslash.any():
+        positions = np.arange(len(buf))
+        run = positions - np.maximum.accumulate(np.where(backslash, -1, positions))
+        escaped[1:] = backslash[:-1] & (run[:-1] % 2 == 1)
+    quote = (buf == QUOTE) & ~escaped
+    inside = (np.cumsum(quote) - quote) % 2 == 1
+    structural = ~inside & ~quote & ~escaped
+    opening = structural & (buf == OPEN)
+    terminator = structural & ((buf == COMMA) | (buf == CLOSE))
+
+    # Every element starts right after `{` or `,` and ends at `,` or `}`
+    starts = np.flatnonzero(opening | (terminator & (buf == COMMA))) + 1
+    quoted = quote[np.minimum(starts, len(buf) - 1)]
+    positions = np.flatnonzero(terminator)
+    empty = (buf[positions] == CLOSE) & opening[positions - 1]
+
+    # Drop the syntax bytes and split all elements out of a single decoded string
+    out = buf.copy()
+    out[terminator] = TOKEN_END
+    keep = ~(opening | quote | (backslash & ~escaped))
+    tokens = out[keep].tobytes().decode('utf-8').split(chr(TOKEN_END))[:-1]
+    items = np.asarray(tokens, dtype=object)
+    items[~quoted & (items == 'NULL')] = None
+    items = items[~empty]
+
+    lengths = np.zeros(len(values), dtype=np.int64)
+    row = np.searchsorted(ends, positions[~empty], side='right')
+    lengths[present] = np.bincount(row, minlength=len(literals))
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, items
+
+
+# One Python list per row out of CSR arrays
+def csr_lists(offsets, items):
+    flat = list(items)
+    return [flat[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+# The CSV as the DataFrame `SELECT * FROM movies` returns (lists for arrays, dates as
+# datetime.date), so it goes through the same MovieStore.from_frame as the database
+def read_movies_csv(path):
+    df = pd.read_csv(path, dtype={column: object for column in ARRAY_COLUMNS})
+    for column in ARRAY_COLUMNS:
+        offsets, items = parse_pg_arrays(df[column])
+        if column == 'provider_release_dates':
+            dates = pd.to_datetime(pd.Series(items, dtype=object), errors='coerce')
+            items = np.where(dates.isna(), None, dates.dt.date.astype(object))
+        df[column] = csr_lists(offsets, items)
+    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce').dt.date
+    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    return df
+
+
+# Size and modification time of the CSV, the alias dictionaries it was built with and
+# the layout it was saved in, to tell whether the saved store is still current
+def _csv_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{ALIASES_FINGERPRINT:012x}-{STORE_FORMAT}"
+
+
+# Store of the CSV, parsed only when the CSV changed since the last save
+def load_csv_store(csv_path, snapshot_dir):
+    stamp = _csv_stamp(csv_path)
+    meta_path = os.path.join(snapshot_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get('source') == stamp:
+                return MovieStore.load(snapshot_dir)
+
+    store = MovieStore.from_frame(read_movies_csv(csv_path))
+    # Written next to the target and renamed, so a crash never leaves half a snapshot
+    partial = f"{snapshot_dir}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    store.save(partial, source=stamp)
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.replace(partial, snapshot_dir)
+    return store
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from sketches import top_k
+
+#------------DATE-PARTITIONED TREND INDEX----------------------------------------
+# Movies are bucketed by release day once per data version. Rows inside a bucket are
+# ordered by vote_count (highest first), so the first k rows of a bucket are its top-k
+# and any window (today, a week, a month, any past range) is answered by merging the
+# buckets it covers instead of scanning and sorting the whole catalog.
+
+# How many films a trend window shows by default
+TOP_K = 10
+
+
+# A date as a day number (days since 1970-01-01)
+def to_day(date):
+    return int(np.datetime64(pd.Timestamp(date).normalize(), 'D').astype(np.int64))
+
+
+class TrendIndex:
+
+    def __init__(self, store):
+        self.version = store.version
+        self.vote_count = store.vote_count
+        days = store.release_date.astype('datetime64[D]').astype(np.int64)
+        dated = np.flatnonzero(~np.isnat(store.release_date))
+
+        # Rows sorted by release day, then by vote_count descending
+        order = np.lexsort((-store.vote_count[dated].astype(np.int64), days[dated]))
+        self.rows = dated[order]
+        self.days, self.starts = np.unique(days[self.rows], return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.rows))
+
+    # Buckets whose day lies in [start, end]
+    def _buckets(self, start, end):
+        first = np.searchsorted(self.days, to_day(start), side='left')
+        last = np.searchsorted(self.days, to_day(end), side='right')
+        return first, last
+
+    # Films released on one day, most voted first
+    def day(self, date):
+        first, last = self._buckets(date, date)
+        if first == last:
+            return self.rows[:0]
+        return self.rows[self.starts[first]:self.ends[first]]
+
+    # Top-k films of the latest release day before a date (the "today" fallback)
+    def latest_before(self, date, k=1):
+        bucket = np.searchsorted(self.days, to_day(date), side='left') - 1
+        if bucket < 0:
+            return self.rows[:0]
+        return self.rows[self.starts[bucket]:min(self.starts[bucket] + k, self.ends[bucket])]
+
+    # Every film released in [start, end], most voted first
+    def range_rows(self, start, end):
+        first, last = self._buckets(start, end)
+        if first == last:
+            return self.rows[:0]
+        rows = self.rows[self.starts[first]:self.ends[last - 1]]
+        return rows[np.argsort(-self.vote_count[rows].astype(np.int64), kind='stable')]
+
+    # Top-k films released in [start, end], merged from the top-k of each day bucket
+    def top(self, start, end, k=TOP_K):
+        first, last = self._buckets(start, end)
+        if first == last:
+            return self.rows[:0]
+        starts = self.starts[first:last]
+        lengths = np.minimum(self.ends[first:last] - starts, k)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        candidates = self.rows[positions]
+        return candidates[top_k(self.vote_count[candidates], k)]
+
+    # What was trending on a past date: the top films released in the week up to it
+    def trending_on(self, date, days=7, k=TOP_K):
+        date = pd.Timestamp(date).normalize()
+        return self.top(date - pd.Timedelta(days=days - 1), date, k)